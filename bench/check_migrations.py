@@ -0,0 +1,101 @@
+"""Проверка миграций на базе в формате до версионирования схемы.
+
+Запуск из корня репозитория:
+
+    python -m bench.check_migrations
+
+Собирает базу так, как её оставлял старый код: таблицы без индексов,
+user_version = 0, дубликаты пользователей, баланс которых обновлялся
+UPDATE ... WHERE telegram_id = ? — то есть одинаково во всех дубликатах.
+Затем открывает её через Database и сверяет результат миграций.
+
+Второй случай — две реплики, одновременно открывающие новый файл: каждая
+миграция должна примениться один раз, и обе должны подключиться без ошибок.
+"""
+import asyncio
+import os
+import sqlite3
+import sys
+import tempfile
+
+from utils.database import Database
+from utils.migrations import MIGRATIONS, SCHEMA_VERSION
+
+
+def build_fixture(path: str):
+    connection = sqlite3.connect(path)
+    for statement in MIGRATIONS[0][2]:
+        connection.execute(statement)
+
+    # Пользователь 100 создан дважды, потом ему начислили 10
+    connection.executemany(
+        "INSERT INTO users (telegram_id, balance, referral_telegram_id) VALUES (?, 0, NULL)",
+        [("100",), ("200",), ("100",)]
+    )
+    connection.execute("UPDATE users SET balance = balance + 10 WHERE telegram_id = '100'")
+    connection.execute("UPDATE users SET balance = balance + 5 WHERE telegram_id = '200'")
+    # Заказ висит на втором дубликате и должен переехать на первую запись
+    connection.execute("INSERT INTO orders (user_id, amount_star, amount_ruble, status) VALUES (3, 50, 88, 'pending')")
+    connection.executemany(
+        "INSERT INTO promocodes (code, discount, amount_money, max_uses) VALUES (?, 10, 0, 5)",
+        [("SALE",), ("SALE",)]
+    )
+    connection.commit()
+    connection.close()
+
+
+async def check(path: str) -> list:
+    db = Database(path)
+    await db.connect()
+    try:
+        problems = []
+        async with db.acquire() as connection:
+            async with connection.execute("PRAGMA user_version") as cursor:
+                version = (await cursor.fetchone())[0]
+            async with connection.execute("SELECT id, telegram_id, balance FROM users ORDER BY id") as cursor:
+                users = await cursor.fetchall()
+            async with connection.execute("SELECT user_id, status FROM orders") as cursor:
+                orders = await cursor.fetchall()
+            async with connection.execute("SELECT COUNT(*) FROM promocodes") as cursor:
+                promocodes = (await cursor.fetchone())[0]
+
+        if version != SCHEMA_VERSION:
+            problems.append(f"user_version={version}, ожидалась {SCHEMA_VERSION}")
+        if users != [(1, "100", 10), (2, "200", 5)]:
+            problems.append(f"users={users}, ожидалось [(1, '100', 10), (2, '200', 5)]")
+        if orders != [(1, "awaiting_payment")]:
+            problems.append(f"orders={orders}, ожидалось [(1, 'awaiting_payment')]")
+        if promocodes != 1:
+            problems.append(f"promocodes={promocodes}, ожидался 1")
+        return problems
+    finally:
+        await db.close()
+
+
+async def check_concurrent(path: str, instances: int = 2) -> list:
+    databases = [Database(path) for _ in range(instances)]
+    results = await asyncio.gather(*(db.connect() for db in databases), return_exceptions=True)
+    for db in databases:
+        await db.close()
+    return [
+        f"реплика {i}: {result!r}"
+        for i, result in enumerate(results) if isinstance(result, Exception)
+    ]
+
+
+async def main() -> int:
+    with tempfile.TemporaryDirectory() as directory:
+        path = os.path.join(directory, "baseline.db")
+        build_fixture(path)
+        problems = await check(path)
+        problems += await check_concurrent(os.path.join(directory, "fresh.db"))
+
+    for problem in problems:
+        print(f"FAIL {problem}")
+    if not problems:
+        print("OK")
+    return 1 if problems else 0
+
+
+if __name__ == "__main__":
+    sys.exit(asyncio.run(main()))
@@ -0,0 +1,89 @@
+"""Микробенчмарк задержки запросов Database на временной базе.
+
+Запуск из корня репозитория:
+
+    python -m bench.db_latency --calls 3000 --users 1000
+
+Меряет время одного вызова get_user и create_order при последовательных
+вызовах в двух режимах: как сейчас и с проверкой соединения через SELECT 1
+перед каждым запросом, как делал старый ensure_connection(). Кэш
+пользователей выключен, чтобы get_user каждый раз ходил в SQLite.
+"""
+import argparse
+import asyncio
+import os
+import statistics
+import tempfile
+import time
+from typing import Any, Awaitable, Callable, Dict, List
+
+import aiosqlite
+
+from utils.database import Database
+
+
+class PingingDatabase(Database):
+    """Database, которая перед каждым запросом проверяет соединение SELECT 1."""
+
+    async def _execute(self, operation: Callable[[aiosqlite.Connection], Awaitable[Any]], write: bool = False) -> Any:
+        async def with_ping(connection: aiosqlite.Connection):
+            async with connection.execute("SELECT 1") as cursor:
+                await cursor.fetchone()
+            return await operation(connection)
+
+        return await super()._execute(with_ping, write)
+
+
+def percentile(values: List[float], q: float) -> float:
+    values = sorted(values)
+    return values[min(len(values) - 1, int(round(q / 100 * (len(values) - 1))))]
+
+
+async def measure(db_class: type, path: str, calls: int, users: int) -> Dict[str, List[float]]:
+    db = db_class(path, user_cache_size=0)
+    await db.connect()
+    try:
+        async with db.writer() as connection:
+            await connection.executemany(
+                "INSERT OR IGNORE INTO users (telegram_id) VALUES (?)",
+                [(str(1000 + i),) for i in range(users)]
+            )
+            await connection.commit()
+
+        timings: Dict[str, List[float]] = {"get_user": [], "create_order": []}
+        for i in range(calls):
+            started = time.perf_counter()
+            await db.get_user(str(1000 + i % users))
+            timings["get_user"].append(time.perf_counter() - started)
+
+        for i in range(calls):
+            started = time.perf_counter()
+            await db.create_order(1 + i % users, 50, 88, "awaiting_payment")
+            timings["create_order"].append(time.perf_counter() - started)
+        return timings
+    finally:
+        await db.close()
+
+
+async def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--calls", type=int, default=3000)
+    parser.add_argument("--users", type=int, default=1000)
+    parser.add_argument("--runs", type=int, default=2)
+    args = parser.parse_args()
+
+    print(f"{'mode':<10}{'run':>4}{'method':>14}{'mean us':>10}{'p50 us':>10}{'p99 us':>10}")
+    with tempfile.TemporaryDirectory() as directory:
+        for run in range(1, args.runs + 1):
+            for mode, db_class in (("ping", PingingDatabase), ("current", Database)):
+                path = os.path.join(directory, f"{mode}-{run}.db")
+                timings = await measure(db_class, path, args.calls, args.users)
+                for method, values in timings.items():
+                    print(
+                        f"{mode:<10}{run:>4}{method:>14}{statistics.mean(values) * 1e6:>10.0f}"
+                        f"{statistics.median(values) * 1e6:>10.0f}{percentile(values, 99) * 1e6:>10.0f}"
+                    )
+
+
+if __name__ == "__main__":
+    asyncio.run(main())
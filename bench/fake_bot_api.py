@@ -0,0 +1,134 @@
+import asyncio
+import itertools
+import json
+import time
+from collections import Counter, defaultdict, deque
+from typing import Any, Deque, Dict, Optional
+
+from aiohttp import web
+
+BOT_USER = {"id": 1, "is_bot": True, "first_name": "Fake", "username": "fake_bot"}
+
+# Методы, которые возвращают True вместо сообщения
+BOOLEAN_METHODS = {
+    "answercallbackquery", "deletemessage", "deletewebhook", "setwebhook",
+    "setmycommands", "sendchataction",
+}
+
+
+class FakeBotAPI:
+    """Локальная заглушка Bot API для бенчмарков.
+
+    Отвечает правдоподобными объектами на методы, которые использует бот, считает
+    запросы по методам и, если включено, отдаёт 429 с retry_after при превышении
+    лимитов: global_limit запросов в любом окне в 1 секунду на весь бот и
+    chat_limit запросов в окне в 1 секунду на один чат.
+    """
+
+    def __init__(
+        self,
+        latency: float = 0.0,
+        global_limit: Optional[int] = None,
+        chat_limit: Optional[int] = None,
+        retry_after: int = 1,
+    ):
+        self.latency = latency
+        self.global_limit = global_limit
+        self.chat_limit = chat_limit
+        self.retry_after = retry_after
+        self.calls: Counter = Counter()
+        self.rejected = 0
+        self.sent_by_chat: Dict[Any, int] = defaultdict(int)
+        self._global_window: Deque[float] = deque()
+        self._chat_windows: Dict[Any, Deque[float]] = defaultdict(deque)
+        self._message_ids = itertools.count(1)
+        self._runner: Optional[web.AppRunner] = None
+        self.url = ""
+
+    def reset(self):
+        self.calls.clear()
+        self.rejected = 0
+        self.sent_by_chat.clear()
+        self._global_window.clear()
+        self._chat_windows.clear()
+
+    @staticmethod
+    def _over_limit(window: Deque[float], limit: Optional[int], now: float) -> bool:
+        while window and window[0] <= now - 1.0:
+            window.popleft()
+        return limit is not None and len(window) >= limit
+
+    def _message(self, params: Dict[str, Any], method: str) -> Dict[str, Any]:
+        chat_id = params.get("chat_id", 0)
+        try:
+            chat_id = int(chat_id)
+        except (TypeError, ValueError):
+            pass
+        message = {
+            "message_id": int(params.get("message_id") or next(self._message_ids)),
+            "date": int(time.time()),
+            "chat": {"id": chat_id, "type": "private" if isinstance(chat_id, int) and chat_id > 0 else "supergroup"},
+            "from": BOT_USER,
+        }
+        if method in ("sendphoto", "editmessagemedia"):
+            message["photo"] = [{"file_id": "fake-photo", "file_unique_id": "fake-photo", "width": 1, "height": 1}]
+            message["caption"] = params.get("caption", "")
+        else:
+            message["text"] = params.get("text", "")
+        if params.get("reply_markup"):
+            try:
+                markup = json.loads(params["reply_markup"])
+                if "inline_keyboard" in markup:
+                    message["reply_markup"] = markup
+            except ValueError:
+                pass
+        return message
+
+    async def handle(self, request: web.Request) -> web.Response:
+        method = request.match_info["method"].lower()
+        params = dict(await request.post())
+        self.calls[method] += 1
+
+        if self.latency:
+            await asyncio.sleep(self.latency)
+
+        chat_id = params.get("chat_id")
+        if chat_id is not None:
+            now = time.monotonic()
+            chat_window = self._chat_windows[chat_id]
+            if self._over_limit(self._global_window, self.global_limit, now) or \
+                    self._over_limit(chat_window, self.chat_limit, now):
+                self.rejected += 1
+                return web.json_response({
+                    "ok": False,
+                    "error_code": 429,
+                    "description": f"Too Many Requests: retry after {self.retry_after}",
+                    "parameters": {"retry_after": self.retry_after},
+                })
+            self._global_window.append(now)
+            chat_window.append(now)
+            self.sent_by_chat[chat_id] += 1
+
+        if method == "getme":
+            result: Any = BOT_USER
+        elif method in BOOLEAN_METHODS:
+            result = True
+        else:
+            result = self._message(params, method)
+        return web.json_response({"ok": True, "result": result})
+
+    async def start(self, host: str = "127.0.0.1", port: int = 0) -> str:
+        app = web.Application()
+        app.router.add_post("/bot{token}/{method}", self.handle)
+        self._runner = web.AppRunner(app)
+        await self._runner.setup()
+        site = web.TCPSite(self._runner, host, port)
+        await site.start()
+        port = site._server.sockets[0].getsockname()[1]
+        self.url = f"http://{host}:{port}"
+        return self.url
+
+    async def stop(self):
+        if self._runner is not None:
+            await self._runner.cleanup()
+            self._runner = None
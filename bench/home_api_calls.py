@@ -0,0 +1,122 @@
+"""Проверка числа запросов к Bot API на каждом входе в главное меню.
+
+Запуск из корня репозитория:
+
+    python -m bench.home_api_calls
+
+Апдейты идут через роутеры и мидлвари из main.py, запросы уходят в
+bench/fake_bot_api.py, который считает их по методам. Для обычного
+пользователя и админа проверяются /start, кнопка «🏠 На главную» и колбэк
+go_to_home из сообщения с фото и из текстового сообщения.
+"""
+import asyncio
+import itertools
+import os
+import sys
+import tempfile
+import time
+from typing import Dict
+
+from aiogram import Bot, Dispatcher
+from aiogram.client.session.aiohttp import AiohttpSession
+from aiogram.client.telegram import TelegramAPIServer
+from aiogram.types import Update
+
+from bench.fake_bot_api import BOT_USER, FakeBotAPI
+from main import setup_dispatcher
+from utils.constants import ADMIN_IDS
+from utils.database import Database
+from utils.media_cache import MediaCache
+
+USER_ID = 10_000_000
+ADMIN_ID = min(ADMIN_IDS)
+
+# Ожидаемые запросы на каждый вход, одинаковые для пользователя и админа
+EXPECTED = {
+    "start": {"sendmessage": 1, "sendphoto": 1},
+    "reply_button": {"sendphoto": 1},
+    "callback_from_photo": {"answercallbackquery": 1, "editmessagemedia": 1},
+    "callback_from_text": {"answercallbackquery": 1, "sendphoto": 1},
+}
+
+update_ids = itertools.count(1)
+
+
+def message_update(user_id: int, text: str) -> Update:
+    update_id = next(update_ids)
+    return Update.model_validate({"update_id": update_id, "message": {
+        "message_id": update_id,
+        "date": int(time.time()),
+        "chat": {"id": user_id, "type": "private"},
+        "from": {"id": user_id, "is_bot": False, "first_name": "User"},
+        "text": text,
+    }})
+
+
+def callback_update(user_id: int, data: str, photo: bool) -> Update:
+    update_id = next(update_ids)
+    message = {
+        "message_id": update_id,
+        "date": int(time.time()),
+        "chat": {"id": user_id, "type": "private"},
+        "from": BOT_USER,
+    }
+    if photo:
+        message["photo"] = [{"file_id": "fake-photo", "file_unique_id": "fake-photo", "width": 1, "height": 1}]
+        message["caption"] = "..."
+    else:
+        message["text"] = "..."
+    return Update.model_validate({"update_id": update_id, "callback_query": {
+        "id": str(update_id),
+        "chat_instance": str(user_id),
+        "from": {"id": user_id, "is_bot": False, "first_name": "User"},
+        "data": data,
+        "message": message,
+    }})
+
+
+async def count_calls(api: FakeBotAPI, dp: Dispatcher, bot: Bot, update: Update) -> Dict[str, int]:
+    api.reset()
+    await dp.feed_update(bot, update)
+    return dict(api.calls)
+
+
+async def main() -> int:
+    api = FakeBotAPI()
+    await api.start()
+    bot = Bot("123:fake", session=AiohttpSession(api=TelegramAPIServer.from_base(api.url)))
+
+    directory = tempfile.TemporaryDirectory()
+    db = Database(os.path.join(directory.name, "home.db"))
+    await db.connect()
+    dp = Dispatcher(db=db, media=MediaCache(db))
+    setup_dispatcher(dp)
+
+    failures = 0
+    try:
+        # Первая отправка логотипа загружает файл, дальше идёт file_id из кэша
+        await dp.feed_update(bot, message_update(USER_ID, "/start"))
+
+        for name, user_id in (("user", USER_ID), ("admin", ADMIN_ID)):
+            updates = {
+                "start": message_update(user_id, "/start"),
+                "reply_button": message_update(user_id, "🏠 На главную"),
+                "callback_from_photo": callback_update(user_id, "go_to_home", photo=True),
+                "callback_from_text": callback_update(user_id, "go_to_home", photo=False),
+            }
+            for path, update in updates.items():
+                calls = await count_calls(api, dp, bot, update)
+                ok = calls == EXPECTED[path]
+                failures += not ok
+                print(f"{'OK  ' if ok else 'FAIL'} {name:<6}{path:<22}{sum(calls.values())} {calls}")
+    finally:
+        await db.close()
+        await bot.session.close()
+        await api.stop()
+        directory.cleanup()
+
+    return 1 if failures else 0
+
+
+if __name__ == "__main__":
+    sys.exit(asyncio.run(main()))
@@ -0,0 +1,255 @@
+"""Нагрузочный тест бота: реальные роутеры из main.py, заглушка Bot API и временная база.
+
+Запуск из корня репозитория:
+
+    python -m bench.loadtest --users 500 --concurrency 50
+
+Каждый виртуальный пользователь проходит сценарий целиком: /start по
+реферальной ссылке, покупка звёзд другу с оплатой переводом на карту и
+подтверждение заказа админом. Апдейты одного пользователя идут строго по
+очереди, как в жизни, а пользователи работают параллельно. Антифлуд по
+умолчанию выключен: сценарий шлёт апдейты быстрее живого человека.
+
+В отчёте — пропускная способность, p50/p95/p99 времени обработки апдейта
+(общие и по шагам сценария) и число запросов к SQLite на апдейт.
+"""
+import argparse
+import asyncio
+import itertools
+import os
+import statistics
+import tempfile
+import time
+from collections import Counter, defaultdict
+from typing import Dict, List, Optional
+
+from aiogram import Bot, Dispatcher
+from aiogram.client.default import DefaultBotProperties
+from aiogram.client.session.aiohttp import AiohttpSession
+from aiogram.client.telegram import TelegramAPIServer
+from aiogram.types import Update
+
+from bench.fake_bot_api import BOT_USER, FakeBotAPI
+from keyboards.callbacks import OrderAction
+from main import setup_dispatcher
+from middlewares.antiflood import AntiFloodMiddleware
+from middlewares.metrics import BotAPIMetricsMiddleware
+from middlewares.rate_governor import RateGovernorMiddleware
+from utils.broadcast import Broadcaster
+from utils.constants import ADMIN_IDS
+from utils.database import Database
+from utils.fsm_storage import build_fsm_storage
+from utils.lava import LavaClient
+from utils.media_cache import MediaCache
+from utils.notifications import AdminNotifier
+from utils.pricing import PricingEngine, StaticRateSource
+from utils.profiling import Profiler
+from utils.promocodes import PromocodeService
+
+ADMIN_ID = min(ADMIN_IDS)
+FIRST_USER_ID = 10_000_000
+STEPS = (
+    "start", "buy_stars", "buy_for_friend", "friend_username",
+    "confirm_username", "stars_amount", "pay_card", "check_payment", "approve",
+)
+
+
+def percentile(values: List[float], q: float) -> float:
+    if not values:
+        return 0.0
+    values = sorted(values)
+    return values[min(len(values) - 1, int(round(q / 100 * (len(values) - 1))))]
+
+
+class LoadTest:
+    def __init__(self, api: FakeBotAPI, db: Database, bot: Bot, dp: Dispatcher, think_time: float = 0.0):
+        self.api = api
+        self.db = db
+        self.bot = bot
+        self.dp = dp
+        self.think_time = think_time
+        self.latencies: Dict[str, List[float]] = defaultdict(list)
+        self.errors = 0
+        self.db_queries: Counter = Counter()
+        self._update_ids = itertools.count(1)
+        db.query_hook = self._count_query
+
+    def _count_query(self, name: str, duration: float, write: bool, error: Optional[Exception]):
+        self.db_queries[name] += 1
+
+    def _user(self, user_id: int) -> dict:
+        return {"id": user_id, "is_bot": False, "first_name": f"User {user_id}", "username": f"user{user_id}"}
+
+    def _message(self, user_id: int, text: str) -> Update:
+        update_id = next(self._update_ids)
+        return Update.model_validate({"update_id": update_id, "message": {
+            "message_id": update_id,
+            "date": int(time.time()),
+            "chat": {"id": user_id, "type": "private"},
+            "from": self._user(user_id),
+            "text": text,
+        }})
+
+    def _callback(self, user_id: int, data: str, text: str = "...") -> Update:
+        update_id = next(self._update_ids)
+        return Update.model_validate({"update_id": update_id, "callback_query": {
+            "id": str(update_id),
+            "chat_instance": str(user_id),
+            "from": self._user(user_id),
+            "data": data,
+            "message": {
+                "message_id": update_id,
+                "date": int(time.time()),
+                "chat": {"id": user_id, "type": "private"},
+                "from": BOT_USER,
+                "text": text,
+            },
+        }})
+
+    async def _feed(self, step: str, update: Update):
+        started = time.perf_counter()
+        try:
+            await self.dp.feed_update(self.bot, update)
+        except Exception as e:
+            self.errors += 1
+            print(f"Update {update.update_id} ({step}) failed: {e}")
+        self.latencies[step].append(time.perf_counter() - started)
+        if self.think_time:
+            await asyncio.sleep(self.think_time)
+
+    async def _last_order_id(self, telegram_id: int) -> Optional[int]:
+        # Напрямую через соединение пула, мимо query_hook: запрос нужен
+        # только сценарию и не должен попадать в статистику бота
+        async with self.db.acquire() as connection:
+            async with connection.execute(
+                "SELECT o.id FROM orders o JOIN users u ON u.id = o.user_id "
+                "WHERE u.telegram_id = ? ORDER BY o.id DESC LIMIT 1",
+                (str(telegram_id),)
+            ) as cursor:
+                row = await cursor.fetchone()
+        return row[0] if row else None
+
+    async def journey(self, user_id: int, referrer_id: Optional[int]):
+        start = f"/start {referrer_id}" if referrer_id else "/start"
+        await self._feed("start", self._message(user_id, start))
+        await self._feed("buy_stars", self._callback(user_id, "buy_stars"))
+        await self._feed("buy_for_friend", self._callback(user_id, "buy_for_friend"))
+        await self._feed("friend_username", self._message(user_id, f"@friend_of_{user_id}"))
+        await self._feed("confirm_username", self._callback(user_id, "confirm_username"))
+        await self._feed("stars_amount", self._message(user_id, str(50 + user_id % 1000)))
+        await self._feed("pay_card", self._callback(user_id, "pay_card"))
+        await self._feed("check_payment", self._callback(user_id, "check_payment"))
+
+        order_id = await self._last_order_id(user_id)
+        if order_id is None:
+            self.errors += 1
+            print(f"User {user_id}: order was not created")
+            return
+        approve = OrderAction(action="approve", order_id=order_id).pack()
+        await self._feed("approve", self._callback(ADMIN_ID, approve, text=f"🔔 Новая заявка #{order_id}"))
+
+    async def run(self, users: int, concurrency: int) -> float:
+        semaphore = asyncio.Semaphore(concurrency)
+
+        async def run_journey(i: int):
+            async with semaphore:
+                # Каждый второй приходит по ссылке одного из первых пользователей
+                referrer_id = FIRST_USER_ID + i // 10 if i % 2 and i >= 10 else None
+                await self.journey(FIRST_USER_ID + i, referrer_id)
+
+        started = time.perf_counter()
+        await asyncio.gather(*(run_journey(i) for i in range(users)))
+        return time.perf_counter() - started
+
+    def report(self, elapsed: float):
+        everything = [latency for step in STEPS for latency in self.latencies[step]]
+        updates = len(everything)
+        queries = sum(self.db_queries.values())
+
+        print(
+            f"updates={updates} errors={self.errors} elapsed={elapsed:.2f}s "
+            f"throughput={updates / elapsed if elapsed else 0.0:.1f} upd/s"
+        )
+        print(
+            f"latency p50={statistics.median(everything) * 1000:.1f}ms "
+            f"p95={percentile(everything, 95) * 1000:.1f}ms p99={percentile(everything, 99) * 1000:.1f}ms"
+        )
+        print(f"db queries={queries} per update={queries / updates if updates else 0.0:.2f}")
+        print(f"bot api calls={sum(self.api.calls.values())} per update={sum(self.api.calls.values()) / updates if updates else 0.0:.2f}")
+
+        print(f"\n{'step':<18}{'p50 ms':>9}{'p95 ms':>9}{'p99 ms':>9}")
+        for step in STEPS:
+            values = self.latencies[step]
+            if values:
+                print(
+                    f"{step:<18}{statistics.median(values) * 1000:>9.1f}"
+                    f"{percentile(values, 95) * 1000:>9.1f}{percentile(values, 99) * 1000:>9.1f}"
+                )
+
+        print(f"\n{'db query':<28}{'count':>8}{'per update':>12}")
+        for name, count in self.db_queries.most_common():
+            print(f"{name:<28}{count:>8}{count / updates:>12.2f}")
+
+
+async def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--users", type=int, default=500)
+    parser.add_argument("--concurrency", type=int, default=50)
+    parser.add_argument("--latency", type=float, default=0.0, help="задержка заглушки Bot API, секунды")
+    parser.add_argument("--think-time", type=float, default=0.0, help="пауза между шагами одного пользователя")
+    parser.add_argument("--fsm-storage", default="sqlite", choices=("sqlite", "memory"))
+    parser.add_argument("--governor", action="store_true", help="включить RateGovernorMiddleware, как в продакшене")
+    parser.add_argument("--antiflood", action="store_true", help="включить AntiFloodMiddleware с настройками по умолчанию")
+    args = parser.parse_args()
+
+    api = FakeBotAPI(latency=args.latency)
+    await api.start()
+
+    session = AiohttpSession(api=TelegramAPIServer.from_base(api.url))
+    if args.governor:
+        session.middleware(RateGovernorMiddleware())
+    session.middleware(BotAPIMetricsMiddleware())
+    bot = Bot("123:fake", session=session, default=DefaultBotProperties(parse_mode='HTML'))
+
+    directory = tempfile.TemporaryDirectory()
+    db = Database(os.path.join(directory.name, "loadtest.db"))
+    await db.connect()
+    fsm_storage, fsm_isolation = build_fsm_storage(backend=args.fsm_storage, db=db, ttl=86400)
+    notifier = AdminNotifier(db)
+    pricing = PricingEngine(db, source=StaticRateSource({"KZT": 5.5}))
+    await pricing.load()
+    await pricing.refresh_rates()
+    broadcaster = Broadcaster(db)
+    lava = LavaClient(shop_id="loadtest", secret_key="loadtest", base_url=api.url)
+
+    dp = Dispatcher(
+        storage=fsm_storage,
+        events_isolation=fsm_isolation,
+        db=db,
+        lava=lava,
+        media=MediaCache(db),
+        notifier=notifier,
+        broadcaster=broadcaster,
+        promocode_service=PromocodeService(db),
+        profiler=Profiler(),
+        pricing=pricing,
+    )
+    setup_dispatcher(dp, AntiFloodMiddleware() if args.antiflood else None)
+
+    test = LoadTest(api, db, bot, dp, think_time=args.think_time)
+    try:
+        elapsed = await test.run(args.users, args.concurrency)
+        test.report(elapsed)
+    finally:
+        await broadcaster.close()
+        await notifier.close()
+        await lava.close()
+        await fsm_storage.close()
+        await db.close()
+        await bot.session.close()
+        await api.stop()
+        directory.cleanup()
+
+
+if __name__ == "__main__":
+    asyncio.run(main())
@@ -0,0 +1,155 @@
+"""Гонка подтверждения и отклонения одного заказа.
+
+Запуск из корня репозитория:
+
+    python -m bench.order_race --orders 50
+
+Для каждого заказа, ожидающего оплаты переводом на карту, два разных админа
+одновременно нажимают «Подтвердить» и «Отклонить». Апдейты идут через
+роутеры и мидлвари из main.py, запросы к Bot API — в bench/fake_bot_api.py.
+Проверяется, что у каждого заказа ровно один конечный переход в order_events
+и заказчик получил ровно одно сообщение. Затем то же на уровне
+utils/orders.py: approve и reject напрямую через asyncio.gather.
+"""
+import argparse
+import asyncio
+import itertools
+import os
+import sys
+import tempfile
+import time
+from typing import List
+
+from aiogram import Bot, Dispatcher
+from aiogram.client.default import DefaultBotProperties
+from aiogram.client.session.aiohttp import AiohttpSession
+from aiogram.client.telegram import TelegramAPIServer
+from aiogram.types import Update
+
+from bench.fake_bot_api import BOT_USER, FakeBotAPI
+from keyboards.callbacks import OrderAction
+from main import setup_dispatcher
+from utils import orders
+from utils.constants import ADMIN_IDS
+from utils.database import Database
+from utils.notifications import AdminNotifier
+
+FIRST_USER_ID = 10_000_000
+APPROVER, REJECTER = sorted(ADMIN_IDS)[:2]
+TERMINAL = {orders.FULFILLED, orders.REJECTED, orders.EXPIRED}
+
+update_ids = itertools.count(1)
+
+
+def action_update(admin_id: int, action: str, order_id: int) -> Update:
+    update_id = next(update_ids)
+    return Update.model_validate({"update_id": update_id, "callback_query": {
+        "id": str(update_id),
+        "chat_instance": str(admin_id),
+        "from": {"id": admin_id, "is_bot": False, "first_name": "Admin"},
+        "data": OrderAction(action=action, order_id=order_id).pack(),
+        "message": {
+            "message_id": update_id,
+            "date": int(time.time()),
+            "chat": {"id": admin_id, "type": "private"},
+            "from": BOT_USER,
+            "text": f"🔔 Новая заявка #{order_id}",
+        },
+    }})
+
+
+async def create_orders(db: Database, count: int, offset: int) -> List[int]:
+    order_ids = []
+    for i in range(count):
+        user = await db.create_user(str(FIRST_USER_ID + offset + i))
+        order_ids.append(await db.create_order(
+            user['id'], 50, 88, orders.AWAITING_PAYMENT,
+            target_username="friend", payment_method="Перевод на карту"
+        ))
+    return order_ids
+
+
+async def check_events(db: Database, order_id: int) -> List[str]:
+    events = await db.get_order_events(order_id)
+    terminal = [event for event in events if event['to_status'] in TERMINAL]
+    problems = []
+    if len(terminal) != 1:
+        problems.append(f"заказ {order_id}: конечных переходов {len(terminal)}")
+    # Проигравший переход не должен оставить след в журнале
+    if len(events) != 2:
+        problems.append(f"заказ {order_id}: событий {len(events)} вместо 2 (создание и конечный переход)")
+    return problems
+
+
+async def race_dispatcher(api: FakeBotAPI, db: Database, dp: Dispatcher, bot: Bot, count: int) -> List[str]:
+    order_ids = await create_orders(db, count, offset=0)
+    api.reset()
+    await asyncio.gather(*(
+        dp.feed_update(bot, action_update(admin_id, action, order_id))
+        for order_id in order_ids
+        for admin_id, action in ((APPROVER, "approve"), (REJECTER, "reject"))
+    ))
+
+    problems = []
+    for i, order_id in enumerate(order_ids):
+        problems += await check_events(db, order_id)
+        messages = api.sent_by_chat.get(str(FIRST_USER_ID + i), 0)
+        if messages != 1:
+            problems.append(f"заказ {order_id}: заказчику отправлено {messages} сообщений")
+    return problems
+
+
+async def race_orders(db: Database, count: int) -> List[str]:
+    order_ids = await create_orders(db, count, offset=count)
+    results = await asyncio.gather(*(
+        call(db, order_id, actor)
+        for order_id in order_ids
+        for call, actor in ((orders.approve, str(APPROVER)), (orders.reject, str(REJECTER)))
+    ))
+
+    problems = []
+    for i, order_id in enumerate(order_ids):
+        if sum(results[2 * i:2 * i + 2]) != 1:
+            problems.append(f"заказ {order_id}: успешных переходов {sum(results[2 * i:2 * i + 2])}")
+        problems += await check_events(db, order_id)
+    return problems
+
+
+async def main() -> int:
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--orders", type=int, default=50)
+    parser.add_argument("--latency", type=float, default=0.01, help="задержка заглушки Bot API, секунды")
+    args = parser.parse_args()
+
+    api = FakeBotAPI(latency=args.latency)
+    await api.start()
+    session = AiohttpSession(api=TelegramAPIServer.from_base(api.url))
+    bot = Bot("123:fake", session=session, default=DefaultBotProperties(parse_mode='HTML'))
+
+    directory = tempfile.TemporaryDirectory()
+    db = Database(os.path.join(directory.name, "race.db"))
+    await db.connect()
+    notifier = AdminNotifier(db)
+    # Без events_isolation апдейты разных админов обрабатываются параллельно
+    dp = Dispatcher(db=db, notifier=notifier)
+    setup_dispatcher(dp)
+
+    try:
+        problems = await race_dispatcher(api, db, dp, bot, args.orders)
+        problems += await race_orders(db, args.orders)
+    finally:
+        await notifier.close()
+        await db.close()
+        await bot.session.close()
+        await api.stop()
+        directory.cleanup()
+
+    for problem in problems:
+        print(f"FAIL {problem}")
+    if not problems:
+        print(f"OK {args.orders * 2} заказов: ровно один конечный переход и одно сообщение заказчику")
+    return 1 if problems else 0
+
+
+if __name__ == "__main__":
+    sys.exit(asyncio.run(main()))
@@ -0,0 +1,108 @@
+"""Бенчмарк RateGovernorMiddleware против локальной заглушки Bot API.
+
+Запуск из корня репозитория:
+
+    python -m bench.rate_governor_bench --messages 300 --chats 30
+
+Заглушка отдаёт 429 при превышении лимитов Telegram. Без губернатора часть
+рассылки теряется на 429, с губернатором всё доставляется, а интерактивные
+ответы, отправленные посреди рассылки, обгоняют массовые сообщения.
+"""
+import argparse
+import asyncio
+import statistics
+import time
+from typing import List
+
+from aiogram import Bot
+from aiogram.client.session.aiohttp import AiohttpSession
+from aiogram.client.telegram import TelegramAPIServer
+from aiogram.exceptions import TelegramRetryAfter
+
+from bench.fake_bot_api import FakeBotAPI
+from middlewares.rate_governor import RateGovernorMiddleware, bulk_priority
+
+
+def percentile(values: List[float], q: float) -> float:
+    if not values:
+        return 0.0
+    values = sorted(values)
+    return values[min(len(values) - 1, int(round(q / 100 * (len(values) - 1))))]
+
+
+async def run(api: FakeBotAPI, use_governor: bool, messages: int, chats: int, interactive: int) -> dict:
+    api.reset()
+    session = AiohttpSession(api=TelegramAPIServer.from_base(api.url))
+    if use_governor:
+        session.middleware(RateGovernorMiddleware())
+    bot = Bot("123:fake", session=session)
+
+    delivered = 0
+    lost = 0
+    latencies: List[float] = []
+
+    async def bulk_send(i: int):
+        nonlocal delivered, lost
+        with bulk_priority():
+            try:
+                await bot.send_message(chat_id=1000 + i % chats, text=f"bulk {i}")
+                delivered += 1
+            except TelegramRetryAfter:
+                lost += 1
+
+    async def interactive_send(i: int):
+        nonlocal delivered, lost
+        await asyncio.sleep(0.2 + i * 0.1)
+        started = time.perf_counter()
+        try:
+            await bot.send_message(chat_id=-(i + 1), text=f"status {i}")
+            delivered += 1
+            latencies.append(time.perf_counter() - started)
+        except TelegramRetryAfter:
+            lost += 1
+
+    started = time.perf_counter()
+    await asyncio.gather(
+        *(bulk_send(i) for i in range(messages)),
+        *(interactive_send(i) for i in range(interactive)),
+    )
+    elapsed = time.perf_counter() - started
+    await session.close()
+
+    return {
+        "governor": use_governor,
+        "delivered": delivered,
+        "lost": lost,
+        "rejected_by_api": api.rejected,
+        "elapsed": elapsed,
+        "throughput": delivered / elapsed if elapsed else 0.0,
+        "interactive_p50": statistics.median(latencies) if latencies else 0.0,
+        "interactive_p95": percentile(latencies, 95),
+    }
+
+
+async def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--messages", type=int, default=300)
+    parser.add_argument("--chats", type=int, default=30)
+    parser.add_argument("--interactive", type=int, default=20)
+    parser.add_argument("--latency", type=float, default=0.005)
+    args = parser.parse_args()
+
+    api = FakeBotAPI(latency=args.latency, global_limit=30, chat_limit=3)
+    await api.start()
+    try:
+        for use_governor in (False, True):
+            result = await run(api, use_governor, args.messages, args.chats, args.interactive)
+            print(
+                f"governor={'on ' if result['governor'] else 'off'} "
+                f"delivered={result['delivered']} lost={result['lost']} 429={result['rejected_by_api']} "
+                f"elapsed={result['elapsed']:.2f}s throughput={result['throughput']:.1f} msg/s "
+                f"interactive p50={result['interactive_p50'] * 1000:.0f}ms p95={result['interactive_p95'] * 1000:.0f}ms"
+            )
+    finally:
+        await api.stop()
+
+
+if __name__ == "__main__":
+    asyncio.run(main())
@@ -0,0 +1,249 @@
+import logging
+
+from aiogram import Router, F
+from aiogram.filters import Command, CommandObject
+from aiogram.fsm.context import FSMContext
+from aiogram.fsm.state import State, StatesGroup
+from aiogram.types import Message, CallbackQuery
+from keyboards.admin_keyboards import get_admin_home_menu, get_broadcast_confirm_keyboard
+from keyboards.callbacks import BroadcastAction
+from utils.broadcast import Broadcaster
+from utils.constants import ADMIN_IDS
+from utils.database import Database
+from utils.pricing import MIN_STARS, PricingEngine, parse_tiers
+from utils.profiling import Profiler
+from utils.promocodes import PromocodeService
+
+router = Router(name='admin')
+logger = logging.getLogger(__name__)
+router.message.filter(F.from_user.id.in_(ADMIN_IDS))
+router.callback_query.filter(F.from_user.id.in_(ADMIN_IDS))
+
+TOP_REFERRERS_DEFAULT = 10
+TOP_REFERRERS_MAX = 50
+
+class BroadcastStates(StatesGroup):
+    waiting_for_text = State()
+    waiting_for_confirm = State()
+
+@router.callback_query(F.data == "broadcast")
+async def start_broadcast(callback: CallbackQuery, state: FSMContext):
+    await callback.answer()
+    await state.set_state(BroadcastStates.waiting_for_text)
+    await callback.message.answer(
+        "📢 Отправьте текст рассылки.\n"
+        "Форматирование сохранится, сообщение получат все пользователи бота.",
+        reply_markup=get_admin_home_menu()
+    )
+
+@router.message(BroadcastStates.waiting_for_text, F.text)
+async def process_broadcast_text(message: Message, state: FSMContext, db: Database):
+    try:
+        text = message.html_text
+        total = await db.count_broadcast_recipients()
+
+        await state.update_data(text=text)
+        await state.set_state(BroadcastStates.waiting_for_confirm)
+
+        await message.answer(text)
+        await message.answer(
+            f"☝️ Так будет выглядеть сообщение.\n"
+            f"👥 Получателей: {total}\n\n"
+            f"Начать рассылку?",
+            reply_markup=get_broadcast_confirm_keyboard()
+        )
+    except Exception:
+        logger.exception("Error in process_broadcast_text")
+        await message.answer("❌ Произошла ошибка. Пожалуйста, попробуйте позже.")
+        await state.clear()
+
+@router.callback_query(BroadcastStates.waiting_for_confirm, F.data == "broadcast_confirm")
+async def confirm_broadcast(callback: CallbackQuery, state: FSMContext, broadcaster: Broadcaster):
+    try:
+        data = await state.get_data()
+        await state.clear()
+        await callback.answer()
+
+        if not data.get("text"):
+            await callback.message.edit_text("❌ Текст рассылки не найден, начните заново.")
+            return
+
+        await callback.message.edit_text("🚀 Рассылка запущена")
+        await broadcaster.start(callback.bot, data["text"], callback.message.chat.id)
+    except Exception:
+        logger.exception("Error in confirm_broadcast")
+        await callback.message.answer("❌ Не удалось запустить рассылку.")
+
+@router.callback_query(F.data == "broadcast_abort")
+async def abort_broadcast(callback: CallbackQuery, state: FSMContext):
+    await state.clear()
+    await callback.answer()
+    await callback.message.edit_text("❌ Рассылка отменена")
+
+@router.callback_query(BroadcastAction.filter(F.action == "cancel"))
+async def cancel_broadcast(callback: CallbackQuery, callback_data: BroadcastAction, broadcaster: Broadcaster):
+    if await broadcaster.cancel(callback_data.broadcast_id):
+        await callback.answer("⏹ Рассылка остановлена")
+    else:
+        await callback.answer("Рассылка уже завершена", show_alert=True)
+
+async def format_top_referrers(db: Database, limit: int) -> str:
+    top = await db.get_top_referrers(limit)
+    if not top:
+        return "🏆 Пока никто не пригласил ни одного пользователя"
+
+    lines = [f"🏆 Топ-{limit} рефералов\n"]
+    for place, (telegram_id, referrals_count, earnings) in enumerate(top, start=1):
+        lines.append(
+            f"{place}. <a href=\"tg://user?id={telegram_id}\">{telegram_id}</a> — "
+            f"{referrals_count} реф., заработано {earnings} RUB"
+        )
+    return "\n".join(lines)
+
+@router.callback_query(F.data == "top_referrers")
+async def show_top_referrers(callback: CallbackQuery, db: Database):
+    try:
+        await callback.answer()
+        await callback.message.answer(
+            await format_top_referrers(db, TOP_REFERRERS_DEFAULT),
+            reply_markup=get_admin_home_menu()
+        )
+    except Exception:
+        logger.exception("Error in show_top_referrers")
+        await callback.message.answer("❌ Произошла ошибка. Пожалуйста, попробуйте позже.")
+
+@router.message(Command("top_referrers"))
+async def top_referrers_command(message: Message, command: CommandObject, db: Database):
+    try:
+        limit = int(command.args) if command.args else TOP_REFERRERS_DEFAULT
+    except ValueError:
+        await message.answer("Использование: /top_referrers [N]")
+        return
+
+    try:
+        await message.answer(await format_top_referrers(db, max(1, min(limit, TOP_REFERRERS_MAX))))
+    except Exception:
+        logger.exception("Error in top_referrers_command")
+        await message.answer("❌ Произошла ошибка. Пожалуйста, попробуйте позже.")
+
+@router.message(Command("create_promo"))
+async def create_promo_command(message: Message, command: CommandObject, promocode_service: PromocodeService):
+    usage = (
+        "Использование: /create_promo КОД СКИДКА_% СУММА_RUB [ЛИМИТ]\n"
+        "Например: /create_promo SPRING 10 0 100"
+    )
+    try:
+        args = (command.args or "").split()
+        if len(args) not in (3, 4):
+            raise ValueError
+        code = args[0]
+        discount, amount_money = int(args[1]), int(args[2])
+        max_uses = int(args[3]) if len(args) == 4 else None
+        if not 0 <= discount <= 100 or amount_money < 0 or (max_uses is not None and max_uses <= 0):
+            raise ValueError
+    except ValueError:
+        await message.answer(usage)
+        return
+
+    try:
+        if await promocode_service.get(code):
+            await message.answer(f"⚠️ Промокод {code} уже существует")
+            return
+        promocode = await promocode_service.create(code, discount, amount_money, max_uses)
+        await message.answer(
+            f"✅ Промокод <code>{promocode['code']}</code> создан\n"
+            f"🏷 Скидка: {promocode['discount']}%\n"
+            f"💰 Бонус на баланс: {promocode['amount_money']} RUB\n"
+            f"👥 Лимит активаций: {promocode['max_uses'] or 'без ограничений'}"
+        )
+    except Exception:
+        logger.exception("Error in create_promo_command")
+        await message.answer("❌ Не удалось создать промокод.")
+
+@router.message(Command("profile"))
+async def profile_command(message: Message, command: CommandObject, profiler: Profiler):
+    try:
+        seconds = int(command.args) if command.args else 30
+        if not 1 <= seconds <= profiler.max_seconds:
+            raise ValueError
+    except ValueError:
+        await message.answer(f"Использование: /profile [СЕКУНДЫ], от 1 до {profiler.max_seconds}")
+        return
+
+    if not profiler.start(message.bot, seconds, message.chat.id):
+        await message.answer("⏳ Профилирование уже идёт, дождитесь отчёта.")
+        return
+    await message.answer(f"📊 Профилирование запущено на {seconds} с, отчёт придёт сюда.")
+
+def format_prices(pricing: PricingEngine) -> str:
+    lines = ["💲 Цены на звёзды\n"]
+    for min_stars, price in pricing.tiers:
+        lines.append(f"от {min_stars} ⭐️ — {price} RUB за звезду")
+
+    lines.append("\n💱 Курсы за 1 RUB")
+    for currency in pricing.currencies:
+        if currency in pricing.pinned_rates:
+            lines.append(f"{currency}: {pricing.pinned_rates[currency]:.4f} (закреплён)")
+        elif currency in pricing.fetched_rates:
+            lines.append(f"{currency}: {pricing.fetched_rates[currency]:.4f} (авто)")
+        else:
+            lines.append(f"{currency}: нет курса")
+
+    lines.append("\n🧮 Примеры")
+    for stars in (MIN_STARS, 1000, 10000):
+        lines.append(f"{stars} ⭐️ — " + ", ".join(f"{price} {currency}" for currency, price in pricing.quotes(stars).items()))
+    return "\n".join(lines)
+
+@router.message(Command("prices"))
+async def prices_command(message: Message, pricing: PricingEngine):
+    await message.answer(format_prices(pricing))
+
+@router.message(Command("set_tiers"))
+async def set_tiers_command(message: Message, command: CommandObject, pricing: PricingEngine):
+    try:
+        tiers = parse_tiers(command.args or "")
+    except ValueError as e:
+        await message.answer(
+            f"❌ {e}\n\nИспользование: /set_tiers ОТ:ЦЕНА ...\n"
+            f"Например: /set_tiers {MIN_STARS}:1.75 1000:1.7 5000:1.65"
+        )
+        return
+
+    try:
+        await pricing.set_tiers(tiers)
+        await message.answer(format_prices(pricing))
+    except Exception:
+        logger.exception("Error in set_tiers_command")
+        await message.answer("❌ Не удалось изменить цены.")
+
+@router.message(Command("set_rate"))
+async def set_rate_command(message: Message, command: CommandObject, pricing: PricingEngine):
+    usage = (
+        "Использование: /set_rate ВАЛЮТА КУРС|auto\n"
+        "Курс — сколько единиц валюты за 1 RUB, auto возвращает автоматический курс.\n"
+        "Например: /set_rate KZT 5.8"
+    )
+    args = (command.args or "").split()
+    if len(args) != 2:
+        await message.answer(usage)
+        return
+
+    currency = args[0].upper()
+    try:
+        rate = None if args[1].lower() == "auto" else float(args[1].replace(",", "."))
+        await pricing.set_rate(currency, rate)
+    except ValueError as e:
+        await message.answer(f"❌ {e}\n\n{usage}")
+        return
+    except Exception:
+        logger.exception("Error in set_rate_command")
+        await message.answer("❌ Не удалось изменить курс.")
+        return
+
+    if rate is None:
+        # Без закрепления курс берётся из источника, подтягиваем его сразу
+        try:
+            await pricing.refresh_rates()
+        except Exception as e:
+            logger.warning("Failed to refresh exchange rates: %s", e)
+    await message.answer(format_prices(pricing))
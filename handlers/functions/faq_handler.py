@@ -1,8 +1,11 @@
+import logging
+
 from aiogram import Router, F
 from aiogram.types import Message, CallbackQuery
 from aiogram.types import InlineKeyboardMarkup, InlineKeyboardButton
 
 router = Router(name='faq')
+logger = logging.getLogger(__name__)
 
 @router.message(F.text == "❓ FAQ")
 async def show_faq(message: Message):
@@ -21,8 +24,8 @@ async def show_faq(message: Message):
             reply_markup=faq_keyboard
         )
         
-    except Exception as e:
-        print(f"Error in show_faq: {e}")
+    except Exception:
+        logger.exception("Error in show_faq")
         await message.answer("❌ Произошла ошибка. Пожалуйста, попробуйте позже.")
 
 
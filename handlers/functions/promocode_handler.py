@@ -0,0 +1,64 @@
+import logging
+
+from aiogram import Router, F
+from aiogram.fsm.context import FSMContext
+from aiogram.fsm.state import State, StatesGroup
+from aiogram.types import Message, CallbackQuery
+from aiogram.types import InlineKeyboardMarkup, InlineKeyboardButton
+from utils.database import Database
+from utils import promocodes
+from utils.promocodes import PromocodeService
+
+router = Router(name='promocode')
+logger = logging.getLogger(__name__)
+
+class PromocodeStates(StatesGroup):
+    waiting_for_code = State()
+
+home_keyboard = InlineKeyboardMarkup(inline_keyboard=[
+    [InlineKeyboardButton(text="🏠 Главное меню", callback_data="go_to_home")]
+])
+
+@router.callback_query(F.data == "promocode")
+async def ask_promocode(callback: CallbackQuery, state: FSMContext):
+    await callback.answer()
+    await state.set_state(PromocodeStates.waiting_for_code)
+    await callback.message.answer("🎁 Введите промокод:", reply_markup=home_keyboard)
+
+@router.message(PromocodeStates.waiting_for_code, F.text)
+async def process_promocode(message: Message, state: FSMContext, db: Database, promocode_service: PromocodeService):
+    try:
+        user = await db.get_user(str(message.from_user.id))
+        if not user:
+            await message.answer("❌ Пользователь не найден. Пожалуйста, перезапустите бота командой /start")
+            await state.clear()
+            return
+
+        result, promocode = await promocode_service.redeem(message.text, user)
+
+        if result == promocodes.NOT_FOUND:
+            # Оставляем состояние, чтобы можно было исправить опечатку
+            await message.answer("❌ Такого промокода нет. Проверьте написание и попробуйте ещё раз:", reply_markup=home_keyboard)
+            return
+
+        await state.clear()
+
+        if result == promocodes.SOLD_OUT:
+            await message.answer("⌛️ Этот промокод больше недействителен.", reply_markup=home_keyboard)
+            return
+
+        if result == promocodes.ALREADY_REDEEMED:
+            await message.answer("⚠️ Вы уже активировали этот промокод.", reply_markup=home_keyboard)
+            return
+
+        text = "✅ Промокод активирован!\n"
+        if promocode['amount_money']:
+            text += f"\n💰 На баланс зачислено {promocode['amount_money']} RUB"
+        if promocode['discount']:
+            text += f"\n🏷 Скидка {promocode['discount']}% будет применена к следующему заказу"
+        await message.answer(text, reply_markup=home_keyboard)
+
+    except Exception:
+        logger.exception("Error in process_promocode")
+        await message.answer("❌ Произошла ошибка. Пожалуйста, попробуйте позже.")
+        await state.clear()
@@ -1,3 +1,5 @@
+import logging
+
 from aiogram import Router, F
 from aiogram.types import Message, CallbackQuery
 from aiogram.types import InlineKeyboardMarkup, InlineKeyboardButton
@@ -5,13 +7,13 @@ from utils.database import Database
 from utils.constants import BOT_USERNAME
 
 router = Router(name='referral')
-db = Database()
+logger = logging.getLogger(__name__)
 
 @router.callback_query(F.data == "referral_system")
-async def show_referral_system(callback: CallbackQuery):
+async def show_referral_system(callback: CallbackQuery, db: Database):
     try:
         telegram_id = str(callback.from_user.id)
-        user = db.get_user(telegram_id)
+        user = await db.get_user(telegram_id)
         
         if not user:
             await callback.message.answer("❌ Ошибка получения данных пользователя")
@@ -32,7 +34,7 @@ async def show_referral_system(callback: CallbackQuery):
             [InlineKeyboardButton(text="🏠 Главное меню", callback_data="go_to_home")]
         ])
 
-        referral_count = db.amount_refferal_by_tg_id(telegram_id)
+        referral_stats = await db.get_referral_stats(telegram_id)
         
         await callback.message.answer(
             "👥 Реферальная система\n\n"
@@ -42,14 +44,14 @@ async def show_referral_system(callback: CallbackQuery):
             "- Скоро будет доступна монетизация рефералов\n"
             "- Следите за обновлениями системы\n\n"
             f"🔗 Ваша реферальная ссылка:\n{referral_link}\n\n"
-            f"📊 Количество ваших рефералов: {referral_count if referral_count else 0}\n\n"
+            f"📊 Количество ваших рефералов: {referral_stats['referrals_count']}\n\n"
             "⚡️ Скоро здесь появятся новые крутые возможности заработка!",
             reply_markup=referral_keyboard
         )
         
         await callback.answer()
 
-    except Exception as e:
-        print(f"Error in show_referral_system: {e}")
+    except Exception:
+        logger.exception("Error in show_referral_system")
         await callback.message.answer("❌ Произошла ошибка. Пожалуйста, попробуйте позже.")
 
@@ -1,21 +1,24 @@
+import logging
+
 from aiogram import Router, F
 from aiogram.fsm.context import FSMContext
 from aiogram.fsm.state import State, StatesGroup
 from aiogram.types import Message, CallbackQuery
 from aiogram.types import InlineKeyboardMarkup, InlineKeyboardButton
 from aiogram.exceptions import TelegramBadRequest
-from utils.constants import STAR_TO_RUBLE, ADMIN_IDS, ALLOWED_TO_ADMIN_PANEL_IDS
-from utils.database import Database
-import os
-import hmac
-import json
-import hashlib
-import requests
-import uuid
+from utils.constants import ADMIN_IDS, ALLOWED_TO_ADMIN_PANEL_IDS
+from utils.database import Database, DiscountAlreadyUsed, OrderAlreadyExists
+from utils.lava import LavaClient, LavaError
+from utils.notifications import AdminNotifier
+from utils.pricing import BASE_CURRENCY, MIN_STARS, MAX_STARS, PricingEngine, apply_discount
+from utils import orders
+from utils.log import bind
+from keyboards.admin_keyboards import get_order_admin_keyboard
+from keyboards.callbacks import OrderAction
 from datetime import datetime
 
 router = Router(name='shop')
-db = Database()
+logger = logging.getLogger(__name__)
 
 class ShopStates(StatesGroup):
     waiting_for_recipient = State()
@@ -34,6 +37,10 @@ PAYMENT_DETAILS = """
 ₸ 5269880009919101
 """
 
+def format_other_prices(prices: dict) -> str:
+    # Для перевода на карту в тенге показываем сумму по текущему курсу
+    return "".join(f"💱 Или {price} {currency}\n" for currency, price in prices.items())
+
 @router.callback_query(F.data == "buy_stars")
 async def start_buy_stars(callback: CallbackQuery, state: FSMContext):
     try:
@@ -50,8 +57,8 @@ async def start_buy_stars(callback: CallbackQuery, state: FSMContext):
         
         await callback.message.answer("✨ Кому вы хотите купить звезды?", reply_markup=keyboard)
         await state.set_state(ShopStates.waiting_for_recipient)
-    except Exception as e:
-        print(f"Error in start_buy_stars: {e}")
+    except Exception:
+        logger.exception("Error in start_buy_stars")
         await callback.message.answer("❌ Произошла ошибка. Пожалуйста, попробуйте позже.")
 
 @router.callback_query(ShopStates.waiting_for_recipient, F.data == "buy_for_self")
@@ -69,8 +76,8 @@ async def buy_for_self(callback: CallbackQuery, state: FSMContext):
         
         await callback.message.answer(f"✨ Вы покупаете звезды для себя (@{username}).\nВведите желаемое количество звезд для покупки (50 - 100000):")
         await state.set_state(ShopStates.waiting_for_stars)
-    except Exception as e:
-        print(f"Error in buy_for_self: {e}")
+    except Exception:
+        logger.exception("Error in buy_for_self")
         await callback.message.answer("❌ Произошла ошибка. Пожалуйста, попробуйте позже.")
         await state.clear()
 
@@ -80,8 +87,8 @@ async def buy_for_friend(callback: CallbackQuery, state: FSMContext):
         await callback.answer()
         await callback.message.answer("✨ Введите username друга в формате @username:")
         await state.set_state(ShopStates.waiting_for_username)
-    except Exception as e:
-        print(f"Error in buy_for_friend: {e}")
+    except Exception:
+        logger.exception("Error in buy_for_friend")
         await callback.message.answer("❌ Произошла ошибка. Пожалуйста, попробуйте позже.")
         await state.clear()
 
@@ -112,8 +119,8 @@ async def process_friend_username(message: Message, state: FSMContext):
         ])
         
         await message.answer(f"Вы собираетесь купить звезды для пользователя @{username}. Всё верно?", reply_markup=keyboard)
-    except Exception as e:
-        print(f"Error in process_friend_username: {e}")
+    except Exception:
+        logger.exception("Error in process_friend_username")
         await message.answer("❌ Произошла ошибка. Пожалуйста, попробуйте позже.")
         await state.clear()
 
@@ -132,8 +139,8 @@ async def confirm_username(callback: CallbackQuery, state: FSMContext):
         
         await callback.message.answer(f"✨ Вы покупаете звезды для @{username}.\nВведите желаемое количество звезд для покупки (50 - 100000):")
         await state.set_state(ShopStates.waiting_for_stars)
-    except Exception as e:
-        print(f"Error in confirm_username: {e}")
+    except Exception:
+        logger.exception("Error in confirm_username")
         await callback.message.answer("❌ Произошла ошибка. Пожалуйста, попробуйте позже.")
         await state.clear()
 
@@ -144,19 +151,32 @@ async def cancel_purchase(callback: CallbackQuery, state: FSMContext):
     await state.clear()
 
 @router.message(ShopStates.waiting_for_stars)
-async def process_stars_amount(message: Message, state: FSMContext):
+async def process_stars_amount(message: Message, state: FSMContext, db: Database, pricing: PricingEngine):
     try:
         stars = int(message.text)
-        if stars < 50 or stars > 100000:
-            await message.answer("❌ Пожалуйста, введите число звезд от 50 до 100000.")
+        if stars < MIN_STARS or stars > MAX_STARS:
+            await message.answer(f"❌ Пожалуйста, введите число звезд от {MIN_STARS} до {MAX_STARS}.")
             return
             
-        rubles = round(stars * STAR_TO_RUBLE, 2)
+        # Цены во всех валютах берутся из готовой таблицы PricingEngine
+        prices = pricing.quotes(stars)
+        rubles = prices.pop(BASE_CURRENCY)
+
+        # Неиспользованная скидка по промокоду закрепится за заказом при его создании
+        discount_text = ""
+        discount_redemption_id = None
+        user = await db.get_user(str(message.from_user.id))
+        discount = await db.get_active_discount(user['id']) if user else None
+        if discount:
+            discount_redemption_id, percent = discount
+            rubles = apply_discount(rubles, percent)
+            prices = {currency: apply_discount(price, percent, currency) for currency, price in prices.items()}
+            discount_text = f"🏷 Скидка по промокоду: {percent}%\n"
         
         data = await state.get_data()
         target_username = data.get('target_username')
         
-        await state.update_data(stars=stars, rubles=rubles)
+        await state.update_data(stars=stars, rubles=rubles, prices=prices, discount_redemption_id=discount_redemption_id)
         
         # Создаем уникальный ID заказа
         order_id = f"order_{message.from_user.id}_{int(datetime.now().timestamp())}"
@@ -170,6 +190,8 @@ async def process_stars_amount(message: Message, state: FSMContext):
         
         await message.answer(
             f"💰 Сумма к оплате: {rubles} RUB\n"
+            f"{format_other_prices(prices)}"
+            f"{discount_text}"
             f"👤 Получатель: @{target_username}\n\n"
             f"Выберите способ оплаты:",
             reply_markup=keyboard
@@ -177,12 +199,12 @@ async def process_stars_amount(message: Message, state: FSMContext):
         
     except ValueError:
         await message.answer("❌ Пожалуйста, введите корректное число звезд.")
-    except Exception as e:
-        print(f"Error in process_stars_amount: {e}")
+    except Exception:
+        logger.exception("Error in process_stars_amount")
         await message.answer("❌ Произошла ошибка. Попробуйте позже.")
 
 @router.callback_query(F.data == "pay_sbp")
-async def pay_with_sbp(callback: CallbackQuery, state: FSMContext):
+async def pay_with_sbp(callback: CallbackQuery, state: FSMContext, db: Database, lava: LavaClient):
     try:
         await callback.answer()
         
@@ -197,71 +219,65 @@ async def pay_with_sbp(callback: CallbackQuery, state: FSMContext):
             await state.clear()
             return
         
-        # Получаем данные для Lava Pay из .env
-        secret_key = os.getenv("LAVA_SECRET_KEY", "51372c3ef4b5bcefb07c3d0237675258f9088a1a")
-        shop_id = os.getenv("LAVA_SHOP_ID", "e9a3cee7-e740-4422-a0c1-4fba8f7652b9")
-        
-        # Создаем данные для запроса
-        payment_data = {
-            "sum": rubles,
-            "orderId": order_id,
-            "shopId": shop_id,
-            "comment": f"Покупка {stars} звезд для @{target_username}"
-        }
-        
-        # Сериализуем данные в JSON
-        json_str = json.dumps(payment_data)
-        json_bytes = json_str.encode()
-        
-        # Создаем подпись
-        sign = hmac.new(
-            bytes(secret_key, 'UTF-8'),
-            json_bytes,
-            hashlib.sha256
-        ).hexdigest()
-        
-        # Отправляем запрос в Lava API
-        headers = {
-            'Signature': sign,
-            'Accept': 'application/json',
-            'Content-Type': 'application/json'
-        }
-        
-        response = requests.post(
-            'https://api.lava.ru/business/invoice/create',
-            data=json_bytes,
-            headers=headers
-        )
-        
-        response_data = response.json()
-        print(f"Lava API response: {response_data}")
-        
-        if response.status_code == 200 and response_data.get('status_check'):
-            payment_url = response_data.get('data', {}).get('url')
-            
-            await state.update_data(payment_method="СБП (Lava Pay)")
-            
-            keyboard = InlineKeyboardMarkup(inline_keyboard=[
-                [InlineKeyboardButton(text="💳 Оплатить", url=payment_url)],
-                [InlineKeyboardButton(text="✅ Я оплатил(а)", callback_data="check_payment")]
-            ])
-            
-            await callback.message.answer(
-                f"💰 Сумма к оплате: {rubles} RUB\n"
-                f"👤 Получатель: @{target_username}\n\n"
-                f"Для оплаты через СБП нажмите кнопку «Оплатить»\n\n"
-                f"✅ После совершения оплаты нажмите кнопку «Я оплатил(а)»",
-                reply_markup=keyboard
+        user = await db.get_user(str(callback.from_user.id))
+        if not user:
+            await callback.message.answer("❌ Пользователь не найден. Пожалуйста, перезапустите бота командой /start")
+            await state.clear()
+            return
+
+        # Сначала заказ, потом счёт: external_id уникален, поэтому повторное
+        # нажатие не создаст второй счёт, а сбой записи не оставит счёт без заказа
+        try:
+            db_order_id = await db.create_order(
+                user['id'], stars, rubles, orders.CREATED,
+                target_username=target_username,
+                payment_method="СБП (Lava Pay)",
+                external_id=order_id,
+                discount_redemption_id=data.get('discount_redemption_id')
             )
-            
-            await state.set_state(ShopStates.waiting_for_payment)
-        else:
-            print(f"Lava API error: {response_data}")
+        except DiscountAlreadyUsed:
+            await callback.message.answer("⚠️ Скидка по промокоду уже использована в другом заказе. Пожалуйста, начните покупку заново.")
+            await state.clear()
+            return
+        except OrderAlreadyExists:
+            await callback.message.answer("⏳ Счёт на оплату по этому заказу уже создаётся.")
+            return
+        bind(order_id=db_order_id)
+
+        try:
+            invoice = await lava.create_invoice(
+                amount=rubles,
+                order_id=order_id,
+                comment=f"Покупка {stars} звезд для @{target_username}"
+            )
+        except LavaError as e:
+            logger.error("Lava API error: %s", e)
+            await orders.fail_invoice(db, db_order_id)
+            # external_id занят закрытым заказом, повторить СБП можно только с начала
+            await state.update_data(order_id=None)
             await callback.message.answer(
                 "❌ Произошла ошибка при создании платежа через СБП. Пожалуйста, выберите другой способ оплаты."
             )
-    except Exception as e:
-        print(f"Error in pay_with_sbp: {e}")
+            return
+
+        # Заказ подтвердится колбэком Lava по orderId, кнопка «Я оплатил(а)» не нужна
+        await orders.attach_invoice(db, db_order_id)
+
+        keyboard = InlineKeyboardMarkup(inline_keyboard=[
+            [InlineKeyboardButton(text="💳 Оплатить", url=invoice.get('url'))]
+        ])
+
+        await callback.message.answer(
+            f"💰 Сумма к оплате: {rubles} RUB\n"
+            f"👤 Получатель: @{target_username}\n\n"
+            f"Для оплаты через СБП нажмите кнопку «Оплатить»\n\n"
+            f"✅ Оплата подтвердится автоматически, мы сразу уведомим вас о статусе заказа.",
+            reply_markup=keyboard
+        )
+
+        await state.clear()
+    except Exception:
+        logger.exception("Error in pay_with_sbp")
         await callback.message.answer("❌ Произошла ошибка. Пожалуйста, попробуйте позже.")
 
 @router.callback_query(F.data == "pay_card")
@@ -287,6 +303,7 @@ async def pay_with_card(callback: CallbackQuery, state: FSMContext):
         
         await callback.message.answer(
             f"💰 Сумма к оплате: {rubles} RUB\n"
+            f"{format_other_prices(data.get('prices', {}))}"
             f"👤 Получатель: @{target_username}\n\n{PAYMENT_DETAILS}\n\n"
             f"✅ После совершения оплаты нажмите кнопку «Я оплатил(а)»",
             reply_markup=keyboard
@@ -294,12 +311,12 @@ async def pay_with_card(callback: CallbackQuery, state: FSMContext):
         
         await state.set_state(ShopStates.waiting_for_payment)
         
-    except Exception as e:
-        print(f"Error in pay_with_card: {e}")
+    except Exception:
+        logger.exception("Error in pay_with_card")
         await callback.message.answer("❌ Произошла ошибка. Пожалуйста, попробуйте позже.")
 
 @router.callback_query(ShopStates.waiting_for_payment, F.data == "check_payment")
-async def check_payment(callback: CallbackQuery, state: FSMContext):
+async def check_payment(callback: CallbackQuery, state: FSMContext, db: Database, notifier: AdminNotifier):
     try:
         await callback.answer()
         
@@ -316,22 +333,27 @@ async def check_payment(callback: CallbackQuery, state: FSMContext):
             return
             
         user_id = str(callback.from_user.id)
-        user = db.get_user(user_id)
+        user = await db.get_user(user_id)
         
         if not user:
             await callback.message.answer("❌ Пользователь не найден. Пожалуйста, перезапустите бота командой /start")
             await state.clear()
             return
             
-        db_order_id = db.create_order(user['id'], stars, rubles, "pending")
-        
-        admin_keyboard = InlineKeyboardMarkup(inline_keyboard=[
-            [
-                InlineKeyboardButton(text="Подтвердить ✅", callback_data=f"approve_payment_{db_order_id}_{target_username}_{user_id}"),
-                InlineKeyboardButton(text="Отклонить ❌", callback_data=f"reject_payment_{db_order_id}_{user_id}")
-            ],
-            [InlineKeyboardButton(text="Профиль пользователя 👤", url=f"tg://user?id={user_id}")]
-        ])
+        try:
+            db_order_id = await db.create_order(
+                user['id'], stars, rubles, orders.AWAITING_PAYMENT,
+                target_username=target_username,
+                payment_method=payment_method,
+                discount_redemption_id=data.get('discount_redemption_id')
+            )
+        except DiscountAlreadyUsed:
+            await callback.message.answer("⚠️ Скидка по промокоду уже использована в другом заказе. Пожалуйста, начните покупку заново.")
+            await state.clear()
+            return
+        bind(order_id=db_order_id)
+        
+        admin_keyboard = get_order_admin_keyboard(db_order_id, user_id)
         
         admin_message = (
             f"🔔 Новая заявка на покупку звезд!\n\n"
@@ -345,111 +367,110 @@ async def check_payment(callback: CallbackQuery, state: FSMContext):
             f"🧾 ID заказа: {order_id}"
         )
         
-        for admin_id in ADMIN_IDS:
-            try:
-                await callback.bot.send_message(
-                    chat_id=admin_id,
-                    text=admin_message,
-                    reply_markup=admin_keyboard,
-                    parse_mode="HTML"
-                )
-            except Exception as e:
-                print(f"Failed to notify admin {admin_id}: {e}")
-        
         await callback.message.answer(
             "✅ Ваша заявка на покупку успешно отправлена!\n"
             "⏳ Ожидайте подтверждения от администратора.\n"
             "💫 Мы уведомим вас о статусе заказа."
         )
         await state.clear()
+
+        await notifier.notify_order(callback.bot, db_order_id, admin_message, admin_keyboard)
         
-    except Exception as e:
-        print(f"Error in check_payment: {e}")
+    except Exception:
+        logger.exception("Error in check_payment")
         await callback.message.answer("❌ Произошла ошибка при обработке платежа. Пожалуйста, попробуйте позже.")
         await state.clear()
 
-@router.callback_query(F.data.startswith("approve_payment_"))
-async def approve_payment(callback: CallbackQuery):
+@router.callback_query(OrderAction.filter(F.action == "approve"))
+async def approve_payment(callback: CallbackQuery, callback_data: OrderAction, db: Database, notifier: AdminNotifier):
+    await approve_order(callback, callback_data.order_id, db, notifier)
+
+@router.callback_query(OrderAction.filter(F.action == "reject"))
+async def reject_payment(callback: CallbackQuery, callback_data: OrderAction, db: Database, notifier: AdminNotifier):
+    await reject_order(callback, callback_data.order_id, db, notifier)
+
+# Кнопки старого формата approve_payment_{id}_{username}_{uid} в уже отправленных
+# уведомлениях: id заказа всегда третий, остальное берём из базы
+@router.callback_query(F.data.startswith("approve_payment_") | F.data.startswith("reject_payment_"))
+async def legacy_order_action(callback: CallbackQuery, db: Database, notifier: AdminNotifier):
+    try:
+        order_id = int(callback.data.split("_")[2])
+    except (ValueError, IndexError) as e:
+        logger.warning("Error parsing callback data %r: %s", callback.data, e)
+        await callback.answer("❌ Некорректные данные запроса", show_alert=True)
+        return
+
+    if callback.data.startswith("approve_payment_"):
+        await approve_order(callback, order_id, db, notifier)
+    else:
+        await reject_order(callback, order_id, db, notifier)
+
+async def approve_order(callback: CallbackQuery, order_id: int, db: Database, notifier: AdminNotifier):
+    bind(order_id=order_id)
     try:
         if not callback.from_user or callback.from_user.id not in ALLOWED_TO_ADMIN_PANEL_IDS:
             await callback.answer("⛔️ У вас нет прав для этого действия!", show_alert=True)
             return
             
-        try:
-            callback_parts = callback.data.split("_")
-            if len(callback_parts) != 5:
-                raise ValueError("Invalid callback data format")
-            
-            order_id = int(callback_parts[2])
-            username = callback_parts[3]
-            user_id = callback_parts[4]
-            
-            if not username or not user_id:
-                raise ValueError("Missing username or user_id")
-                
-        except (ValueError, IndexError) as e:
-            print(f"Error parsing callback data: {e}")
-            await callback.answer("❌ Некорректные данные запроса", show_alert=True)
-            return
-            
-        order = db.get_order(order_id)
+        order = await db.get_order_with_customer(order_id)
         if not order:
             await callback.answer("❌ Заказ не найден!", show_alert=True)
             return
             
-        if order['status'] != "pending":
-            await callback.answer("⚠️ Этот заказ уже обработан!", show_alert=True)
-            return
-            
         if order['amount_star'] <= 0:
             await callback.answer("❌ Некорректное количество звезд в заказе", show_alert=True)
             return
         
-        if not db.update_order_status(order_id, "completed"):
-            await callback.answer("❌ Ошибка при обновлении статуса заказа", show_alert=True)
+        # Статус проверяется самим UPDATE: из двух одновременных нажатий
+        # пройдёт только одно
+        if not await orders.approve(db, order_id, actor=str(callback.from_user.id)):
+            await callback.answer("⚠️ Этот заказ уже обработан!", show_alert=True)
             return
 
+        user_id = order['customer_telegram_id']
         try:
             await callback.bot.send_message(
                 chat_id=user_id,
-                text=f"✅ Ваш заказ на {order['amount_star']} Telegram звезд для @{username} принят!\n"
+                text=f"✅ Ваш заказ на {order['amount_star']} Telegram звезд для @{order['target_username']} принят!\n"
                      f"⏳ Звезды будут зачислены в течение нескольких минут."
             )
-            
-            await callback.message.edit_text(
-                f"{callback.message.text}\n\n✅ Оплата подтверждена\n⭐️ Звезды будут зачислены вручную",
-                reply_markup=None
-            )
-            
         except Exception as e:
-            print(f"Failed to send notification to user {user_id}: {e}")
+            logger.warning("Failed to send notification to user %s: %s", user_id, e)
             await callback.answer("⚠️ Не удалось отправить уведомление пользователю", show_alert=True)
 
-    except Exception as e:
-        print(f"Error in approve_payment: {e}")
+        await notifier.edit_order_messages(
+            callback.bot,
+            order_id,
+            f"{callback.message.text}\n\n✅ Оплата подтверждена\n⭐️ Звезды будут зачислены вручную",
+            current_message=callback.message
+        )
+
+    except Exception:
+        logger.exception("Error in approve_payment")
         await callback.answer("❌ Произошла ошибка при обработке платежа", show_alert=True)
 
-@router.callback_query(F.data.startswith("reject_payment_"))
-async def reject_payment(callback: CallbackQuery):
+async def reject_order(callback: CallbackQuery, order_id: int, db: Database, notifier: AdminNotifier):
+    bind(order_id=order_id)
     try:
         if callback.from_user.id not in ALLOWED_TO_ADMIN_PANEL_IDS:
             await callback.answer("⛔️ У вас нет прав для этого действия!", show_alert=True)
             return
             
-        order_id = int(callback.data.split("_")[2])
-        user_id = callback.data.split("_")[3]
-        order = db.get_order(order_id)
+        order = await db.get_order_with_customer(order_id)
         
         if not order:
             await callback.answer("❌ Заказ не найден!", show_alert=True)
             return
             
-        if order['status'] != "pending":
-            await callback.answer("⚠️ Этот заказ уже обработан!", show_alert=True)
+        if not await orders.reject(db, order_id, actor=str(callback.from_user.id)):
+            current = await db.get_order(order_id)
+            if current and current['status'] == orders.PAID:
+                await callback.answer("⚠️ Заказ уже оплачен через Lava, отклонить его нельзя", show_alert=True)
+            else:
+                await callback.answer("⚠️ Этот заказ уже обработан!", show_alert=True)
             return
         
-        db.update_order_status(order_id, "rejected")
-        
+        user_id = order['customer_telegram_id']
         try:
             await callback.bot.send_message(
                 chat_id=user_id,
@@ -461,13 +482,15 @@ async def reject_payment(callback: CallbackQuery):
                      f"👨‍💻 Для уточнения деталей обратитесь к администратору @Ara_stars"
             )
         except Exception as e:
-            print(f"Failed to notify user {user_id}: {e}")
+            logger.warning("Failed to notify user %s: %s", user_id, e)
         
-        await callback.message.edit_text(
+        await notifier.edit_order_messages(
+            callback.bot,
+            order_id,
             f"{callback.message.text}\n\n❌ Оплата отклонена",
-            reply_markup=None
+            current_message=callback.message
         )
         
-    except Exception as e:
-        print(f"Error in reject_payment: {e}")
+    except Exception:
+        logger.exception("Error in reject_payment")
         await callback.answer("❌ Произошла ошибка при отклонении платежа", show_alert=True)
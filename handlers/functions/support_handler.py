@@ -1,6 +1,9 @@
+import logging
+
 from aiogram import Router, F	
 from aiogram.types import Message
 router = Router(name='support')
+logger = logging.getLogger(__name__)
 
 @router.message(F.text == "🆘 Поддержка") 
 async def show_support(message: Message):
@@ -10,6 +13,6 @@ async def show_support(message: Message):
             "@Ara_stars\n"
             "Среднее время ответа 5-10 минут"
         )
-    except Exception as e:
-        print(f"Error in show_support: {e}")
+    except Exception:
+        logger.exception("Error in show_support")
         await message.answer("❌ Произошла ошибка. Пожалуйста, попробуйте позже.")
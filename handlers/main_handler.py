@@ -1,60 +1,97 @@
 from aiogram import Router, F
 from aiogram.filters import CommandStart
 from aiogram.fsm.context import FSMContext
-from aiogram.types import Message, CallbackQuery, FSInputFile
+from aiogram.exceptions import TelegramBadRequest
+from aiogram.types import Message, CallbackQuery
 from keyboards.user_keyboards import main_menu_inline, get_help_menu
-from keyboards.admin_keyboards import get_admin_menu
 from utils.constants import ADMIN_IDS
 from utils.database import Database
+from utils.media_cache import MediaCache
 
 router = Router(name='main')
-db = Database()
+
+HOME_LOGO = "./images/logo_for_start.jpg"
+HOME_CAPTION = "🏠 Главное меню"
 
 @router.message(CommandStart())
-async def start_command(message: Message, state: FSMContext):
+async def start_command(message: Message, state: FSMContext, db: Database, media: MediaCache):
     telegram_id = str(message.from_user.id)
     referral_id = message.text.split()[1] if len(message.text.split()) > 1 else None
     
-    user = db.get_user(telegram_id) or db.create_user(telegram_id, referral_id)
+    user = await db.get_user(telegram_id) or await db.create_user(telegram_id, referral_id)
     if not user:
         await message.answer("❌ Ошибка при создании профиля", reply_markup=main_menu_inline())
         return
+    # Пользователь снова написал боту — возвращаем его в рассылки
+    if user['is_blocked']:
+        await db.set_user_blocked(telegram_id, False)
 
-    await open_home(message, message.from_user, state)
+    await open_home(message, message.from_user, state, db, media, send_reply_keyboard=True)
 
 @router.callback_query(F.data == "go_to_home")
-async def go_to_home(callback: CallbackQuery, state: FSMContext):
+async def go_to_home(callback: CallbackQuery, state: FSMContext, db: Database, media: MediaCache):
     await callback.answer()
-    await open_home(callback.message, callback.from_user, state, is_callback=True)
+    await open_home(callback.message, callback.from_user, state, db, media, is_callback=True)
 
 @router.message(F.text.in_(["Вернуться домой 🏠", "🏠 На главную"]))
-async def go_to_home_reply(message: Message, state: FSMContext):
-    await open_home(message, message.from_user, state)
+async def go_to_home_reply(message: Message, state: FSMContext, db: Database, media: MediaCache):
+    await open_home(message, message.from_user, state, db, media)
 
-async def open_home(message: Message, user, state: FSMContext, is_callback: bool = False):
+async def open_home(
+    message: Message,
+    user,
+    state: FSMContext,
+    db: Database,
+    media: MediaCache,
+    is_callback: bool = False,
+    send_reply_keyboard: bool = False
+):
     await state.clear()
     
-    db_user = db.get_user(str(user.id)) or db.create_user(str(user.id))
+    db_user = await db.get_user(str(user.id)) or await db.create_user(str(user.id))
     if not db_user:
         await message.answer("❌ Ошибка получения данных. Используйте /start")
         return
 
-    if user.id in ADMIN_IDS:
-        await message.answer("Админ панель:", reply_markup=get_admin_menu())
-        
-    await message.answer("🔄 Загрузка данных...", reply_markup=get_help_menu())
+    keyboard = main_menu_inline(is_admin=user.id in ADMIN_IDS)
+
+    # Из колбэка перерисовываем сообщение с кнопкой — это один запрос к API
+    if is_callback and await edit_home(message, media, keyboard):
+        return
+
+    # Reply-клавиатуру нельзя совместить с inline-меню, поэтому отдельное
+    # сообщение с ней отправляем только там, где её у пользователя ещё нет
+    if send_reply_keyboard:
+        await message.answer("🔄 Загрузка данных...", reply_markup=get_help_menu())
     try:
-        await message.answer_photo(
-            FSInputFile("./images/logo_for_start.jpg"), 
-            caption="🏠 Главное меню", 
-            reply_markup=main_menu_inline()
+        await media.answer_photo(
+            message,
+            HOME_LOGO,
+            caption=HOME_CAPTION, 
+            reply_markup=keyboard
         )
     except FileNotFoundError:
         await message.answer(
-            "🏠 Главное меню",
-            reply_markup=main_menu_inline()
+            HOME_CAPTION,
+            reply_markup=keyboard
         )
 
+async def edit_home(message: Message, media: MediaCache, keyboard) -> bool:
+    # Текстовое сообщение нельзя превратить в фото через editMessageMedia,
+    # поэтому из него главное меню с логотипом отправляется новым сообщением
+    if not message.photo:
+        return False
+    try:
+        await media.edit_photo(message, HOME_LOGO, caption=HOME_CAPTION, reply_markup=keyboard)
+        return True
+    except TelegramBadRequest as e:
+        # Главное меню уже на экране
+        if "message is not modified" in str(e):
+            return True
+        return False
+    except FileNotFoundError:
+        return False
+
 @router.message(F.text == "/get_id")
 async def get_id(message: Message):
     await message.answer(
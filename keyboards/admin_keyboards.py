@@ -1,8 +1,16 @@
 from aiogram.types import InlineKeyboardButton, InlineKeyboardMarkup
+from keyboards.callbacks import BroadcastAction, OrderAction
+
+def get_admin_menu_rows() -> list:
+    return [
+        [InlineKeyboardButton(text="👥 Управление пользователями", callback_data="manage_users")],
+        [InlineKeyboardButton(text="📢 Рассылка", callback_data="broadcast")],
+        [InlineKeyboardButton(text="🏆 Топ рефералов", callback_data="top_referrers")]
+    ]
 
 def get_admin_menu() -> InlineKeyboardMarkup:
     return InlineKeyboardMarkup(inline_keyboard=[
-        [InlineKeyboardButton(text="👥 Управление пользователями", callback_data="manage_users")],
+        *get_admin_menu_rows(),
         [InlineKeyboardButton(text="🏠 Главное меню", callback_data="to_admin_home_menu")]
     ])
 
@@ -11,3 +19,25 @@ def get_admin_home_menu() -> InlineKeyboardMarkup:
         [InlineKeyboardButton(text="🏠 Главное меню", callback_data="to_admin_home_menu")]
     ])
 
+def get_order_admin_keyboard(order_id: int, user_id: str, can_reject: bool = True) -> InlineKeyboardMarkup:
+    # Оплаченный заказ (СБП через Lava) можно только выполнить
+    actions = [InlineKeyboardButton(text="Подтвердить ✅", callback_data=OrderAction(action="approve", order_id=order_id).pack())]
+    if can_reject:
+        actions.append(InlineKeyboardButton(text="Отклонить ❌", callback_data=OrderAction(action="reject", order_id=order_id).pack()))
+    return InlineKeyboardMarkup(inline_keyboard=[
+        actions,
+        [InlineKeyboardButton(text="Профиль пользователя 👤", url=f"tg://user?id={user_id}")]
+    ])
+
+def get_broadcast_confirm_keyboard() -> InlineKeyboardMarkup:
+    return InlineKeyboardMarkup(inline_keyboard=[
+        [
+            InlineKeyboardButton(text="Отправить ✅", callback_data="broadcast_confirm"),
+            InlineKeyboardButton(text="Отмена ❌", callback_data="broadcast_abort")
+        ]
+    ])
+
+def get_broadcast_progress_keyboard(broadcast_id: int) -> InlineKeyboardMarkup:
+    return InlineKeyboardMarkup(inline_keyboard=[
+        [InlineKeyboardButton(text="⏹ Остановить", callback_data=BroadcastAction(action="cancel", broadcast_id=broadcast_id).pack())]
+    ])
@@ -0,0 +1,14 @@
+from aiogram.filters.callback_data import CallbackData
+
+# callback_data ограничена 64 байтами, поэтому в кнопках только короткие
+# идентификаторы, а всё остальное хендлер берёт из базы
+
+
+class OrderAction(CallbackData, prefix="order"):
+    action: str
+    order_id: int
+
+
+class BroadcastAction(CallbackData, prefix="bc"):
+    action: str
+    broadcast_id: int
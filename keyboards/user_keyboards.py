@@ -1,14 +1,19 @@
 from aiogram.types import InlineKeyboardMarkup, InlineKeyboardButton, ReplyKeyboardMarkup, KeyboardButton
+from keyboards.admin_keyboards import get_admin_menu_rows
 
-def main_menu_inline():
-    return InlineKeyboardMarkup(inline_keyboard=[
+def main_menu_inline(is_admin: bool = False):
+    keyboard = [
         [InlineKeyboardButton(text="💰 Купить звезды", callback_data="buy_stars")],
         [
             InlineKeyboardButton(text="👥 Реферальная система", callback_data="referral_system"),
-            InlineKeyboardButton(text="🎁 Активировать промокод (СКОРО)", callback_data="promocode")
+            InlineKeyboardButton(text="🎁 Активировать промокод", callback_data="promocode")
         ],
         [InlineKeyboardButton(text="⭐️ Отзывы клиентов", url="https://t.me/arastars1")]
-    ])
+    ]
+    # Админское меню встраиваем в главное, чтобы не отправлять отдельное сообщение
+    if is_admin:
+        keyboard.extend(get_admin_menu_rows())
+    return InlineKeyboardMarkup(inline_keyboard=keyboard)
 
 def get_profile_keyboard():
     return InlineKeyboardMarkup(inline_keyboard=[
@@ -1,51 +1,321 @@
 import asyncio
+import logging
 import os
+import signal
+from functools import partial
 from typing import Optional, Union, Dict, Any
 
 from aiogram import Bot, Dispatcher
 from aiogram.client.default import DefaultBotProperties
+from aiogram.webhook.aiohttp_server import setup_application
+from aiohttp import web
 from dotenv import load_dotenv
 
-from middlewares.antiflood import AntiFloodMiddleware
+from middlewares.antiflood import AntiFloodMiddleware, MemoryRateLimitStore, RedisRateLimitStore
+from middlewares.log_context import HandlerContextMiddleware, UpdateContextMiddleware
+from middlewares.metrics import BotAPIMetricsMiddleware, HandlerMetricsMiddleware, UpdateMetricsMiddleware
 from middlewares.private_chat import PrivateChatMiddleware
+from middlewares.rate_governor import RateGovernorMiddleware
+from middlewares.tracing import TracingMiddleware, TracingRequestMiddleware
 from middlewares.work_set import WorkSetMiddleware
+from utils.broadcast import Broadcaster
+from utils.database import Database
+from utils.fsm_storage import SQLiteStorage, build_fsm_storage
+from utils.lava import LavaClient
+from utils.lava_webhook import setup_lava_webhook
+from utils.log import parse_sampling, setup_logging
+from utils.media_cache import MediaCache
+from utils import metrics
+from utils.notifications import AdminNotifier
+from utils.orders import expire_stale
+from utils.pricing import CbrRateSource, PricingEngine
+from utils.profiling import Profiler
+from utils.promocodes import PromocodeService
+from utils.scheduler import Scheduler
+from utils import tracing
+from utils.webhook import DrainingRequestHandler
 
 from handlers.main_handler import router as main_router
 from handlers.functions.shop_handler import router as shop_router
 from handlers.functions.faq_handler import router as faq_router
 from handlers.functions.support_handler import router as support_router
 from handlers.functions.referral_system_handler import router as referral_router
+from handlers.functions.admin_handler import router as admin_router
+from handlers.functions.promocode_handler import router as promocode_router
 
 load_dotenv()
 
+logger = logging.getLogger(__name__)
+
 default_setting = DefaultBotProperties(parse_mode='HTML')
 bot = Bot(os.getenv("BOT_TOKEN"), default=default_setting)
-dp = Dispatcher()
+# Спан запроса включает ожидание в лимитере: медленный апдейт из-за очереди тоже виден
+bot.session.middleware(TracingRequestMiddleware())
+# Все исходящие запросы проходят через общий и початовый лимиты Telegram
+bot.session.middleware(RateGovernorMiddleware(
+    global_rate=float(os.getenv("OUTBOUND_GLOBAL_RATE", "25")),
+    private_rate=float(os.getenv("OUTBOUND_CHAT_RATE", "1")),
+))
+# Регистрируется после лимитера, чтобы ожидание в очереди не попадало в latency API
+bot.session.middleware(BotAPIMetricsMiddleware())
+
+# Единственное хранилище на процесс, доступно хендлерам как аргумент `db`
+db = Database(
+    db_name=os.getenv("DB_PATH", "data/services.db"),
+    pool_size=int(os.getenv("DB_POOL_SIZE", "4")),
+    synchronous=os.getenv("DB_SYNCHRONOUS", "NORMAL"),
+    cache_size=int(os.getenv("DB_CACHE_SIZE", "-16000")),
+    mmap_size=int(os.getenv("DB_MMAP_SIZE", str(64 * 1024 * 1024))),
+    busy_timeout=int(os.getenv("DB_BUSY_TIMEOUT", "5000")),
+    user_cache_size=int(os.getenv("USER_CACHE_SIZE", "10000")),
+    user_cache_ttl=float(os.getenv("USER_CACHE_TTL", "300")),
+)
+lava = LavaClient(
+    shop_id=os.getenv("LAVA_SHOP_ID", "e9a3cee7-e740-4422-a0c1-4fba8f7652b9"),
+    secret_key=os.getenv("LAVA_SECRET_KEY", "51372c3ef4b5bcefb07c3d0237675258f9088a1a"),
+    base_url=os.getenv("LAVA_API_URL", "https://api.lava.ru"),
+    timeout=float(os.getenv("LAVA_TIMEOUT", "10")),
+    max_retries=int(os.getenv("LAVA_MAX_RETRIES", "3")),
+)
+
+# У Database и LavaClient по одному хуку: метрики и трассировка вызываются по очереди
+def call_hooks(*hooks):
+    def hook(*args):
+        for func in hooks:
+            func(*args)
+    return hook
+
+db.query_hook = call_hooks(metrics.observe_db_query, tracing.observe_db_query)
+lava.request_hook = call_hooks(metrics.observe_lava_request, tracing.observe_lava_request)
+metrics.registry.callback("bot_user_cache_hits_total", "Попадания в кэш пользователей", lambda: db.user_cache.hits, kind="counter")
+metrics.registry.callback("bot_user_cache_misses_total", "Промахи кэша пользователей", lambda: db.user_cache.misses, kind="counter")
+metrics.registry.callback("bot_user_cache_size", "Пользователей в кэше", lambda: len(db.user_cache))
+fsm_storage, fsm_isolation = build_fsm_storage(
+    backend=os.getenv("FSM_STORAGE", "sqlite"),
+    db=db,
+    ttl=int(os.getenv("FSM_TTL", "86400")),
+    redis_url=os.getenv("REDIS_URL"),
+)
+media = MediaCache(db)
+notifier = AdminNotifier(db)
+broadcaster = Broadcaster(
+    db,
+    batch_size=int(os.getenv("BROADCAST_BATCH_SIZE", "200")),
+    concurrency=int(os.getenv("BROADCAST_CONCURRENCY", "25")),
+)
+promocode_service = PromocodeService(db, ttl=float(os.getenv("PROMOCODE_CACHE_TTL", "60")))
+profiler = Profiler(directory=os.getenv("PROFILE_DIR", "data/profiles"))
+# Курсы валют по умолчанию берутся у ЦБ РФ; RATES_SOURCE=none оставляет только закреплённые админом
+pricing = PricingEngine(db, source=CbrRateSource() if os.getenv("RATES_SOURCE", "cbr") == "cbr" else None)
+dp = Dispatcher(
+    storage=fsm_storage,
+    events_isolation=fsm_isolation,
+    db=db,
+    lava=lava,
+    media=media,
+    notifier=notifier,
+    broadcaster=broadcaster,
+    promocode_service=promocode_service,
+    profiler=profiler,
+    pricing=pricing,
+)
+
+# Фоновые задачи: зависшие заказы, просроченные FSM-сессии, обслуживание базы
+scheduler = Scheduler()
+scheduler.add_job(
+    "expire_orders",
+    partial(expire_stale, db, max_age=int(os.getenv("ORDER_EXPIRE_AFTER", str(48 * 3600)))),
+    interval=float(os.getenv("ORDER_EXPIRE_INTERVAL", "600")),
+    first_delay=60,
+)
+if isinstance(fsm_storage, SQLiteStorage):
+    scheduler.add_job("purge_fsm", fsm_storage.purge_expired, interval=float(os.getenv("FSM_PURGE_INTERVAL", "3600")))
+scheduler.add_job(
+    "refresh_rates",
+    pricing.refresh_rates,
+    interval=float(os.getenv("RATES_REFRESH_INTERVAL", "3600")),
+    first_delay=0,
+)
+scheduler.add_job("optimize_db", db.optimize, interval=float(os.getenv("DB_OPTIMIZE_INTERVAL", "3600")))
+scheduler.add_job("vacuum_db", db.vacuum, interval=float(os.getenv("DB_VACUUM_INTERVAL", str(7 * 24 * 3600))))
+
+BOT_MODE = os.getenv("BOT_MODE", "polling")
+WEB_HOST = os.getenv("WEB_HOST", "0.0.0.0")
+WEB_PORT = int(os.getenv("WEB_PORT", "8080"))
+WEBHOOK_BASE_URL = os.getenv("WEBHOOK_BASE_URL", "")
+WEBHOOK_PATH = os.getenv("WEBHOOK_PATH", "/telegram/webhook")
+WEBHOOK_SECRET = os.getenv("WEBHOOK_SECRET")
+DROP_PENDING_UPDATES = os.getenv("DROP_PENDING_UPDATES", "false").lower() == "true"
+# Апдейты дольше порога пишутся с деревом спанов в логгер slow_updates; 0 отключает трассировку
+SLOW_UPDATE_THRESHOLD = float(os.getenv("SLOW_UPDATE_THRESHOLD", "1.0"))
+# Метрики отдаются отдельным сервером, наружу его не публикуем; METRICS_PORT=0 отключает
+METRICS_HOST = os.getenv("METRICS_HOST", "127.0.0.1")
+METRICS_PORT = int(os.getenv("METRICS_PORT", "9090") or "0")
+metrics_runner: Optional[web.AppRunner] = None
+
+def build_web_app() -> web.Application:
+    # HTTP-сервер в том же процессе, что и бот: принимает колбэки Lava,
+    # а в режиме вебхука ещё и апдейты Telegram
+    app = web.Application()
+    setup_lava_webhook(
+        app,
+        bot=bot,
+        db=db,
+        notifier=notifier,
+        webhook_key=os.getenv("LAVA_WEBHOOK_KEY") or lava.secret_key,
+        path=os.getenv("LAVA_WEBHOOK_PATH", "/lava/webhook"),
+    )
+    return app
+
+async def on_startup() -> None:
+    global metrics_runner
+    await db.connect()
+    await pricing.load()
+    if METRICS_PORT:
+        metrics_runner = await metrics.start_metrics_server(METRICS_HOST, METRICS_PORT)
+    # Рассылки, прерванные рестартом, продолжаются с сохранённого курсора
+    await broadcaster.resume(bot)
+    scheduler.start()
+    if BOT_MODE == "webhook":
+        await bot.set_webhook(
+            url=f"{WEBHOOK_BASE_URL.rstrip('/')}{WEBHOOK_PATH}",
+            secret_token=WEBHOOK_SECRET,
+            allowed_updates=dp.resolve_used_update_types(),
+            drop_pending_updates=DROP_PENDING_UPDATES,
+        )
+
+async def on_shutdown() -> None:
+    await scheduler.close()
+    await profiler.close()
+    await broadcaster.close()
+    await notifier.close()
+    await lava.close()
+    await db.close()
+    if metrics_runner is not None:
+        await metrics_runner.cleanup()
+
+async def wait_for_stop_signal() -> None:
+    stop_event = asyncio.Event()
+    loop = asyncio.get_running_loop()
+    for sig in (signal.SIGINT, signal.SIGTERM):
+        try:
+            loop.add_signal_handler(sig, stop_event.set)
+        except (NotImplementedError, RuntimeError):
+            # Windows: остаётся штатный KeyboardInterrupt
+            pass
+    await stop_event.wait()
+
+async def run_polling() -> None:
+    runner = web.AppRunner(build_web_app())
+    await runner.setup()
+    try:
+        await web.TCPSite(runner, WEB_HOST, WEB_PORT).start()
+        await bot.delete_webhook(drop_pending_updates=DROP_PENDING_UPDATES)
+        await dp.start_polling(bot)
+    finally:
+        await runner.cleanup()
+
+def check_webhook_config() -> None:
+    if not WEBHOOK_BASE_URL:
+        raise RuntimeError("Для BOT_MODE=webhook нужно указать WEBHOOK_BASE_URL")
+    # Без секрета эндпоинт принимает апдейты от кого угодно
+    if not WEBHOOK_SECRET:
+        raise RuntimeError("Для BOT_MODE=webhook нужно указать WEBHOOK_SECRET")
+
+async def run_webhook() -> None:
+    app = build_web_app()
+    # Вебхук не удаляем при остановке: Telegram копит апдейты, пока
+    # поднимается новая реплика, и ничего не теряется при деплое
+    DrainingRequestHandler(
+        dispatcher=dp,
+        bot=bot,
+        secret_token=WEBHOOK_SECRET,
+        drain_timeout=float(os.getenv("WEBHOOK_DRAIN_TIMEOUT", "30")),
+    ).register(app, path=WEBHOOK_PATH)
+    setup_application(app, dp, bot=bot)
+
+    runner = web.AppRunner(app)
+    await runner.setup()
+    try:
+        await web.TCPSite(runner, WEB_HOST, WEB_PORT).start()
+        await wait_for_stop_signal()
+    finally:
+        await runner.cleanup()
+
+def setup_dispatcher(
+    dispatcher: Dispatcher,
+    antiflood: Optional[AntiFloodMiddleware] = None,
+    slow_update_threshold: float = 0.0
+) -> None:
+    # Общая сборка мидлварей и роутеров: её же использует bench/loadtest.py
+    dispatcher.update.outer_middleware(UpdateContextMiddleware())
+    if slow_update_threshold > 0:
+        dispatcher.update.outer_middleware(TracingMiddleware(slow_update_threshold))
+    dispatcher.update.outer_middleware(UpdateMetricsMiddleware())
+    dispatcher.message.middleware(PrivateChatMiddleware())
+    for observer in (dispatcher.message, dispatcher.callback_query):
+        observer.middleware(HandlerContextMiddleware())
+        observer.middleware(HandlerMetricsMiddleware())
+
+    if antiflood is not None:
+        dispatcher.message.outer_middleware(antiflood)
+        dispatcher.callback_query.outer_middleware(antiflood)
+    # dispatcher.message.middleware(WorkSetMiddleware())
+
+    dispatcher.include_router(main_router)
+    dispatcher.include_router(shop_router)
+    dispatcher.include_router(faq_router)
+    dispatcher.include_router(support_router)
+    dispatcher.include_router(referral_router)
+    dispatcher.include_router(promocode_router)
+    dispatcher.include_router(admin_router)
 
 async def main() -> None:
-    dp.message.middleware(PrivateChatMiddleware())
-    # dp.message.middleware(AntiFloodMiddleware(limit=0.5))
-    # dp.message.middleware(WorkSetMiddleware())
-    
-    dp.include_router(main_router)
-    dp.include_router(shop_router)
-    dp.include_router(faq_router)
-    dp.include_router(support_router)
-    dp.include_router(referral_router)
+    if BOT_MODE == "webhook":
+        check_webhook_config()
+
+    antiflood_store = (
+        RedisRateLimitStore(os.getenv("REDIS_URL"))
+        if os.getenv("ANTIFLOOD_STORE") == "redis" else MemoryRateLimitStore()
+    )
+    antiflood = AntiFloodMiddleware(
+        rate=float(os.getenv("ANTIFLOOD_RATE", "2")),
+        burst=int(os.getenv("ANTIFLOOD_BURST", "5")),
+        store=antiflood_store,
+    )
+    setup_dispatcher(dp, antiflood, SLOW_UPDATE_THRESHOLD)
+
+    dp.startup.register(on_startup)
+    dp.shutdown.register(on_shutdown)
     
     try:
-        await bot.delete_webhook(drop_pending_updates=True)
-        await dp.start_polling(bot, skip_updates=True)
-    except Exception as e:
-        print(f"Ошибка при запуске бота: {e}")
+        if BOT_MODE == "webhook":
+            await run_webhook()
+        else:
+            await run_polling()
+    except Exception:
+        logger.exception("Ошибка при запуске бота")
     finally:
         await bot.session.close()
 
 if __name__ == '__main__':
+    # Записи пишет фоновый поток, хендлеры только кладут их в очередь.
+    # aiogram.event пишет строку на каждый апдейт, по умолчанию оставляем десятую часть
+    log_listener = setup_logging(
+        level=os.getenv("LOG_LEVEL", "INFO"),
+        path=os.getenv("LOG_FILE") or None,
+        max_bytes=int(os.getenv("LOG_MAX_BYTES", str(10 * 1024 * 1024))),
+        backup_count=int(os.getenv("LOG_BACKUP_COUNT", "5")),
+        sampling=parse_sampling(os.getenv("LOG_SAMPLING", "aiogram.event=0.1,utils.broadcast=0.1")),
+        logger_files={"slow_updates": os.getenv("SLOW_UPDATE_LOG", "logs/slow_updates.log")},
+    )
     try:
-        print("Бот стартовал :)")
+        logger.info("Бот стартовал :)")
         asyncio.run(main())
     except KeyboardInterrupt:
-        print("Бот остановлен :(")
-    except Exception as e:
-        print(f"Произошла ошибка: {e}")
\ No newline at end of file
+        logger.info("Бот остановлен :(")
+    except Exception:
+        logger.exception("Произошла ошибка")
+        raise SystemExit(1)
+    finally:
+        log_listener.stop()
\ No newline at end of file
@@ -1,23 +1,112 @@
-from aiogram import BaseMiddleware
-from aiogram.types import Message
 import time
+from typing import Optional, Tuple, Union
+
+from aiogram import BaseMiddleware
+from aiogram.types import Message, CallbackQuery
+from utils.cache import TTLCache
+from utils.constants import ADMIN_IDS
+
+
+class MemoryRateLimitStore:
+    """Token bucket на пользователя в памяти процесса.
+
+    Корзины лежат в TTLCache: полностью восстановившаяся корзина ничем не
+    отличается от отсутствующей, поэтому её можно выбросить по TTL, а общее
+    число корзин ограничено max_size.
+    """
+
+    def __init__(self, max_size: int = 100000):
+        self.max_size = max_size
+        self._buckets: Optional[TTLCache] = None
+
+    async def hit(self, key: str, rate: float, burst: int) -> Tuple[bool, bool]:
+        if self._buckets is None:
+            self._buckets = TTLCache(max_size=self.max_size, ttl=burst / rate)
+
+        now = time.monotonic()
+        tokens, updated_at, warned = self._buckets.get(key, (float(burst), now, False))
+        tokens = min(float(burst), tokens + (now - updated_at) * rate)
+
+        if tokens >= 1:
+            self._buckets.set(key, (tokens - 1, now, False))
+            return True, False
+
+        self._buckets.set(key, (tokens, now, True))
+        return False, not warned
+
+
+class RedisRateLimitStore:
+    """Тот же token bucket в Redis: лимит общий для всех воркеров."""
+
+    SCRIPT = """
+    local tokens = tonumber(redis.call('HGET', KEYS[1], 'tokens'))
+    local updated_at = tonumber(redis.call('HGET', KEYS[1], 'updated_at'))
+    local warned = tonumber(redis.call('HGET', KEYS[1], 'warned')) or 0
+    local rate = tonumber(ARGV[1])
+    local burst = tonumber(ARGV[2])
+    local now = tonumber(ARGV[3])
+    if tokens == nil then
+        tokens = burst
+        updated_at = now
+    end
+    tokens = math.min(burst, tokens + (now - updated_at) * rate)
+    local allowed = 0
+    local first_rejection = 0
+    if tokens >= 1 then
+        tokens = tokens - 1
+        allowed = 1
+        warned = 0
+    else
+        if warned == 0 then first_rejection = 1 end
+        warned = 1
+    end
+    redis.call('HSET', KEYS[1], 'tokens', tokens, 'updated_at', now, 'warned', warned)
+    redis.call('PEXPIRE', KEYS[1], math.ceil(burst / rate * 1000))
+    return {allowed, first_rejection}
+    """
+
+    def __init__(self, redis_url: str, prefix: str = "antiflood"):
+        try:
+            from redis.asyncio import Redis
+        except ImportError:
+            raise RuntimeError("Для ANTIFLOOD_STORE=redis установите пакет redis")
+
+        self.redis = Redis.from_url(redis_url)
+        self.prefix = prefix
+        self._script = self.redis.register_script(self.SCRIPT)
+
+    async def hit(self, key: str, rate: float, burst: int) -> Tuple[bool, bool]:
+        allowed, first_rejection = await self._script(
+            keys=[f"{self.prefix}:{key}"],
+            args=[rate, burst, time.time()]
+        )
+        return bool(allowed), bool(first_rejection)
+
 
 class AntiFloodMiddleware(BaseMiddleware):
-    def __init__(self, limit: int):
-        super().__init__()
-        self.limit = limit
-        self.user_timestamps = {}
+    """Ограничение частоты сообщений и нажатий кнопок.
 
-    async def __call__(self, handler, event: Message, data):
-        current_time = time.time()
-        user_id = event.from_user.id
+    Каждому пользователю доступно burst событий подряд, дальше — rate событий
+    в секунду. О превышении лимита предупреждаем один раз, пока корзина не
+    восстановится, чтобы не отвечать флудеру на каждое сообщение.
+    """
+
+    def __init__(self, rate: float = 2.0, burst: int = 5, store=None):
+        super().__init__()
+        self.rate = rate
+        self.burst = burst
+        self.store = store or MemoryRateLimitStore()
 
-        if user_id in self.user_timestamps:
-            last_message_time = self.user_timestamps[user_id]
-            if current_time - last_message_time < self.limit:
-                await event.answer("Вы отправляете сообщения слишком быстро.")
-                return
+    async def __call__(self, handler, event: Union[Message, CallbackQuery], data):
+        user = event.from_user
+        if not user or user.id in ADMIN_IDS:
+            return await handler(event, data)
 
-        self.user_timestamps[user_id] = current_time
+        allowed, first_rejection = await self.store.hit(str(user.id), self.rate, self.burst)
+        if allowed:
+            return await handler(event, data)
 
-        return await handler(event, data)
+        if isinstance(event, CallbackQuery):
+            await event.answer("Вы нажимаете слишком быстро.", show_alert=first_rejection)
+        elif first_rejection:
+            await event.answer("Вы отправляете сообщения слишком быстро.")
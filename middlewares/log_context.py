@@ -0,0 +1,22 @@
+from aiogram import BaseMiddleware
+from aiogram.types import Update
+
+from utils.log import bind, log_context
+
+
+class UpdateContextMiddleware(BaseMiddleware):
+    """Outer-middleware на dp.update: update_id и user_id во всех логах апдейта."""
+
+    async def __call__(self, handler, event: Update, data):
+        user = data.get("event_from_user")
+        with log_context(update_id=event.update_id, user_id=user.id if user else None):
+            return await handler(event, data)
+
+
+class HandlerContextMiddleware(BaseMiddleware):
+    """Inner-middleware: имя хендлера, выбранного роутером."""
+
+    async def __call__(self, handler, event, data):
+        handler_object = data.get("handler")
+        bind(handler=getattr(getattr(handler_object, "callback", None), "__name__", None))
+        return await handler(event, data)
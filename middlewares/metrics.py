@@ -0,0 +1,57 @@
+import time
+
+from aiogram import BaseMiddleware
+from aiogram.client.session.middlewares.base import BaseRequestMiddleware
+from aiogram.types import Update
+
+from utils.metrics import (
+    BOT_API_DURATION, BOT_API_ERRORS, HANDLER_DURATION, HANDLER_ERRORS,
+    UPDATE_DURATION, UPDATE_ERRORS, UPDATES,
+)
+
+
+class UpdateMetricsMiddleware(BaseMiddleware):
+    """Outer-middleware на dp.update: время и ошибки по типу апдейта."""
+
+    async def __call__(self, handler, event: Update, data):
+        update_type = event.event_type
+        started = time.perf_counter()
+        try:
+            return await handler(event, data)
+        except Exception:
+            UPDATE_ERRORS.inc(update_type)
+            raise
+        finally:
+            UPDATES.inc(update_type)
+            UPDATE_DURATION.observe(time.perf_counter() - started, update_type)
+
+
+class HandlerMetricsMiddleware(BaseMiddleware):
+    """Inner-middleware: время конкретного хендлера, выбранного роутером."""
+
+    async def __call__(self, handler, event, data):
+        handler_object = data.get("handler")
+        name = getattr(getattr(handler_object, "callback", None), "__name__", "unknown")
+        started = time.perf_counter()
+        try:
+            return await handler(event, data)
+        except Exception:
+            HANDLER_ERRORS.inc(name)
+            raise
+        finally:
+            HANDLER_DURATION.observe(time.perf_counter() - started, name)
+
+
+class BotAPIMetricsMiddleware(BaseRequestMiddleware):
+    """Время запросов к Bot API по методам и ошибки по типу исключения."""
+
+    async def __call__(self, make_request, bot, method):
+        api_method = getattr(method, "__api_method__", type(method).__name__)
+        started = time.perf_counter()
+        try:
+            return await make_request(bot, method)
+        except Exception as e:
+            BOT_API_ERRORS.inc(api_method, type(e).__name__)
+            raise
+        finally:
+            BOT_API_DURATION.observe(time.perf_counter() - started, api_method)
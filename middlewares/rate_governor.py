@@ -0,0 +1,148 @@
+import asyncio
+import heapq
+import itertools
+import time
+from contextlib import contextmanager
+from contextvars import ContextVar
+from typing import List, Optional, Tuple
+
+from aiogram.client.session.middlewares.base import BaseRequestMiddleware
+from aiogram.exceptions import TelegramRetryAfter
+from utils.cache import TTLCache
+
+# Меньшее значение — выше приоритет. Ответы пользователям и админам идут
+# раньше массовых рассылок, которые помечают себя через bulk_priority()
+PRIORITY_INTERACTIVE = 0
+PRIORITY_BULK = 10
+
+send_priority: ContextVar[int] = ContextVar("send_priority", default=PRIORITY_INTERACTIVE)
+
+
+@contextmanager
+def bulk_priority():
+    token = send_priority.set(PRIORITY_BULK)
+    try:
+        yield
+    finally:
+        send_priority.reset(token)
+
+
+class PriorityTokenBucket:
+    """Token bucket, который выдаёт токены ожидающим в порядке приоритета.
+
+    Фоновой задачи нет: ожидающие лежат в куче, а следующее пополнение
+    планируется через call_later только когда кто-то ждёт.
+    """
+
+    def __init__(self, rate: float, burst: int):
+        self.rate = rate
+        self.burst = burst
+        self.tokens = float(burst)
+        self.updated_at = time.monotonic()
+        self.paused_until = 0.0
+        self._waiters: List[Tuple[int, int, asyncio.Future]] = []
+        self._counter = itertools.count()
+        self._timer: Optional[asyncio.TimerHandle] = None
+
+    async def acquire(self, priority: int = PRIORITY_INTERACTIVE):
+        future = asyncio.get_running_loop().create_future()
+        heapq.heappush(self._waiters, (priority, next(self._counter), future))
+        self._release_waiters()
+        await future
+
+    def pause(self, seconds: float):
+        self.paused_until = max(self.paused_until, time.monotonic() + seconds)
+        self.tokens = 0.0
+
+    def _refill(self, now: float):
+        if now < self.paused_until:
+            self.updated_at = now
+            return
+        start = max(self.updated_at, self.paused_until)
+        self.tokens = min(float(self.burst), self.tokens + (now - start) * self.rate)
+        self.updated_at = now
+
+    def _release_waiters(self):
+        if self._timer is not None:
+            self._timer.cancel()
+            self._timer = None
+        now = time.monotonic()
+        self._refill(now)
+
+        while self._waiters and self._waiters[0][2].done():
+            heapq.heappop(self._waiters)
+
+        while self._waiters and self.tokens >= 1 and now >= self.paused_until:
+            _, _, future = heapq.heappop(self._waiters)
+            if future.done():
+                continue
+            self.tokens -= 1
+            future.set_result(None)
+
+        if self._waiters:
+            delay = max(self.paused_until - now, (1 - self.tokens) / self.rate, 0.001)
+            self._timer = asyncio.get_running_loop().call_later(delay, self._release_waiters)
+
+
+class RateGovernorMiddleware(BaseRequestMiddleware):
+    """Исходящие запросы к Bot API в пределах лимитов Telegram.
+
+    Каждый запрос, адресованный чату, сначала ждёт токен лимита этого чата
+    (около 1 сообщения в секунду в личке и 20 в минуту в группе), затем токен
+    общего лимита бота (около 30 в секунду). rate + burst задают максимум
+    запросов в любом окне в 1 секунду, поэтому по умолчанию это 25 + 5 на бот
+    и 1 + 2 на чат. На TelegramRetryAfter ставим
+    лимит чата на паузу на указанное время и повторяем запрос.
+    """
+
+    def __init__(
+        self,
+        global_rate: float = 25.0,
+        global_burst: int = 5,
+        private_rate: float = 1.0,
+        group_rate: float = 20 / 60,
+        chat_burst: int = 2,
+        max_retries: int = 3,
+    ):
+        self.global_bucket = PriorityTokenBucket(global_rate, global_burst)
+        self.private_rate = private_rate
+        self.group_rate = group_rate
+        self.chat_burst = chat_burst
+        self.max_retries = max_retries
+        # Бакет без ожидающих через минуту простоя полностью восстановлен,
+        # его можно забыть
+        self._chat_buckets = TTLCache(max_size=100000, ttl=60)
+
+    def _chat_bucket(self, chat_id) -> PriorityTokenBucket:
+        # chat_id приходит и числом, и строкой ("123", "@channel")
+        try:
+            chat_id = int(chat_id)
+        except (TypeError, ValueError):
+            pass
+        bucket = self._chat_buckets.get(chat_id)
+        if bucket is None:
+            is_group = not isinstance(chat_id, int) or chat_id < 0
+            bucket = PriorityTokenBucket(self.group_rate if is_group else self.private_rate, self.chat_burst)
+        self._chat_buckets.set(chat_id, bucket)
+        return bucket
+
+    async def __call__(self, make_request, bot, method):
+        chat_id = getattr(method, "chat_id", None)
+        if chat_id is None:
+            return await make_request(bot, method)
+
+        priority = send_priority.get()
+        chat_bucket = self._chat_bucket(chat_id)
+
+        for attempt in range(self.max_retries + 1):
+            await chat_bucket.acquire(priority)
+            await self.global_bucket.acquire(priority)
+            try:
+                return await make_request(bot, method)
+            except TelegramRetryAfter as e:
+                if attempt >= self.max_retries:
+                    raise
+                chat_bucket.pause(e.retry_after)
+                # Если общий лимит исчерпан, 429 скорее всего общий для бота
+                if self.global_bucket.tokens < 1:
+                    self.global_bucket.pause(e.retry_after)
@@ -0,0 +1,45 @@
+import logging
+
+from aiogram import BaseMiddleware
+from aiogram.client.session.middlewares.base import BaseRequestMiddleware
+from aiogram.types import Update
+
+from utils.tracing import span, start_trace
+
+slow_logger = logging.getLogger("slow_updates")
+
+
+class TracingMiddleware(BaseMiddleware):
+    """Outer-middleware на dp.update: корневой спан на каждый апдейт.
+
+    Апдейт дольше slow_threshold секунд пишется в логгер slow_updates вместе
+    с деревом спанов (запросы к базе, Bot API и Lava). Регистрируется после
+    UpdateContextMiddleware, чтобы запись получила update_id и user_id.
+    """
+
+    def __init__(self, slow_threshold: float = 1.0):
+        self.slow_threshold = slow_threshold
+
+    async def __call__(self, handler, event: Update, data):
+        with start_trace("update", type=event.event_type) as root:
+            error = None
+            try:
+                return await handler(event, data)
+            except Exception as e:
+                error = e
+                raise
+            finally:
+                root.finish(error)
+                if root.duration >= self.slow_threshold:
+                    slow_logger.warning(
+                        "Slow update: %.0f ms", root.duration * 1000,
+                        extra={"trace": root.to_dict()}
+                    )
+
+
+class TracingRequestMiddleware(BaseRequestMiddleware):
+    """Дочерний спан на каждый запрос к Bot API, включая ожидание в лимитере."""
+
+    async def __call__(self, make_request, bot, method):
+        with span(f"api.{getattr(method, '__api_method__', type(method).__name__)}"):
+            return await make_request(bot, method)
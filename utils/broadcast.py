@@ -0,0 +1,204 @@
+import asyncio
+import logging
+import time
+from typing import Dict, Optional
+
+from aiogram import Bot
+from aiogram.exceptions import TelegramBadRequest, TelegramForbiddenError
+from aiogram.types import InlineKeyboardMarkup
+
+from keyboards.admin_keyboards import get_broadcast_progress_keyboard
+from middlewares.rate_governor import bulk_priority
+from utils.database import Database
+
+logger = logging.getLogger(__name__)
+
+SENT = "sent"
+BLOCKED = "blocked"
+FAILED = "failed"
+
+STATUS_TITLES = {
+    "running": "⏳ идёт",
+    "finished": "✅ завершена",
+    "cancelled": "⏹ остановлена",
+}
+
+
+class Broadcaster:
+    """Рассылка сообщения всем пользователям бота.
+
+    Получатели читаются из users пачками по курсору id, поэтому таблица
+    целиком в память не загружается. После каждой пачки курсор и счётчики
+    сохраняются в broadcasts, и незавершённая рассылка продолжается после
+    рестарта с того же места. Скорость отправки ограничивает
+    RateGovernorMiddleware: рассылка идёт с низким приоритетом и не мешает
+    ответам пользователям. Заблокировавшие бота отмечаются в users.is_blocked
+    и в следующие рассылки не попадают.
+    """
+
+    def __init__(
+        self,
+        db: Database,
+        batch_size: int = 200,
+        concurrency: int = 25,
+        progress_interval: float = 3.0,
+    ):
+        self.db = db
+        self.batch_size = batch_size
+        self.concurrency = concurrency
+        self.progress_interval = progress_interval
+        self._tasks: Dict[int, asyncio.Task] = {}
+
+    async def start(self, bot: Bot, text: str, admin_chat_id: int) -> int:
+        total = await self.db.count_broadcast_recipients()
+        broadcast_id = await self.db.create_broadcast(text, admin_chat_id, total)
+        broadcast = await self.db.get_broadcast(broadcast_id)
+
+        try:
+            message = await bot.send_message(
+                chat_id=admin_chat_id,
+                text=self._progress_text(broadcast, 0.0),
+                reply_markup=get_broadcast_progress_keyboard(broadcast_id)
+            )
+            await self.db.set_broadcast_message(broadcast_id, message.message_id)
+            broadcast['progress_message_id'] = message.message_id
+        except Exception as e:
+            logger.warning("Failed to send broadcast %s progress message: %s", broadcast_id, e)
+
+        self._spawn(bot, broadcast)
+        return broadcast_id
+
+    async def resume(self, bot: Bot) -> int:
+        broadcasts = await self.db.get_running_broadcasts()
+        for broadcast in broadcasts:
+            if broadcast['id'] not in self._tasks:
+                self._spawn(bot, broadcast)
+        return len(broadcasts)
+
+    async def cancel(self, broadcast_id: int) -> bool:
+        if not await self.db.finish_broadcast(broadcast_id, "cancelled"):
+            return False
+        task = self._tasks.get(broadcast_id)
+        if task:
+            task.cancel()
+            await asyncio.gather(task, return_exceptions=True)
+        return True
+
+    def _spawn(self, bot: Bot, broadcast: Dict):
+        task = asyncio.create_task(self._run(bot, broadcast))
+        self._tasks[broadcast['id']] = task
+        task.add_done_callback(lambda _: self._tasks.pop(broadcast['id'], None))
+
+    async def _deliver(self, bot: Bot, semaphore: asyncio.Semaphore, telegram_id: str, text: str) -> str:
+        async with semaphore:
+            with bulk_priority():
+                try:
+                    await bot.send_message(chat_id=int(telegram_id), text=text)
+                    return SENT
+                except TelegramForbiddenError:
+                    return BLOCKED
+                except TelegramBadRequest as e:
+                    # Аккаунт удалён — писать туда больше нечего
+                    if "chat not found" in str(e).lower():
+                        return BLOCKED
+                    logger.info("Broadcast to %s failed: %s", telegram_id, e)
+                    return FAILED
+                except Exception as e:
+                    logger.info("Broadcast to %s failed: %s", telegram_id, e)
+                    return FAILED
+
+    async def _run(self, bot: Bot, broadcast: Dict):
+        broadcast_id = broadcast['id']
+        semaphore = asyncio.Semaphore(self.concurrency)
+        processed_before = broadcast['sent'] + broadcast['failed'] + broadcast['blocked']
+        started_at = time.monotonic()
+        reported_at = started_at
+
+        try:
+            while True:
+                batch = await self.db.get_broadcast_recipients(broadcast['last_user_id'], self.batch_size)
+                if not batch:
+                    break
+
+                results = await asyncio.gather(
+                    *(self._deliver(bot, semaphore, telegram_id, broadcast['text']) for _, telegram_id in batch)
+                )
+                blocked_ids = [telegram_id for (_, telegram_id), result in zip(batch, results) if result == BLOCKED]
+                await self.db.mark_users_blocked(blocked_ids)
+
+                broadcast['last_user_id'] = batch[-1][0]
+                broadcast['sent'] += results.count(SENT)
+                broadcast['failed'] += results.count(FAILED)
+                broadcast['blocked'] += len(blocked_ids)
+                await self.db.save_broadcast_progress(
+                    broadcast_id,
+                    broadcast['last_user_id'],
+                    broadcast['sent'],
+                    broadcast['failed'],
+                    broadcast['blocked']
+                )
+
+                now = time.monotonic()
+                if now - reported_at >= self.progress_interval:
+                    reported_at = now
+                    await self._report(bot, broadcast, self._rate(broadcast, processed_before, started_at))
+
+            if await self.db.finish_broadcast(broadcast_id, "finished"):
+                broadcast['status'] = "finished"
+        except asyncio.CancelledError:
+            # Остановка админом уже записана в базе, а при выключении бота
+            # рассылка остаётся running и продолжится после рестарта
+            current = await self.db.get_broadcast(broadcast_id)
+            if current and current['status'] == "cancelled":
+                broadcast['status'] = "cancelled"
+                await self._report(bot, broadcast, self._rate(broadcast, processed_before, started_at))
+            raise
+        except Exception:
+            logger.exception("Error in broadcast %s", broadcast_id)
+            return
+
+        await self._report(bot, broadcast, self._rate(broadcast, processed_before, started_at))
+
+    @staticmethod
+    def _rate(broadcast: Dict, processed_before: int, started_at: float) -> float:
+        elapsed = time.monotonic() - started_at
+        processed = broadcast['sent'] + broadcast['failed'] + broadcast['blocked'] - processed_before
+        return processed / elapsed if elapsed > 0 else 0.0
+
+    @staticmethod
+    def _progress_text(broadcast: Dict, rate: float) -> str:
+        processed = broadcast['sent'] + broadcast['failed'] + broadcast['blocked']
+        return (
+            f"📢 Рассылка #{broadcast['id']}: {STATUS_TITLES.get(broadcast['status'], broadcast['status'])}\n\n"
+            f"📊 Обработано: {processed} из {broadcast['total']}\n"
+            f"✅ Доставлено: {broadcast['sent']}\n"
+            f"🚫 Заблокировали бота: {broadcast['blocked']}\n"
+            f"⚠️ Ошибки: {broadcast['failed']}\n"
+            f"⚡️ Скорость: {rate:.1f} сообщ./сек"
+        )
+
+    async def _report(self, bot: Bot, broadcast: Dict, rate: float):
+        if not broadcast['admin_chat_id'] or not broadcast['progress_message_id']:
+            return
+        reply_markup: Optional[InlineKeyboardMarkup] = (
+            get_broadcast_progress_keyboard(broadcast['id']) if broadcast['status'] == "running" else None
+        )
+        try:
+            await bot.edit_message_text(
+                chat_id=broadcast['admin_chat_id'],
+                message_id=broadcast['progress_message_id'],
+                text=self._progress_text(broadcast, rate),
+                reply_markup=reply_markup
+            )
+        except TelegramBadRequest as e:
+            if "message is not modified" not in str(e):
+                logger.warning("Failed to update broadcast %s progress: %s", broadcast['id'], e)
+        except Exception as e:
+            logger.warning("Failed to update broadcast %s progress: %s", broadcast['id'], e)
+
+    async def close(self):
+        tasks = list(self._tasks.values())
+        for task in tasks:
+            task.cancel()
+        if tasks:
+            await asyncio.gather(*tasks, return_exceptions=True)
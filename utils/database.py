@@ -1,156 +1,786 @@
-import sqlite3
-from typing import Optional, Tuple, Dict, Any, List, Union
-import json
-from datetime import datetime
+import asyncio
+import logging
+import os
+import time
+from contextlib import asynccontextmanager
+from typing import Optional, Tuple, Dict, Any, List, AsyncIterator, Awaitable, Callable, Sequence
+
+import aiosqlite
+
+from utils.cache import TTLCache
+from utils.migrations import apply_migrations
+
+logger = logging.getLogger(__name__)
+
+USER_FIELDS = ['id', 'telegram_id', 'balance', 'referral_telegram_id', 'is_blocked']
+PROMOCODE_FIELDS = ['id', 'code', 'discount', 'amount_money', 'max_uses', 'uses', 'is_used']
+ORDER_FIELDS = [
+    'id', 'user_id', 'amount_star', 'amount_ruble', 'status', 'created_at',
+    'target_username', 'payment_method', 'external_id', 'paid_at'
+]
+BROADCAST_FIELDS = [
+    'id', 'text', 'status', 'last_user_id', 'total', 'sent', 'failed', 'blocked',
+    'admin_chat_id', 'progress_message_id', 'created_at', 'finished_at'
+]
+
+# aiosqlite бросает ValueError, если соединение уже закрыто
+CONNECTION_ERRORS = (aiosqlite.OperationalError, aiosqlite.ProgrammingError, ValueError)
+CONNECTION_ERROR_MARKERS = ("closed", "no active connection", "unable to open", "disk i/o error", "not open")
+
+
+class DiscountAlreadyUsed(Exception):
+    """Скидка по промокоду уже привязана к другому заказу."""
+
+
+class OrderAlreadyExists(Exception):
+    """Заказ с таким external_id уже создан (например, повторное нажатие кнопки)."""
+
+
+def is_connection_error(error: Exception) -> bool:
+    message = str(error).lower()
+    return any(marker in message for marker in CONNECTION_ERROR_MARKERS)
+
 
 class Database:
-    def __init__(self, db_name="data/services.db"):
+    """Асинхронный слой доступа к services.db.
+
+    Один экземпляр на процесс: создаётся в main.py и передаётся в хендлеры
+    через workflow data диспетчера. База открывается в режиме WAL, поэтому
+    пул читающих соединений работает параллельно с единственным пишущим.
+    Каждое соединение aiosqlite живёт в собственном потоке, так что запросы
+    не блокируют event loop.
+    """
+
+    def __init__(
+        self,
+        db_name: str = "data/services.db",
+        pool_size: int = 4,
+        synchronous: str = "NORMAL",
+        cache_size: int = -16000,
+        mmap_size: int = 64 * 1024 * 1024,
+        busy_timeout: int = 5000,
+        user_cache_size: int = 10000,
+        user_cache_ttl: float = 300.0,
+    ):
         self.db_name = db_name
-        self.connection = None
-        self.cursor = None
-        self.connect()
-        self.create_tables()
+        self.pool_size = pool_size
+        self.pragmas = {
+            "journal_mode": "WAL",
+            "synchronous": synchronous,
+            "cache_size": cache_size,
+            "mmap_size": mmap_size,
+            "busy_timeout": busy_timeout,
+        }
+        self._pool: Optional[asyncio.Queue] = None
+        self._connections: List[aiosqlite.Connection] = []
+        self._writer_connection: Optional[aiosqlite.Connection] = None
+        self._writer_lock = asyncio.Lock()
+        self._connect_lock = asyncio.Lock()
+        # Строки users читаются почти в каждом апдейте, а меняются редко.
+        # Все изменения пользователя идут через методы ниже и сбрасывают запись
+        self.user_cache = TTLCache(max_size=user_cache_size, ttl=user_cache_ttl)
+        self._user_cache_version = 0
+        # Необязательный колбэк (name, duration, write, error) после каждого запроса
+        self.query_hook: Optional[Callable[[str, float, bool, Optional[Exception]], None]] = None
 
-    def connect(self):
+    async def _open_connection(self, readonly: bool = False) -> aiosqlite.Connection:
+        connection = await aiosqlite.connect(self.db_name, timeout=self.pragmas["busy_timeout"] / 1000)
         try:
-            self.connection = sqlite3.connect(self.db_name, check_same_thread=False)
-            self.cursor = self.connection.cursor()
-        except sqlite3.Error as e:
-            print(f"Ошибка подключения к базе данных: {e}")
+            for name, value in self.pragmas.items():
+                await connection.execute(f"PRAGMA {name} = {value}")
+            if readonly:
+                await connection.execute("PRAGMA query_only = 1")
+        except Exception:
+            # Поток незакрытого соединения aiosqlite не даст процессу завершиться
+            await connection.close()
+            raise
+        return connection
+
+    async def connect(self):
+        async with self._connect_lock:
+            if self._pool is not None:
+                return
+
+            directory = os.path.dirname(self.db_name)
+            if directory:
+                os.makedirs(directory, exist_ok=True)
+
+            pool = asyncio.Queue(maxsize=self.pool_size)
+            try:
+                # Пишущее соединение открываем первым: оно переводит файл в WAL
+                self._writer_connection = await self._open_connection()
+                for _ in range(self.pool_size):
+                    connection = await self._open_connection(readonly=True)
+                    self._connections.append(connection)
+                    pool.put_nowait(connection)
+            except Exception as e:
+                logger.error("Ошибка подключения к базе данных: %s", e)
+                await self._close_connections()
+                raise
 
-    def ensure_connection(self):
+            self._pool = pool
+            try:
+                await self.migrate()
+            except Exception:
+                # Иначе потоки aiosqlite не дадут процессу завершиться
+                await self._close_connections()
+                self._pool = None
+                raise
+
+    async def close(self):
+        async with self._connect_lock:
+            await self._close_connections()
+            self._pool = None
+
+    async def _close_connections(self):
+        connections = self._connections + ([self._writer_connection] if self._writer_connection else [])
+        for connection in connections:
+            try:
+                await connection.close()
+            except Exception as e:
+                logger.warning("Ошибка при закрытии соединения с базой данных: %s", e)
+        self._connections = []
+        self._writer_connection = None
+
+    async def _reopen(self, connection: Optional[aiosqlite.Connection], readonly: bool) -> aiosqlite.Connection:
+        if connection is not None:
+            try:
+                await connection.close()
+            except Exception:
+                pass
+        new_connection = await self._open_connection(readonly=readonly)
+        self._connections = [new_connection if c is connection else c for c in self._connections]
+        return new_connection
+
+    @asynccontextmanager
+    async def acquire(self) -> AsyncIterator[aiosqlite.Connection]:
+        """Читающее соединение из пула."""
+        if self._pool is None:
+            await self.connect()
+
+        pool = self._pool
+        connection = await pool.get()
+        try:
+            yield connection
+        finally:
+            pool.put_nowait(connection)
+
+    @asynccontextmanager
+    async def writer(self) -> AsyncIterator[aiosqlite.Connection]:
+        """Единственное пишущее соединение; записи выполняются строго по очереди."""
+        if self._pool is None:
+            await self.connect()
+
+        async with self._writer_lock:
+            yield self._writer_connection
+
+    async def _run(
+        self,
+        operation: Callable[[aiosqlite.Connection], Awaitable[Any]],
+        write: bool = False,
+        *,
+        name: str
+    ) -> Any:
+        if self.query_hook is None:
+            return await self._execute(operation, write)
+
+        # Время считается вместе с ожиданием соединения из пула и writer lock:
+        # очередь к базе — такая же часть задержки, как сам запрос
+        started = time.perf_counter()
+        error = None
+        try:
+            return await self._execute(operation, write)
+        except Exception as e:
+            error = e
+            raise
+        finally:
+            self.query_hook(name, time.perf_counter() - started, write, error)
+
+    async def _execute(self, operation: Callable[[aiosqlite.Connection], Awaitable[Any]], write: bool = False) -> Any:
+        # Соединение не проверяется перед каждым запросом: если оно оказалось
+        # закрытым или сломанным, переподключаемся и повторяем запрос один раз
+        if self._pool is None:
+            await self.connect()
+
+        if write:
+            async with self._writer_lock:
+                try:
+                    return await operation(self._writer_connection)
+                except CONNECTION_ERRORS as e:
+                    if not is_connection_error(e):
+                        raise
+                    self._writer_connection = await self._reopen(self._writer_connection, readonly=False)
+                    return await operation(self._writer_connection)
+
+        pool = self._pool
+        connection = await pool.get()
         try:
-            self.cursor.execute("SELECT 1")
-        except (sqlite3.OperationalError, AttributeError):
-            self.connect()
-
-    def create_tables(self):
-        self.ensure_connection()
-        
-        self.cursor.execute("""
-            CREATE TABLE IF NOT EXISTS users (
-                id INTEGER PRIMARY KEY AUTOINCREMENT,
-                telegram_id TEXT,
-                balance INTEGER DEFAULT 0,
-                referral_telegram_id TEXT
-            )
-        """)
-        
-        self.cursor.execute("""
-            CREATE TABLE IF NOT EXISTS promocodes (
-                id INTEGER PRIMARY KEY AUTOINCREMENT,
-                code TEXT,
-                discount INTEGER DEFAULT 0,
-                amount_money INTEGER DEFAULT 0,
-                max_uses INTEGER,
-                uses INTEGER DEFAULT 0,
-                is_used BOOLEAN DEFAULT 0
-            )
-        """)
-        
-        self.cursor.execute("""
-            CREATE TABLE IF NOT EXISTS orders (
-                id INTEGER PRIMARY KEY AUTOINCREMENT,
-                user_id INTEGER,
-                amount_star INTEGER,
-                amount_ruble INTEGER,
-                status TEXT,
-                created_at DATETIME DEFAULT CURRENT_TIMESTAMP
-            )
-        """)
-
-        self.connection.commit()
+            try:
+                return await operation(connection)
+            except CONNECTION_ERRORS as e:
+                if not is_connection_error(e):
+                    raise
+                connection = await self._reopen(connection, readonly=True)
+                return await operation(connection)
+        finally:
+            pool.put_nowait(connection)
+
+    async def _fetchone(self, query: str, params: Tuple = (), *, name: str) -> Optional[Tuple]:
+        async def operation(connection: aiosqlite.Connection):
+            async with connection.execute(query, params) as cursor:
+                return await cursor.fetchone()
+
+        return await self._run(operation, name=name)
+
+    async def _fetchall(self, query: str, params: Tuple = (), *, name: str) -> List[Tuple]:
+        async def operation(connection: aiosqlite.Connection):
+            async with connection.execute(query, params) as cursor:
+                return list(await cursor.fetchall())
+
+        return await self._run(operation, name=name)
+
+    async def _write(self, query: str, params: Tuple = (), *, name: str) -> Tuple[int, Optional[int]]:
+        async def operation(connection: aiosqlite.Connection):
+            try:
+                async with connection.execute(query, params) as cursor:
+                    rowcount, lastrowid = cursor.rowcount, cursor.lastrowid
+                await connection.commit()
+            except Exception:
+                await connection.rollback()
+                raise
+            return rowcount, lastrowid
+
+        return await self._run(operation, write=True, name=name)
+
+    async def migrate(self) -> int:
+        async with self.writer() as connection:
+            return await apply_migrations(connection)
+
+    async def optimize(self):
+        # Дешёвое обновление статистики планировщика и сброс WAL в основной файл
+        async with self.writer() as connection:
+            await connection.execute("PRAGMA optimize")
+            await connection.execute("PRAGMA wal_checkpoint(TRUNCATE)")
+
+    async def vacuum(self):
+        # Пересобирает файл базы целиком; записи на это время ждут writer lock
+        async with self.writer() as connection:
+            await connection.execute("VACUUM")
 
     #region Users
-    
-    def get_user(self, telegram_id: str) -> Optional[Dict]:
-        self.ensure_connection()
-        self.cursor.execute("SELECT * FROM users WHERE telegram_id = ?", (telegram_id,))
-        user = self.cursor.fetchone()
-        return dict(zip(['id', 'telegram_id', 'balance', 'referral_telegram_id'], user)) if user else None
-
-    def create_user(self, telegram_id: str, referral_telegram_id: Optional[str] = None) -> Dict:
-        self.ensure_connection()
-        self.cursor.execute(
-            "INSERT INTO users (telegram_id, referral_telegram_id) VALUES (?, ?)",
-            (telegram_id, referral_telegram_id)
-        )
-        self.connection.commit()
-        return self.get_user(telegram_id)
-
-    def update_user_balance(self, telegram_id: str, amount: int) -> bool:
-        self.ensure_connection()
-        self.cursor.execute(
+
+    async def get_user(self, telegram_id: str) -> Optional[Dict]:
+        telegram_id = str(telegram_id)
+        cached = self.user_cache.get(telegram_id)
+        if cached is not None:
+            return dict(cached)
+
+        version = self._user_cache_version
+        user = await self._fetchone("SELECT * FROM users WHERE telegram_id = ?", (telegram_id,), name="get_user")
+        if not user:
+            return None
+        user = dict(zip(USER_FIELDS, user))
+        # Если пока шёл запрос кого-то обновили, прочитанная строка могла устареть
+        if version == self._user_cache_version:
+            self.user_cache.set(telegram_id, user)
+        return dict(user)
+
+    def _invalidate_users(self, *telegram_ids: str):
+        self._user_cache_version += 1
+        for telegram_id in telegram_ids:
+            self.user_cache.pop(str(telegram_id))
+
+    async def create_user(self, telegram_id: str, referral_telegram_id: Optional[str] = None) -> Dict:
+        telegram_id = str(telegram_id)
+
+        async def operation(connection: aiosqlite.Connection):
+            try:
+                referrer = None
+                if referral_telegram_id and str(referral_telegram_id) != telegram_id:
+                    async with connection.execute(
+                        "SELECT telegram_id FROM users WHERE telegram_id = ?", (str(referral_telegram_id),)
+                    ) as cursor:
+                        row = await cursor.fetchone()
+                    referrer = row[0] if row else None
+
+                async with connection.execute(
+                    "INSERT OR IGNORE INTO users (telegram_id, referral_telegram_id) VALUES (?, ?)",
+                    (telegram_id, referrer)
+                ) as cursor:
+                    created = cursor.rowcount > 0
+                # Счётчик растёт в той же транзакции, что и вставка пользователя,
+                # поэтому экран рефералов не пересчитывает users
+                if created and referrer:
+                    await connection.execute(
+                        "INSERT INTO referral_stats (referrer_telegram_id, referrals_count) VALUES (?, 1) "
+                        "ON CONFLICT(referrer_telegram_id) DO UPDATE SET "
+                        "referrals_count = referrals_count + 1, updated_at = CURRENT_TIMESTAMP",
+                        (referrer,)
+                    )
+                await connection.commit()
+            except Exception:
+                await connection.rollback()
+                raise
+
+        await self._run(operation, write=True, name="create_user")
+        self._invalidate_users(telegram_id)
+        return await self.get_user(telegram_id)
+
+    async def update_user_balance(self, telegram_id: str, amount: int) -> bool:
+        rowcount, _ = await self._write(
             "UPDATE users SET balance = balance + ? WHERE telegram_id = ?",
-            (amount, telegram_id)
-        )
-        self.connection.commit()
-        return self.cursor.rowcount > 0
-      
-    def amount_refferal_by_tg_id(self, telegram_id: str) -> int:
-        self.ensure_connection()
-        self.cursor.execute("SELECT referral_telegram_id FROM users WHERE telegram_id = ?", (telegram_id,))
-        referral_telegram_id = self.cursor.fetchone()
-        return referral_telegram_id[0] if referral_telegram_id else None
-      
-      
+            (amount, telegram_id), name="update_user_balance"
+        )
+        self._invalidate_users(telegram_id)
+        return rowcount > 0
+
+    async def get_referral_stats(self, telegram_id: str) -> Dict:
+        row = await self._fetchone(
+            "SELECT referrals_count, earnings FROM referral_stats WHERE referrer_telegram_id = ?",
+            (str(telegram_id),), name="get_referral_stats"
+        )
+        return {'referrals_count': row[0], 'earnings': row[1]} if row else {'referrals_count': 0, 'earnings': 0}
+
+    async def get_top_referrers(self, limit: int = 10) -> List[Tuple[str, int, int]]:
+        return await self._fetchall(
+            "SELECT referrer_telegram_id, referrals_count, earnings FROM referral_stats "
+            "ORDER BY referrals_count DESC LIMIT ?",
+            (limit,), name="get_top_referrers"
+        )
+
+    async def set_user_blocked(self, telegram_id: str, is_blocked: bool = True) -> bool:
+        rowcount, _ = await self._write(
+            "UPDATE users SET is_blocked = ? WHERE telegram_id = ?",
+            (int(is_blocked), telegram_id), name="set_user_blocked"
+        )
+        self._invalidate_users(telegram_id)
+        return rowcount > 0
+
+    async def mark_users_blocked(self, telegram_ids: List[str]) -> int:
+        if not telegram_ids:
+            return 0
+        placeholders = ", ".join("?" * len(telegram_ids))
+        rowcount, _ = await self._write(
+            f"UPDATE users SET is_blocked = 1 WHERE telegram_id IN ({placeholders})",
+            tuple(telegram_ids), name="mark_users_blocked"
+        )
+        self._invalidate_users(*telegram_ids)
+        return rowcount
+
     #endregion
 
     #region Promocodes
 
-    def get_promocode(self, code: str) -> Optional[Dict]:
-        self.ensure_connection()
-        self.cursor.execute("SELECT * FROM promocodes WHERE code = ?", (code,))
-        promo = self.cursor.fetchone()
-        return dict(zip(['id', 'code', 'discount', 'amount_money', 'max_uses', 'uses', 'is_used'], promo)) if promo else None
+    async def get_promocode(self, code: str) -> Optional[Dict]:
+        promo = await self._fetchone("SELECT * FROM promocodes WHERE code = ?", (code,), name="get_promocode")
+        return dict(zip(PROMOCODE_FIELDS, promo)) if promo else None
 
-    def create_promocode(self, code: str, discount: int, amount_money: int, max_uses: int) -> Dict:
-        self.ensure_connection()
-        self.cursor.execute(
+    async def create_promocode(self, code: str, discount: int, amount_money: int, max_uses: int) -> Dict:
+        await self._write(
             "INSERT INTO promocodes (code, discount, amount_money, max_uses) VALUES (?, ?, ?, ?)",
-            (code, discount, amount_money, max_uses)
+            (code, discount, amount_money, max_uses), name="create_promocode"
         )
-        self.connection.commit()
-        return self.get_promocode(code)
+        return await self.get_promocode(code)
 
-    def use_promocode(self, code: str) -> bool:
-        self.ensure_connection()
-        self.cursor.execute(
-            "UPDATE promocodes SET uses = uses + 1, is_used = CASE WHEN uses + 1 >= max_uses THEN 1 ELSE 0 END WHERE code = ?",
-            (code,)
+    async def redeem_promocode(self, promocode: Dict, user: Dict) -> bool:
+        """Активирует промокод для пользователя одной транзакцией.
+
+        Возвращает False, если активации закончились. Повторная активация тем же
+        пользователем падает на UNIQUE (promocode_id, user_id) с IntegrityError.
+        """
+        async def operation(connection: aiosqlite.Connection):
+            try:
+                await connection.execute(
+                    "INSERT INTO promocode_redemptions (promocode_id, user_id, discount, amount_money) "
+                    "VALUES (?, ?, ?, ?)",
+                    (promocode['id'], user['id'], promocode['discount'] or 0, promocode['amount_money'] or 0)
+                )
+                # Лимит проверяется самим UPDATE, поэтому при одновременных
+                # активациях промокод не уйдёт больше max_uses раз
+                async with connection.execute(
+                    "UPDATE promocodes SET uses = uses + 1, "
+                    "is_used = CASE WHEN max_uses IS NOT NULL AND uses + 1 >= max_uses THEN 1 ELSE 0 END "
+                    "WHERE id = ? AND is_used = 0 AND (max_uses IS NULL OR uses < max_uses)",
+                    (promocode['id'],)
+                ) as cursor:
+                    if cursor.rowcount == 0:
+                        await connection.rollback()
+                        return False
+                if promocode['amount_money']:
+                    await connection.execute(
+                        "UPDATE users SET balance = balance + ? WHERE id = ?",
+                        (promocode['amount_money'], user['id'])
+                    )
+                await connection.commit()
+            except Exception:
+                await connection.rollback()
+                raise
+            return True
+
+        redeemed = await self._run(operation, write=True, name="redeem_promocode")
+        if redeemed and promocode['amount_money']:
+            self._invalidate_users(user['telegram_id'])
+        return redeemed
+
+    async def get_active_discount(self, user_id: int) -> Optional[Tuple[int, int]]:
+        return await self._fetchone(
+            "SELECT id, discount FROM promocode_redemptions "
+            "WHERE user_id = ? AND order_id IS NULL AND discount > 0 ORDER BY id LIMIT 1",
+            (user_id,), name="get_active_discount"
         )
-        self.connection.commit()
-        return self.cursor.rowcount > 0
 
     #endregion
 
     #region Orders
 
-    def create_order(self, user_id: int, amount_star: int, amount_ruble: int, status: str) -> int:
-        self.ensure_connection()
-        self.cursor.execute(
-            "INSERT INTO orders (user_id, amount_star, amount_ruble, status) VALUES (?, ?, ?, ?)",
-            (user_id, amount_star, amount_ruble, status)
-        )
-        self.connection.commit()
-        return self.cursor.lastrowid
-
-    def get_order(self, order_id: int) -> Optional[Dict]:
-        self.ensure_connection()
-        self.cursor.execute("SELECT * FROM orders WHERE id = ?", (order_id,))
-        order = self.cursor.fetchone()
-        return dict(zip(['id', 'user_id', 'amount_star', 'amount_ruble', 'status', 'created_at'], order)) if order else None
-
-    def update_order_status(self, order_id: int, status: str) -> bool:
-        self.ensure_connection()
-        self.cursor.execute("UPDATE orders SET status = ? WHERE id = ?", (status, order_id))
-        self.connection.commit()
-        return self.cursor.rowcount > 0
-
-    def get_user_orders(self, user_id: int) -> List[Dict]:
-        self.ensure_connection()
-        self.cursor.execute("SELECT * FROM orders WHERE user_id = ? ORDER BY created_at DESC", (user_id,))
-        orders = self.cursor.fetchall()
-        return [dict(zip(['id', 'user_id', 'amount_star', 'amount_ruble', 'status', 'created_at'], order)) for order in orders]
+    async def create_order(
+        self,
+        user_id: int,
+        amount_star: int,
+        amount_ruble: int,
+        status: str,
+        target_username: Optional[str] = None,
+        payment_method: Optional[str] = None,
+        external_id: Optional[str] = None,
+        actor: Optional[str] = None,
+        discount_redemption_id: Optional[int] = None,
+    ) -> int:
+        async def operation(connection: aiosqlite.Connection):
+            try:
+                async with connection.execute(
+                    "INSERT INTO orders (user_id, amount_star, amount_ruble, status, target_username, payment_method, external_id) "
+                    "VALUES (?, ?, ?, ?, ?, ?, ?)",
+                    (user_id, amount_star, amount_ruble, status, target_username, payment_method, external_id)
+                ) as cursor:
+                    order_id = cursor.lastrowid
+                await connection.execute(
+                    "INSERT INTO order_events (order_id, from_status, to_status, actor) VALUES (?, NULL, ?, ?)",
+                    (order_id, status, actor)
+                )
+                # Скидку по промокоду закрепляем за заказом в той же транзакции:
+                # два заказа одновременно одну скидку не получат
+                if discount_redemption_id is not None:
+                    async with connection.execute(
+                        "UPDATE promocode_redemptions SET order_id = ? "
+                        "WHERE id = ? AND user_id = ? AND order_id IS NULL",
+                        (order_id, discount_redemption_id, user_id)
+                    ) as cursor:
+                        if cursor.rowcount == 0:
+                            raise DiscountAlreadyUsed(f"Скидка {discount_redemption_id} уже использована")
+                await connection.commit()
+            except Exception as e:
+                await connection.rollback()
+                if external_id is not None and isinstance(e, aiosqlite.IntegrityError):
+                    raise OrderAlreadyExists(f"Заказ {external_id} уже создан") from e
+                raise
+            return order_id
+
+        return await self._run(operation, write=True, name="create_order")
+
+    async def get_order(self, order_id: int) -> Optional[Dict]:
+        order = await self._fetchone("SELECT * FROM orders WHERE id = ?", (order_id,), name="get_order")
+        return dict(zip(ORDER_FIELDS, order)) if order else None
+
+    async def transition_order(
+        self,
+        order_id: int,
+        from_statuses: Sequence[str],
+        to_status: str,
+        actor: Optional[str] = None,
+        set_paid_at: bool = False,
+        release_discount: bool = False,
+    ) -> bool:
+        """Условный переход статуса заказа вместе с записью в order_events.
+
+        Заказ меняется одним UPDATE ... WHERE status IN (...), если сейчас он
+        в одном из from_statuses. Событие с фактическим исходным статусом
+        пишется в той же транзакции перед UPDATE: вставка берёт блокировку
+        записи, поэтому UPDATE видит ту же строку. release_discount отвязывает
+        от заказа скидку по промокоду, и пользователь может применить её к
+        следующему заказу.
+        """
+        placeholders = ", ".join("?" for _ in from_statuses)
+        # Заказ СБП уже мог получить paid_at от Lava, его не перезаписываем
+        paid_at = ", paid_at = COALESCE(paid_at, CURRENT_TIMESTAMP)" if set_paid_at else ""
+
+        async def operation(connection: aiosqlite.Connection):
+            try:
+                async with connection.execute(
+                    "INSERT INTO order_events (order_id, from_status, to_status, actor) "
+                    f"SELECT id, status, ?, ? FROM orders WHERE id = ? AND status IN ({placeholders})",
+                    (to_status, actor, order_id, *from_statuses)
+                ) as cursor:
+                    changed = cursor.rowcount > 0
+                if changed:
+                    await connection.execute(
+                        f"UPDATE orders SET status = ?{paid_at} WHERE id = ? AND status IN ({placeholders})",
+                        (to_status, order_id, *from_statuses)
+                    )
+                if changed and release_discount:
+                    await connection.execute(
+                        "UPDATE promocode_redemptions SET order_id = NULL WHERE order_id = ?", (order_id,)
+                    )
+                await connection.commit()
+            except Exception:
+                await connection.rollback()
+                raise
+            return changed
+
+        return await self._run(operation, write=True, name="transition_order")
+
+    async def transition_stale_orders(
+        self,
+        from_status: str,
+        to_status: str,
+        max_age: int,
+        limit: int = 500,
+        actor: Optional[str] = None,
+    ) -> List[int]:
+        """Переводит до limit заказов старше max_age секунд из from_status в to_status.
+
+        Выборка идёт по индексу (status, created_at). BEGIN IMMEDIATE держит
+        блокировку записи от SELECT до COMMIT, так что заказ, который за это
+        время подтвердили, не будет затронут.
+        """
+        async def operation(connection: aiosqlite.Connection):
+            try:
+                await connection.execute("BEGIN IMMEDIATE")
+                async with connection.execute(
+                    "SELECT id FROM orders WHERE status = ? AND created_at < datetime('now', ?) "
+                    "ORDER BY created_at LIMIT ?",
+                    (from_status, f"-{int(max_age)} seconds", limit)
+                ) as cursor:
+                    order_ids = [row[0] for row in await cursor.fetchall()]
+                if order_ids:
+                    placeholders = ", ".join("?" * len(order_ids))
+                    await connection.execute(
+                        f"UPDATE orders SET status = ? WHERE status = ? AND id IN ({placeholders})",
+                        (to_status, from_status, *order_ids)
+                    )
+                    await connection.executemany(
+                        "INSERT INTO order_events (order_id, from_status, to_status, actor) VALUES (?, ?, ?, ?)",
+                        [(order_id, from_status, to_status, actor) for order_id in order_ids]
+                    )
+                await connection.commit()
+            except Exception:
+                await connection.rollback()
+                raise
+            return order_ids
+
+        return await self._run(operation, write=True, name="transition_stale_orders")
+
+    async def get_order_events(self, order_id: int) -> List[Dict]:
+        events = await self._fetchall(
+            "SELECT from_status, to_status, actor, created_at FROM order_events WHERE order_id = ? ORDER BY id",
+            (order_id,), name="get_order_events"
+        )
+        return [dict(zip(['from_status', 'to_status', 'actor', 'created_at'], event)) for event in events]
+
+    async def get_order_by_external_id(self, external_id: str) -> Optional[Dict]:
+        order = await self._fetchone("SELECT * FROM orders WHERE external_id = ?", (external_id,), name="get_order_by_external_id")
+        return dict(zip(ORDER_FIELDS, order)) if order else None
+
+    async def get_order_with_customer(self, order_id: int) -> Optional[Dict]:
+        # Заказ и telegram_id заказчика одним запросом по первичным ключам
+        row = await self._fetchone(
+            "SELECT orders.*, users.telegram_id FROM orders "
+            "LEFT JOIN users ON users.id = orders.user_id WHERE orders.id = ?",
+            (order_id,), name="get_order_with_customer"
+        )
+        if not row:
+            return None
+        order = dict(zip(ORDER_FIELDS, row))
+        order['customer_telegram_id'] = row[len(ORDER_FIELDS)]
+        return order
+
+    async def get_order_customer(self, order_id: int) -> Optional[str]:
+        row = await self._fetchone(
+            "SELECT users.telegram_id FROM orders JOIN users ON users.id = orders.user_id WHERE orders.id = ?",
+            (order_id,), name="get_order_customer"
+        )
+        return row[0] if row else None
+
+    async def add_order_notification(self, order_id: int, chat_id: int, message_id: int):
+        await self._write(
+            "INSERT OR REPLACE INTO order_notifications (order_id, chat_id, message_id) VALUES (?, ?, ?)",
+            (order_id, chat_id, message_id), name="add_order_notification"
+        )
+
+    async def get_order_notifications(self, order_id: int) -> List[Tuple[int, int]]:
+        return await self._fetchall(
+            "SELECT chat_id, message_id FROM order_notifications WHERE order_id = ?", (order_id,), name="get_order_notifications"
+        )
+
+    async def get_user_orders(self, user_id: int) -> List[Dict]:
+        orders = await self._fetchall(
+            "SELECT * FROM orders WHERE user_id = ? ORDER BY created_at DESC", (user_id,), name="get_user_orders"
+        )
+        return [dict(zip(ORDER_FIELDS, order)) for order in orders]
+
+    #endregion
+
+    #region FSM
+
+    async def get_fsm_record(self, key: str, min_updated_at: float) -> Optional[Tuple[Optional[str], Optional[str]]]:
+        return await self._fetchone(
+            "SELECT state, data FROM fsm_states WHERE key = ? AND updated_at >= ?",
+            (key, min_updated_at), name="get_fsm_record"
+        )
+
+    async def set_fsm_state(self, key: str, state: Optional[str], updated_at: float, min_updated_at: float):
+        # Данные просроченной записи не должны «воскреснуть» вместе с новым состоянием
+        await self._write(
+            "INSERT INTO fsm_states (key, state, updated_at) VALUES (?, ?, ?) "
+            "ON CONFLICT(key) DO UPDATE SET state = excluded.state, updated_at = excluded.updated_at, "
+            "data = CASE WHEN fsm_states.updated_at < ? THEN NULL ELSE fsm_states.data END",
+            (key, state, updated_at, min_updated_at), name="set_fsm_state"
+        )
+
+    async def set_fsm_data(self, key: str, data: Optional[str], updated_at: float, min_updated_at: float):
+        await self._write(
+            "INSERT INTO fsm_states (key, data, updated_at) VALUES (?, ?, ?) "
+            "ON CONFLICT(key) DO UPDATE SET data = excluded.data, updated_at = excluded.updated_at, "
+            "state = CASE WHEN fsm_states.updated_at < ? THEN NULL ELSE fsm_states.state END",
+            (key, data, updated_at, min_updated_at), name="set_fsm_data"
+        )
+
+    async def clear_fsm_field(self, key: str, field: str, updated_at: float) -> bool:
+        """Очищает state или data записи FSM одной транзакцией.
+
+        Если второе поле тоже пустое, запись удаляется целиком, иначе
+        обнуляется только field. Возвращает False, если менять было нечего.
+        """
+        other = {"state": "data", "data": "state"}[field]
+
+        async def operation(connection: aiosqlite.Connection):
+            try:
+                async with connection.execute(
+                    f"DELETE FROM fsm_states WHERE key = ? AND {other} IS NULL", (key,)
+                ) as cursor:
+                    changed = cursor.rowcount > 0
+                if not changed:
+                    async with connection.execute(
+                        f"UPDATE fsm_states SET {field} = NULL, updated_at = ? WHERE key = ? AND {field} IS NOT NULL",
+                        (updated_at, key)
+                    ) as cursor:
+                        changed = cursor.rowcount > 0
+                await connection.commit()
+            except Exception:
+                await connection.rollback()
+                raise
+            return changed
+
+        return await self._run(operation, write=True, name="clear_fsm_field")
+
+    async def delete_expired_fsm_records(self, updated_before: float, limit: int = 1000) -> int:
+        rowcount, _ = await self._write(
+            "DELETE FROM fsm_states WHERE key IN "
+            "(SELECT key FROM fsm_states WHERE updated_at < ? LIMIT ?)",
+            (updated_before, limit), name="delete_expired_fsm_records"
+        )
+        return rowcount
+
+    #endregion
+
+    #region Broadcasts
+
+    async def create_broadcast(self, text: str, admin_chat_id: int, total: int) -> int:
+        _, lastrowid = await self._write(
+            "INSERT INTO broadcasts (text, admin_chat_id, total) VALUES (?, ?, ?)",
+            (text, admin_chat_id, total), name="create_broadcast"
+        )
+        return lastrowid
+
+    async def get_broadcast(self, broadcast_id: int) -> Optional[Dict]:
+        broadcast = await self._fetchone("SELECT * FROM broadcasts WHERE id = ?", (broadcast_id,), name="get_broadcast")
+        return dict(zip(BROADCAST_FIELDS, broadcast)) if broadcast else None
+
+    async def get_running_broadcasts(self) -> List[Dict]:
+        broadcasts = await self._fetchall("SELECT * FROM broadcasts WHERE status = 'running' ORDER BY id", name="get_running_broadcasts")
+        return [dict(zip(BROADCAST_FIELDS, broadcast)) for broadcast in broadcasts]
+
+    async def set_broadcast_message(self, broadcast_id: int, message_id: int):
+        await self._write(
+            "UPDATE broadcasts SET progress_message_id = ? WHERE id = ?",
+            (message_id, broadcast_id), name="set_broadcast_message"
+        )
+
+    async def save_broadcast_progress(
+        self,
+        broadcast_id: int,
+        last_user_id: int,
+        sent: int,
+        failed: int,
+        blocked: int
+    ):
+        await self._write(
+            "UPDATE broadcasts SET last_user_id = ?, sent = ?, failed = ?, blocked = ? WHERE id = ?",
+            (last_user_id, sent, failed, blocked, broadcast_id), name="save_broadcast_progress"
+        )
+
+    async def finish_broadcast(self, broadcast_id: int, status: str) -> bool:
+        rowcount, _ = await self._write(
+            "UPDATE broadcasts SET status = ?, finished_at = CURRENT_TIMESTAMP "
+            "WHERE id = ? AND status = 'running'",
+            (status, broadcast_id), name="finish_broadcast"
+        )
+        return rowcount > 0
+
+    async def count_broadcast_recipients(self) -> int:
+        row = await self._fetchone("SELECT COUNT(*) FROM users WHERE is_blocked = 0", name="count_broadcast_recipients")
+        return row[0] if row else 0
+
+    async def get_broadcast_recipients(self, after_user_id: int, limit: int) -> List[Tuple[int, str]]:
+        # Курсор по первичному ключу: каждая пачка — короткий запрос по индексу,
+        # а сохранённый last_user_id позволяет продолжить рассылку после рестарта
+        return await self._fetchall(
+            "SELECT id, telegram_id FROM users WHERE id > ? AND is_blocked = 0 ORDER BY id LIMIT ?",
+            (after_user_id, limit), name="get_broadcast_recipients"
+        )
+
+    #endregion
+
+    #region Settings
+
+    async def get_settings(self, prefix: str) -> Dict[str, str]:
+        rows = await self._fetchall(
+            "SELECT key, value FROM settings WHERE key >= ? AND key < ?", (prefix, prefix + "\uffff"), name="get_settings"
+        )
+        return dict(rows)
+
+    async def set_setting(self, key: str, value: str):
+        await self._write(
+            "INSERT INTO settings (key, value) VALUES (?, ?) "
+            "ON CONFLICT(key) DO UPDATE SET value = excluded.value, updated_at = CURRENT_TIMESTAMP",
+            (key, value), name="set_setting"
+        )
+
+    async def delete_setting(self, key: str):
+        await self._write("DELETE FROM settings WHERE key = ?", (key,), name="delete_setting")
+
+    #endregion
+
+    #region Media
+
+    async def get_media_file_id(self, content_hash: str, bot_id: int) -> Optional[str]:
+        row = await self._fetchone(
+            "SELECT file_id FROM media_cache WHERE content_hash = ? AND bot_id = ?",
+            (content_hash, bot_id), name="get_media_file_id"
+        )
+        return row[0] if row else None
+
+    async def set_media_file_id(self, content_hash: str, bot_id: int, path: str, file_id: str):
+        await self._write(
+            "INSERT INTO media_cache (content_hash, bot_id, path, file_id) VALUES (?, ?, ?, ?) "
+            "ON CONFLICT(content_hash, bot_id) DO UPDATE SET "
+            "path = excluded.path, file_id = excluded.file_id, updated_at = CURRENT_TIMESTAMP",
+            (content_hash, bot_id, path, file_id), name="set_media_file_id"
+        )
+
+    async def delete_media_file_id(self, content_hash: str, bot_id: int):
+        await self._write(
+            "DELETE FROM media_cache WHERE content_hash = ? AND bot_id = ?",
+            (content_hash, bot_id), name="delete_media_file_id"
+        )
 
     #endregion
@@ -0,0 +1,128 @@
+import asyncio
+import json
+import time
+from contextlib import asynccontextmanager
+from typing import Any, AsyncGenerator, Dict, Optional, Tuple
+
+from aiogram.fsm.state import State
+from aiogram.fsm.storage.base import BaseEventIsolation, BaseStorage, DefaultKeyBuilder, StateType, StorageKey
+from aiogram.fsm.storage.memory import MemoryStorage, SimpleEventIsolation
+
+from utils.database import Database
+
+
+class SQLiteStorage(BaseStorage):
+    """FSM-хранилище в таблице fsm_states общей базы.
+
+    Состояние переживает перезапуск и доступно всем процессам, работающим с
+    этим файлом. Записи, которые не обновлялись дольше ttl секунд, считаются
+    брошенными: они не читаются и удаляются purge_expired().
+    """
+
+    def __init__(self, db: Database, ttl: int = 86400):
+        self.db = db
+        self.ttl = ttl
+        self.key_builder = DefaultKeyBuilder(with_bot_id=True, with_destiny=True)
+
+    def _min_updated_at(self) -> float:
+        return time.time() - self.ttl
+
+    async def _clear(self, storage_key: str, field: int):
+        # state.clear() вызывается на каждом возврате в меню. Чтение идёт через
+        # пул и не ждёт writer lock, а запись нужна, только если поле не пустое:
+        # одна транзакция, которая удаляет запись или обнуляет одно поле
+        record = await self.db.get_fsm_record(storage_key, self._min_updated_at())
+        if record is None or record[field] is None:
+            return
+        await self.db.clear_fsm_field(storage_key, ("state", "data")[field], time.time())
+
+    async def set_state(self, key: StorageKey, state: StateType = None) -> None:
+        value = state.state if isinstance(state, State) else state
+        storage_key = self.key_builder.build(key)
+        if value is None:
+            await self._clear(storage_key, 0)
+            return
+        await self.db.set_fsm_state(storage_key, value, time.time(), self._min_updated_at())
+
+    async def get_state(self, key: StorageKey) -> Optional[str]:
+        record = await self.db.get_fsm_record(self.key_builder.build(key), self._min_updated_at())
+        return record[0] if record else None
+
+    async def set_data(self, key: StorageKey, data: Dict[str, Any]) -> None:
+        storage_key = self.key_builder.build(key)
+        if not data:
+            await self._clear(storage_key, 1)
+            return
+        await self.db.set_fsm_data(storage_key, json.dumps(data), time.time(), self._min_updated_at())
+
+    async def get_data(self, key: StorageKey) -> Dict[str, Any]:
+        record = await self.db.get_fsm_record(self.key_builder.build(key), self._min_updated_at())
+        if not record or not record[1]:
+            return {}
+        return json.loads(record[1])
+
+    async def purge_expired(self, batch_size: int = 1000) -> int:
+        deleted = 0
+        while True:
+            count = await self.db.delete_expired_fsm_records(self._min_updated_at(), batch_size)
+            deleted += count
+            if count < batch_size:
+                return deleted
+
+    async def close(self) -> None:
+        # Соединениями владеет Database, их закрывает main.py
+        pass
+
+
+class KeyedLockIsolation(BaseEventIsolation):
+    """Блокировка апдейтов одного пользователя внутри процесса.
+
+    В отличие от SimpleEventIsolation, лок удаляется, как только его никто
+    не держит и не ждёт, поэтому словарь не растёт с числом пользователей.
+    """
+
+    def __init__(self) -> None:
+        self._locks: Dict[StorageKey, Tuple[asyncio.Lock, int]] = {}
+
+    @asynccontextmanager
+    async def lock(self, key: StorageKey) -> AsyncGenerator[None, None]:
+        lock, users = self._locks.get(key, (None, 0))
+        if lock is None:
+            lock = asyncio.Lock()
+        self._locks[key] = (lock, users + 1)
+        try:
+            async with lock:
+                yield
+        finally:
+            lock, users = self._locks[key]
+            if users <= 1:
+                del self._locks[key]
+            else:
+                self._locks[key] = (lock, users - 1)
+
+    async def close(self) -> None:
+        self._locks.clear()
+
+
+def build_fsm_storage(backend: str, db: Database, ttl: int, redis_url: Optional[str] = None) -> Tuple[BaseStorage, BaseEventIsolation]:
+    if backend == "redis":
+        try:
+            from aiogram.fsm.storage.redis import RedisStorage
+        except ImportError:
+            raise RuntimeError("Для FSM_STORAGE=redis установите пакет redis")
+
+        if not redis_url:
+            raise RuntimeError("Для FSM_STORAGE=redis нужно указать REDIS_URL")
+        storage = RedisStorage.from_url(
+            redis_url,
+            key_builder=DefaultKeyBuilder(with_bot_id=True, with_destiny=True),
+            state_ttl=ttl,
+            data_ttl=ttl,
+        )
+        # Лок в Redis общий для всех воркеров
+        return storage, storage.create_isolation()
+
+    if backend == "memory":
+        return MemoryStorage(), SimpleEventIsolation()
+
+    return SQLiteStorage(db, ttl=ttl), KeyedLockIsolation()
@@ -0,0 +1,115 @@
+import asyncio
+import hashlib
+import hmac
+import json
+import random
+import time
+from typing import Optional, Dict, Any, Callable
+
+import aiohttp
+
+
+class LavaError(Exception):
+    pass
+
+
+class LavaClient:
+    """Асинхронный клиент Lava Business API.
+
+    Держит одну aiohttp-сессию с keep-alive на весь процесс, подписывает запросы
+    HMAC-SHA256 секретным ключом магазина и повторяет запрос с экспоненциальной
+    задержкой и джиттером при сетевых ошибках, таймаутах и ответах 5xx/429.
+    """
+
+    RETRY_STATUSES = {429, 500, 502, 503, 504}
+
+    def __init__(
+        self,
+        shop_id: str,
+        secret_key: str,
+        base_url: str = "https://api.lava.ru",
+        timeout: float = 10.0,
+        connect_timeout: float = 3.0,
+        max_retries: int = 3,
+        backoff: float = 0.5,
+        max_backoff: float = 5.0,
+    ):
+        self.shop_id = shop_id
+        self.secret_key = secret_key
+        self.base_url = base_url.rstrip("/")
+        self.timeout = aiohttp.ClientTimeout(total=timeout, connect=connect_timeout)
+        self.max_retries = max_retries
+        self.backoff = backoff
+        self.max_backoff = max_backoff
+        self._session: Optional[aiohttp.ClientSession] = None
+        # Необязательный колбэк (path, status, duration) после каждой попытки запроса
+        self.request_hook: Optional[Callable[[str, str, float], None]] = None
+
+    def _get_session(self) -> aiohttp.ClientSession:
+        if self._session is None or self._session.closed:
+            connector = aiohttp.TCPConnector(limit=20, keepalive_timeout=60)
+            self._session = aiohttp.ClientSession(
+                connector=connector,
+                timeout=self.timeout,
+                headers={"Accept": "application/json", "Content-Type": "application/json"},
+            )
+        return self._session
+
+    async def close(self):
+        if self._session is not None and not self._session.closed:
+            await self._session.close()
+        self._session = None
+
+    def sign(self, body: bytes) -> str:
+        return hmac.new(self.secret_key.encode(), body, hashlib.sha256).hexdigest()
+
+    def _retry_delay(self, attempt: int) -> float:
+        # Full jitter: случайная задержка в пределах экспоненциально растущего окна
+        return random.uniform(0, min(self.max_backoff, self.backoff * 2 ** attempt))
+
+    async def _post(self, path: str, payload: Dict[str, Any]) -> Dict[str, Any]:
+        body = json.dumps(payload).encode()
+        headers = {"Signature": self.sign(body)}
+        url = f"{self.base_url}{path}"
+
+        last_error: Optional[Exception] = None
+        for attempt in range(self.max_retries + 1):
+            if attempt:
+                await asyncio.sleep(self._retry_delay(attempt - 1))
+
+            started = time.perf_counter()
+            status = "error"
+            try:
+                async with self._get_session().post(url, data=body, headers=headers) as response:
+                    status = str(response.status)
+                    if response.status in self.RETRY_STATUSES:
+                        last_error = LavaError(f"Lava API вернул {response.status}")
+                        continue
+
+                    try:
+                        data = await response.json(content_type=None)
+                    except ValueError:
+                        raise LavaError(f"Некорректный ответ Lava API ({response.status})")
+
+                    if response.status != 200:
+                        raise LavaError(f"Lava API вернул {response.status}: {data}")
+                    return data
+            except (aiohttp.ClientError, asyncio.TimeoutError) as e:
+                status = "timeout" if isinstance(e, asyncio.TimeoutError) else "error"
+                last_error = e
+            finally:
+                if self.request_hook is not None:
+                    self.request_hook(path, status, time.perf_counter() - started)
+
+        raise LavaError(f"Lava API недоступен после {self.max_retries + 1} попыток: {last_error}")
+
+    async def create_invoice(self, amount: float, order_id: str, comment: str) -> Dict[str, Any]:
+        data = await self._post("/business/invoice/create", {
+            "sum": amount,
+            "orderId": order_id,
+            "shopId": self.shop_id,
+            "comment": comment,
+        })
+        if not data.get("status_check"):
+            raise LavaError(f"Lava API отклонил создание счёта: {data}")
+        return data.get("data", {})
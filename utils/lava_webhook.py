@@ -0,0 +1,138 @@
+import hashlib
+import hmac
+import json
+import logging
+
+from aiogram import Bot
+from aiohttp import web
+
+from keyboards.admin_keyboards import get_order_admin_keyboard
+from utils.database import Database
+from utils.notifications import AdminNotifier
+from utils import orders
+from utils.log import bind
+
+logger = logging.getLogger(__name__)
+
+BOT_KEY = web.AppKey("bot", Bot)
+DB_KEY = web.AppKey("db", Database)
+NOTIFIER_KEY = web.AppKey("notifier", AdminNotifier)
+LAVA_WEBHOOK_KEY = web.AppKey("lava_webhook_key", str)
+
+LAVA_PAID_STATUS = "success"
+
+
+def verify_lava_signature(body: bytes, signature: str, key: str) -> bool:
+    expected = hmac.new(key.encode(), body, hashlib.sha256).hexdigest()
+    return bool(signature) and hmac.compare_digest(expected, signature)
+
+
+async def handle_lava_webhook(request: web.Request) -> web.Response:
+    """Колбэк Lava о смене статуса счёта.
+
+    Подпись проверяется по сырому телу запроса дополнительным ключом магазина.
+    На повторные колбэки и на заказы, которые уже обработаны, отвечаем 200,
+    чтобы Lava не повторяла доставку. Оплата истёкшего или отклонённого
+    заказа пишется в лог как ошибка и отправляется админам для сверки.
+    """
+    body = await request.read()
+    signature = request.headers.get("Authorization", "")
+    if not verify_lava_signature(body, signature, request.app[LAVA_WEBHOOK_KEY]):
+        return web.json_response({"ok": False, "error": "invalid signature"}, status=401)
+
+    try:
+        payload = json.loads(body)
+        external_id = str(payload["order_id"])
+    except (ValueError, KeyError, TypeError):
+        return web.json_response({"ok": False, "error": "invalid payload"}, status=400)
+
+    if payload.get("status") != LAVA_PAID_STATUS:
+        return web.json_response({"ok": True})
+
+    db = request.app[DB_KEY]
+    order = await db.get_order_by_external_id(external_id)
+    if not order:
+        return web.json_response({"ok": False, "error": "order not found"}, status=404)
+    bind(order_id=order['id'])
+
+    try:
+        paid_amount = float(payload.get("amount", 0))
+    except (TypeError, ValueError):
+        paid_amount = 0
+    if paid_amount + 0.01 < float(order['amount_ruble']):
+        logger.warning("Lava webhook: сумма %s меньше суммы заказа %s (%s)", paid_amount, order['id'], order['amount_ruble'])
+        return web.json_response({"ok": False, "error": "amount mismatch"}, status=400)
+
+    # Условный переход делает подтверждение идемпотентным: повторный колбэк
+    # по уже оплаченному заказу ничего не меняет
+    if not await orders.mark_paid(db, order['id'], actor="lava"):
+        current = await db.get_order(order['id'])
+        status = current['status'] if current else None
+        if status not in (orders.PAID, orders.FULFILLED):
+            await notify_unexpected_payment(request.app[BOT_KEY], request.app[NOTIFIER_KEY], order, status, paid_amount)
+        return web.json_response({"ok": True})
+
+    await notify_order_paid(request.app[BOT_KEY], db, request.app[NOTIFIER_KEY], order)
+    return web.json_response({"ok": True})
+
+
+async def notify_unexpected_payment(bot: Bot, notifier: AdminNotifier, order: dict, status: str, amount: float):
+    # Деньги пришли по заказу, который уже истёк или отклонён: сами его не
+    # переводим, а зовём человека свериться с Lava
+    logger.error(
+        "Lava webhook: оплата %s RUB по заказу %s (%s) в статусе %s",
+        amount, order['id'], order['external_id'], status
+    )
+    await notifier.notify_order(
+        bot,
+        order['id'],
+        f"⚠️ Получена оплата по СБП для заказа в статусе «{status}»!\n\n"
+        f"🧾 ID заказа: {order['external_id']}\n"
+        f"📝 Username получателя: @{order['target_username']}\n"
+        f"⭐️ Количество звезд: {order['amount_star']}\n"
+        f"💰 Оплачено: {amount} RUB\n\n"
+        f"Проверьте платёж в Lava и обработайте заказ вручную."
+    )
+
+
+async def notify_order_paid(bot: Bot, db: Database, notifier: AdminNotifier, order: dict):
+    user_id = await db.get_order_customer(order['id'])
+    target_username = order['target_username']
+
+    if user_id:
+        try:
+            await bot.send_message(
+                chat_id=user_id,
+                text=f"✅ Оплата заказа на {order['amount_star']} Telegram звезд для @{target_username} получена!\n"
+                     f"⏳ Звезды будут зачислены в течение нескольких минут."
+            )
+        except Exception as e:
+            logger.warning("Failed to notify user %s: %s", user_id, e)
+
+    admin_message = (
+        f"💸 Оплата по СБП получена автоматически!\n\n"
+        f"🆔 ID: {user_id}\n"
+        f"📝 Username получателя: @{target_username}\n"
+        f"⭐️ Количество звезд: {order['amount_star']}\n"
+        f"💰 Сумма: {order['amount_ruble']} RUB\n"
+        f"💳 Способ оплаты: {order['payment_method']}\n"
+        f"🧾 ID заказа: {order['external_id']}"
+    )
+    admin_keyboard = get_order_admin_keyboard(order['id'], user_id, can_reject=False)
+
+    await notifier.notify_order(bot, order['id'], admin_message, admin_keyboard)
+
+
+def setup_lava_webhook(
+    app: web.Application,
+    bot: Bot,
+    db: Database,
+    notifier: AdminNotifier,
+    webhook_key: str,
+    path: str = "/lava/webhook"
+):
+    app[BOT_KEY] = bot
+    app[DB_KEY] = db
+    app[NOTIFIER_KEY] = notifier
+    app[LAVA_WEBHOOK_KEY] = webhook_key
+    app.router.add_post(path, handle_lava_webhook)
@@ -0,0 +1,187 @@
+import copy
+import json
+import logging
+import os
+import queue
+import random
+import sys
+from contextlib import contextmanager
+from contextvars import ContextVar
+from datetime import datetime, timezone
+from logging.handlers import QueueHandler, QueueListener, RotatingFileHandler
+from typing import Dict, Iterator, List, Optional
+
+# Поля контекста, которые попадают в каждую запись, сделанную при обработке апдейта
+CONTEXT_FIELDS = ("update_id", "user_id", "order_id", "handler")
+
+_context: ContextVar[Dict] = ContextVar("log_context", default={})
+
+
+def bind(**fields):
+    """Добавляет поля в контекст логов текущей задачи.
+
+    Контекст живёт до конца апдейта: UpdateContextMiddleware сбрасывает его
+    после обработки, поэтому внутри хендлера достаточно bind(order_id=...).
+    """
+    _context.set({**_context.get(), **fields})
+
+
+@contextmanager
+def log_context(**fields) -> Iterator[None]:
+    token = _context.set({**_context.get(), **fields})
+    try:
+        yield
+    finally:
+        _context.reset(token)
+
+
+class ContextFilter(logging.Filter):
+    """Переносит контекст в запись в потоке, где она создана.
+
+    Запись уходит в очередь, а в фоновом потоке contextvars уже другие.
+    """
+
+    def filter(self, record: logging.LogRecord) -> bool:
+        for name, value in _context.get().items():
+            if not hasattr(record, name):
+                setattr(record, name, value)
+        return True
+
+
+class SamplingFilter(logging.Filter):
+    """Пропускает только долю записей уровня INFO и ниже от шумных логгеров.
+
+    rates — {префикс имени логгера: доля от 0 до 1}, действует самый длинный
+    подходящий префикс. Предупреждения и ошибки не сэмплируются.
+    """
+
+    def __init__(self, rates: Dict[str, float]):
+        super().__init__()
+        self.rates = rates
+        self._prefixes = sorted(rates, key=len, reverse=True)
+
+    def _rate(self, name: str) -> Optional[float]:
+        for prefix in self._prefixes:
+            if name == prefix or name.startswith(prefix + "."):
+                return self.rates[prefix]
+        return None
+
+    def filter(self, record: logging.LogRecord) -> bool:
+        if record.levelno > logging.INFO:
+            return True
+        rate = self._rate(record.name)
+        return rate is None or random.random() < rate
+
+
+class JsonFormatter(logging.Formatter):
+    """Одна запись — одна строка JSON."""
+
+    def format(self, record: logging.LogRecord) -> str:
+        entry = {
+            "ts": datetime.fromtimestamp(record.created, timezone.utc).isoformat(timespec="milliseconds"),
+            "level": record.levelname,
+            "logger": record.name,
+            "msg": record.getMessage(),
+        }
+        for name in CONTEXT_FIELDS:
+            value = getattr(record, name, None)
+            if value is not None:
+                entry[name] = value
+        # Дерево спанов медленного апдейта, см. middlewares/tracing.py
+        trace = getattr(record, "trace", None)
+        if trace is not None:
+            entry["trace"] = trace
+        if record.exc_info and not record.exc_text:
+            record.exc_text = self.formatException(record.exc_info)
+        if record.exc_text:
+            entry["exc"] = record.exc_text
+        return json.dumps(entry, ensure_ascii=False, default=str)
+
+
+class NonBlockingQueueHandler(QueueHandler):
+    """QueueHandler, который не ждёт место в очереди, а отбрасывает запись.
+
+    Если фоновый поток не успевает писать, теряются логи, а не задержка
+    обработки апдейтов. Число потерянных записей — в dropped.
+    """
+
+    def __init__(self, log_queue: queue.Queue):
+        super().__init__(log_queue)
+        self.dropped = 0
+
+    def prepare(self, record: logging.LogRecord) -> logging.LogRecord:
+        # Аргументы и исключение превращаем в строки сразу: объекты из
+        # записи могут измениться, пока она ждёт в очереди
+        record = copy.copy(record)
+        record.msg = record.getMessage()
+        record.args = None
+        if record.exc_info:
+            record.exc_text = logging.Formatter().formatException(record.exc_info)
+            record.exc_info = None
+        return record
+
+    def enqueue(self, record: logging.LogRecord):
+        try:
+            self.queue.put_nowait(record)
+        except queue.Full:
+            self.dropped += 1
+
+
+def parse_sampling(value: str) -> Dict[str, float]:
+    """Разбирает строку вида "aiogram.event=0.1,utils.broadcast=0.5"."""
+    rates = {}
+    for item in filter(None, (part.strip() for part in value.split(","))):
+        name, _, rate = item.partition("=")
+        rates[name.strip()] = float(rate)
+    return rates
+
+
+def setup_logging(
+    level: str = "INFO",
+    path: Optional[str] = None,
+    max_bytes: int = 10 * 1024 * 1024,
+    backup_count: int = 5,
+    sampling: Optional[Dict[str, float]] = None,
+    queue_size: int = 10000,
+    logger_files: Optional[Dict[str, str]] = None,
+) -> QueueListener:
+    """Настраивает корневой логгер: запись в очередь, вывод в фоновом потоке.
+
+    Хендлеры на event loop только кладут запись в очередь; форматирование в
+    JSON и запись в stdout и файл с ротацией по размеру делает QueueListener.
+    logger_files — {имя логгера: путь}: записи этих логгеров дополнительно
+    пишутся в отдельный файл (например, медленные апдейты).
+    Возвращает запущенный listener, его нужно остановить при выходе.
+    """
+    def rotating_file(file_path: str) -> RotatingFileHandler:
+        directory = os.path.dirname(file_path)
+        if directory:
+            os.makedirs(directory, exist_ok=True)
+        return RotatingFileHandler(file_path, maxBytes=max_bytes, backupCount=backup_count, encoding="utf-8")
+
+    formatter = JsonFormatter()
+    handlers: List[logging.Handler] = [logging.StreamHandler(sys.stdout)]
+    if path:
+        handlers.append(rotating_file(path))
+    for name, file_path in (logger_files or {}).items():
+        handler = rotating_file(file_path)
+        handler.addFilter(logging.Filter(name))
+        handlers.append(handler)
+    for handler in handlers:
+        handler.setFormatter(formatter)
+
+    queue_handler = NonBlockingQueueHandler(queue.Queue(maxsize=queue_size))
+    # Сначала сэмплирование: отброшенной записи контекст не нужен
+    if sampling:
+        queue_handler.addFilter(SamplingFilter(sampling))
+    queue_handler.addFilter(ContextFilter())
+
+    root = logging.getLogger()
+    for handler in root.handlers[:]:
+        root.removeHandler(handler)
+    root.addHandler(queue_handler)
+    root.setLevel(level.upper())
+
+    listener = QueueListener(queue_handler.queue, *handlers, respect_handler_level=True)
+    listener.start()
+    return listener
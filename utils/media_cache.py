@@ -0,0 +1,106 @@
+import asyncio
+import hashlib
+import logging
+import os
+from typing import Dict, Optional, Tuple, Union
+
+from aiogram.exceptions import TelegramBadRequest
+from aiogram.types import FSInputFile, InputMediaPhoto, Message
+
+from utils.database import Database
+
+logger = logging.getLogger(__name__)
+
+
+def _hash_file(path: str) -> str:
+    digest = hashlib.sha256()
+    with open(path, "rb") as file:
+        for chunk in iter(lambda: file.read(65536), b""):
+            digest.update(chunk)
+    return digest.hexdigest()
+
+
+def _is_file_id_error(error: TelegramBadRequest) -> bool:
+    # «wrong file identifier», «wrong remote file identifier specified» и т.п.
+    return "file" in str(error).lower()
+
+
+class MediaCache:
+    """Кэш file_id для файлов из images/.
+
+    Файл загружается в Telegram один раз, полученный file_id сохраняется в базе
+    по хэшу содержимого и дальше отправляется вместо файла. Изменённая картинка
+    получает новый хэш и загружается заново; если Telegram отверг сохранённый
+    file_id, запись удаляется и файл отправляется обычной загрузкой.
+    """
+
+    def __init__(self, db: Database):
+        self.db = db
+        # Хэш пересчитывается, только если у файла изменились размер или mtime
+        self._hashes: Dict[str, Tuple[int, float, str]] = {}
+        self._file_ids: Dict[Tuple[str, int], str] = {}
+
+    async def content_hash(self, path: str) -> str:
+        stat = os.stat(path)
+        cached = self._hashes.get(path)
+        if cached and cached[0] == stat.st_size and cached[1] == stat.st_mtime:
+            return cached[2]
+
+        content_hash = await asyncio.to_thread(_hash_file, path)
+        self._hashes[path] = (stat.st_size, stat.st_mtime, content_hash)
+        return content_hash
+
+    async def get_file_id(self, path: str, bot_id: int) -> Optional[str]:
+        key = (await self.content_hash(path), bot_id)
+        file_id = self._file_ids.get(key)
+        if file_id is None:
+            file_id = await self.db.get_media_file_id(*key)
+            if file_id:
+                self._file_ids[key] = file_id
+        return file_id
+
+    async def remember(self, path: str, bot_id: int, file_id: str):
+        key = (await self.content_hash(path), bot_id)
+        self._file_ids[key] = file_id
+        await self.db.set_media_file_id(key[0], bot_id, path, file_id)
+
+    async def invalidate(self, path: str, bot_id: int):
+        key = (await self.content_hash(path), bot_id)
+        self._file_ids.pop(key, None)
+        await self.db.delete_media_file_id(*key)
+
+    async def answer_photo(self, message: Message, path: str, **kwargs) -> Message:
+        bot_id = message.bot.id
+        file_id = await self.get_file_id(path, bot_id)
+
+        if file_id:
+            try:
+                return await message.answer_photo(file_id, **kwargs)
+            except TelegramBadRequest as e:
+                if not _is_file_id_error(e):
+                    raise
+                logger.warning("Сохранённый file_id для %s недействителен: %s", path, e)
+                await self.invalidate(path, bot_id)
+
+        sent = await message.answer_photo(FSInputFile(path), **kwargs)
+        if sent.photo:
+            await self.remember(path, bot_id, sent.photo[-1].file_id)
+        return sent
+
+    async def edit_photo(self, message: Message, path: str, caption: Optional[str] = None, **kwargs) -> Union[Message, bool]:
+        bot_id = message.bot.id
+        file_id = await self.get_file_id(path, bot_id)
+
+        if file_id:
+            try:
+                return await message.edit_media(InputMediaPhoto(media=file_id, caption=caption), **kwargs)
+            except TelegramBadRequest as e:
+                if not _is_file_id_error(e):
+                    raise
+                logger.warning("Сохранённый file_id для %s недействителен: %s", path, e)
+                await self.invalidate(path, bot_id)
+
+        edited = await message.edit_media(InputMediaPhoto(media=FSInputFile(path), caption=caption), **kwargs)
+        if isinstance(edited, Message) and edited.photo:
+            await self.remember(path, bot_id, edited.photo[-1].file_id)
+        return edited
@@ -0,0 +1,233 @@
+import logging
+from typing import List, Tuple
+
+import aiosqlite
+
+logger = logging.getLogger(__name__)
+
+# Версия схемы хранится в PRAGMA user_version. Каждая миграция применяется
+# один раз, в собственной транзакции, строго по возрастанию версии.
+# Новые миграции только дописываются в конец списка.
+MIGRATIONS: List[Tuple[int, str, List[str]]] = [
+    (1, "Базовые таблицы", [
+        """
+        CREATE TABLE IF NOT EXISTS users (
+            id INTEGER PRIMARY KEY AUTOINCREMENT,
+            telegram_id TEXT,
+            balance INTEGER DEFAULT 0,
+            referral_telegram_id TEXT
+        )
+        """,
+        """
+        CREATE TABLE IF NOT EXISTS promocodes (
+            id INTEGER PRIMARY KEY AUTOINCREMENT,
+            code TEXT,
+            discount INTEGER DEFAULT 0,
+            amount_money INTEGER DEFAULT 0,
+            max_uses INTEGER,
+            uses INTEGER DEFAULT 0,
+            is_used BOOLEAN DEFAULT 0
+        )
+        """,
+        """
+        CREATE TABLE IF NOT EXISTS orders (
+            id INTEGER PRIMARY KEY AUTOINCREMENT,
+            user_id INTEGER,
+            amount_star INTEGER,
+            amount_ruble INTEGER,
+            status TEXT,
+            created_at DATETIME DEFAULT CURRENT_TIMESTAMP
+        )
+        """,
+    ]),
+    (2, "Уникальные индексы users.telegram_id и promocodes.code, индекс истории заказов", [
+        # Старые базы могли накопить дубликаты пользователей: переносим их заказы
+        # на самую раннюю запись и удаляем остальные. Баланс не суммируем:
+        # update_user_balance обновлял все записи с этим telegram_id, поэтому
+        # в каждом дубликате уже лежит полный баланс — берём максимальный
+        """
+        UPDATE orders SET user_id = (
+            SELECT MIN(keep.id) FROM users AS keep
+            WHERE keep.telegram_id = (SELECT telegram_id FROM users WHERE id = orders.user_id)
+        )
+        WHERE user_id IN (
+            SELECT id FROM users
+            WHERE id NOT IN (SELECT MIN(id) FROM users GROUP BY telegram_id)
+        )
+        """,
+        """
+        UPDATE users SET balance = (
+            SELECT MAX(dup.balance) FROM users AS dup WHERE dup.telegram_id = users.telegram_id
+        )
+        WHERE id IN (
+            SELECT MIN(id) FROM users GROUP BY telegram_id HAVING COUNT(*) > 1
+        )
+        """,
+        "DELETE FROM users WHERE id NOT IN (SELECT MIN(id) FROM users GROUP BY telegram_id)",
+        "DELETE FROM promocodes WHERE id NOT IN (SELECT MIN(id) FROM promocodes GROUP BY code)",
+        "CREATE UNIQUE INDEX IF NOT EXISTS idx_users_telegram_id ON users (telegram_id)",
+        "CREATE UNIQUE INDEX IF NOT EXISTS idx_promocodes_code ON promocodes (code)",
+        "CREATE INDEX IF NOT EXISTS idx_orders_user_created ON orders (user_id, created_at)",
+    ]),
+    (3, "Данные заказа для автоматического подтверждения оплаты Lava", [
+        "ALTER TABLE orders ADD COLUMN target_username TEXT",
+        "ALTER TABLE orders ADD COLUMN payment_method TEXT",
+        "ALTER TABLE orders ADD COLUMN external_id TEXT",
+        "ALTER TABLE orders ADD COLUMN paid_at DATETIME",
+        "CREATE UNIQUE INDEX IF NOT EXISTS idx_orders_external_id ON orders (external_id)",
+    ]),
+    (4, "Хранилище FSM", [
+        """
+        CREATE TABLE IF NOT EXISTS fsm_states (
+            key TEXT PRIMARY KEY,
+            state TEXT,
+            data TEXT,
+            updated_at REAL NOT NULL
+        )
+        """,
+        "CREATE INDEX IF NOT EXISTS idx_fsm_states_updated_at ON fsm_states (updated_at)",
+    ]),
+    (5, "Кэш file_id загруженных медиафайлов", [
+        """
+        CREATE TABLE IF NOT EXISTS media_cache (
+            content_hash TEXT NOT NULL,
+            bot_id INTEGER NOT NULL,
+            path TEXT,
+            file_id TEXT NOT NULL,
+            updated_at DATETIME DEFAULT CURRENT_TIMESTAMP,
+            PRIMARY KEY (content_hash, bot_id)
+        )
+        """,
+    ]),
+    (6, "Уведомления админов о заказах", [
+        """
+        CREATE TABLE IF NOT EXISTS order_notifications (
+            order_id INTEGER NOT NULL,
+            chat_id INTEGER NOT NULL,
+            message_id INTEGER NOT NULL,
+            created_at DATETIME DEFAULT CURRENT_TIMESTAMP,
+            PRIMARY KEY (order_id, chat_id)
+        )
+        """,
+    ]),
+    (7, "Рассылки и отметка пользователей, заблокировавших бота", [
+        "ALTER TABLE users ADD COLUMN is_blocked BOOLEAN DEFAULT 0",
+        """
+        CREATE TABLE IF NOT EXISTS broadcasts (
+            id INTEGER PRIMARY KEY AUTOINCREMENT,
+            text TEXT NOT NULL,
+            status TEXT NOT NULL DEFAULT 'running',
+            last_user_id INTEGER NOT NULL DEFAULT 0,
+            total INTEGER NOT NULL DEFAULT 0,
+            sent INTEGER NOT NULL DEFAULT 0,
+            failed INTEGER NOT NULL DEFAULT 0,
+            blocked INTEGER NOT NULL DEFAULT 0,
+            admin_chat_id INTEGER,
+            progress_message_id INTEGER,
+            created_at DATETIME DEFAULT CURRENT_TIMESTAMP,
+            finished_at DATETIME
+        )
+        """,
+        "CREATE INDEX IF NOT EXISTS idx_broadcasts_status ON broadcasts (status)",
+    ]),
+    (8, "Жизненный цикл заказа и журнал переходов", [
+        """
+        CREATE TABLE IF NOT EXISTS order_events (
+            id INTEGER PRIMARY KEY AUTOINCREMENT,
+            order_id INTEGER NOT NULL,
+            from_status TEXT,
+            to_status TEXT NOT NULL,
+            actor TEXT,
+            created_at DATETIME DEFAULT CURRENT_TIMESTAMP
+        )
+        """,
+        "CREATE INDEX IF NOT EXISTS idx_order_events_order_id ON order_events (order_id)",
+        "UPDATE orders SET status = 'awaiting_payment' WHERE status = 'pending'",
+        "UPDATE orders SET status = 'fulfilled' WHERE status = 'completed'",
+    ]),
+    (9, "Индекс для поиска зависших заказов по статусу и возрасту", [
+        "CREATE INDEX IF NOT EXISTS idx_orders_status_created ON orders (status, created_at)",
+    ]),
+    (10, "Счётчики рефералов", [
+        "CREATE INDEX IF NOT EXISTS idx_users_referral_telegram_id ON users (referral_telegram_id)",
+        """
+        CREATE TABLE IF NOT EXISTS referral_stats (
+            referrer_telegram_id TEXT PRIMARY KEY,
+            referrals_count INTEGER NOT NULL DEFAULT 0,
+            earnings INTEGER NOT NULL DEFAULT 0,
+            updated_at DATETIME DEFAULT CURRENT_TIMESTAMP
+        )
+        """,
+        "CREATE INDEX IF NOT EXISTS idx_referral_stats_count ON referral_stats (referrals_count)",
+        # Считаем только приглашения от существующих пользователей и не самих себя
+        """
+        INSERT OR REPLACE INTO referral_stats (referrer_telegram_id, referrals_count)
+        SELECT users.referral_telegram_id, COUNT(*) FROM users
+        JOIN users AS referrer ON referrer.telegram_id = users.referral_telegram_id
+        WHERE users.referral_telegram_id != users.telegram_id
+        GROUP BY users.referral_telegram_id
+        """,
+    ]),
+    (11, "Активации промокодов", [
+        """
+        CREATE TABLE IF NOT EXISTS promocode_redemptions (
+            id INTEGER PRIMARY KEY AUTOINCREMENT,
+            promocode_id INTEGER NOT NULL,
+            user_id INTEGER NOT NULL,
+            discount INTEGER NOT NULL DEFAULT 0,
+            amount_money INTEGER NOT NULL DEFAULT 0,
+            order_id INTEGER,
+            created_at DATETIME DEFAULT CURRENT_TIMESTAMP,
+            UNIQUE (promocode_id, user_id)
+        )
+        """,
+        "CREATE INDEX IF NOT EXISTS idx_promocode_redemptions_user ON promocode_redemptions (user_id, order_id)",
+    ]),
+    (12, "Настройки (цены и курсы валют)", [
+        """
+        CREATE TABLE IF NOT EXISTS settings (
+            key TEXT PRIMARY KEY,
+            value TEXT NOT NULL,
+            updated_at DATETIME DEFAULT CURRENT_TIMESTAMP
+        )
+        """,
+    ]),
+]
+
+SCHEMA_VERSION = MIGRATIONS[-1][0]
+
+
+async def get_schema_version(connection: aiosqlite.Connection) -> int:
+    async with connection.execute("PRAGMA user_version") as cursor:
+        row = await cursor.fetchone()
+    return row[0] if row else 0
+
+
+async def apply_migrations(connection: aiosqlite.Connection) -> int:
+    current_version = await get_schema_version(connection)
+
+    for version, description, statements in MIGRATIONS:
+        if version <= current_version:
+            continue
+
+        try:
+            await connection.execute("BEGIN IMMEDIATE")
+            # Версию перечитываем под блокировкой записи: другой процесс с тем же
+            # файлом мог применить эту миграцию, пока мы ждали BEGIN IMMEDIATE
+            current_version = await get_schema_version(connection)
+            if version <= current_version:
+                await connection.rollback()
+                continue
+            for statement in statements:
+                await connection.execute(statement)
+            # PRAGMA не принимает параметры, version всегда int из списка выше
+            await connection.execute(f"PRAGMA user_version = {int(version)}")
+            await connection.commit()
+        except Exception as e:
+            await connection.rollback()
+            logger.error("Ошибка миграции базы данных до версии %s (%s): %s", version, description, e)
+            raise
+
+        current_version = version
+
+    return current_version
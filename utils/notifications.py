@@ -0,0 +1,133 @@
+import asyncio
+import logging
+from typing import Iterable, Optional, Set
+
+from aiogram import Bot
+from aiogram.exceptions import TelegramBadRequest, TelegramForbiddenError
+from aiogram.types import InlineKeyboardMarkup, Message
+
+from utils.constants import ADMIN_IDS
+from utils.database import Database
+
+logger = logging.getLogger(__name__)
+
+# Админ заблокировал бота или чат не существует — повторять бессмысленно
+PERMANENT_ERRORS = (TelegramForbiddenError, TelegramBadRequest)
+
+
+class AdminNotifier:
+    """Рассылка уведомлений о заказах всем админам.
+
+    Сообщения отправляются во все чаты одновременно (лимиты соблюдает
+    RateGovernorMiddleware сессии бота). message_id каждой доставленной копии
+    сохраняется в order_notifications, чтобы подтверждение или отклонение
+    заказа обновляло сообщения у всех админов. Неудачные отправки повторяются
+    в фоне с экспоненциальной задержкой.
+    """
+
+    def __init__(
+        self,
+        db: Database,
+        admin_ids: Iterable[int] = ADMIN_IDS,
+        max_retries: int = 5,
+        retry_delay: float = 2.0,
+    ):
+        self.db = db
+        self.admin_ids = list(admin_ids)
+        self.max_retries = max_retries
+        self.retry_delay = retry_delay
+        self._retry_tasks: Set[asyncio.Task] = set()
+
+    async def _send(
+        self,
+        bot: Bot,
+        order_id: int,
+        chat_id: int,
+        text: str,
+        reply_markup: Optional[InlineKeyboardMarkup]
+    ):
+        message = await bot.send_message(chat_id=chat_id, text=text, reply_markup=reply_markup)
+        # Сообщение уже доставлено: ошибка записи не должна приводить к повторной отправке
+        try:
+            await self.db.add_order_notification(order_id, chat_id, message.message_id)
+        except Exception as e:
+            logger.warning("Failed to save notification for order %s, admin %s: %s", order_id, chat_id, e)
+
+    async def notify_order(
+        self,
+        bot: Bot,
+        order_id: int,
+        text: str,
+        reply_markup: Optional[InlineKeyboardMarkup] = None
+    ) -> int:
+        results = await asyncio.gather(
+            *(self._send(bot, order_id, chat_id, text, reply_markup) for chat_id in self.admin_ids),
+            return_exceptions=True
+        )
+
+        delivered = 0
+        for chat_id, result in zip(self.admin_ids, results):
+            if not isinstance(result, Exception):
+                delivered += 1
+                continue
+
+            logger.warning("Failed to notify admin %s about order %s: %s", chat_id, order_id, result)
+            if not isinstance(result, PERMANENT_ERRORS):
+                task = asyncio.create_task(self._retry(bot, order_id, chat_id, text, reply_markup))
+                self._retry_tasks.add(task)
+                task.add_done_callback(self._retry_tasks.discard)
+        return delivered
+
+    async def _retry(
+        self,
+        bot: Bot,
+        order_id: int,
+        chat_id: int,
+        text: str,
+        reply_markup: Optional[InlineKeyboardMarkup]
+    ):
+        for attempt in range(self.max_retries):
+            await asyncio.sleep(self.retry_delay * 2 ** attempt)
+            try:
+                await self._send(bot, order_id, chat_id, text, reply_markup)
+                return
+            except PERMANENT_ERRORS as e:
+                logger.warning("Failed to notify admin %s about order %s: %s", chat_id, order_id, e)
+                return
+            except Exception as e:
+                logger.warning("Retry %d to notify admin %s about order %s failed: %s", attempt + 1, chat_id, order_id, e)
+        logger.error("Gave up notifying admin %s about order %s", chat_id, order_id)
+
+    async def edit_order_messages(
+        self,
+        bot: Bot,
+        order_id: int,
+        text: str,
+        current_message: Optional[Message] = None
+    ) -> int:
+        notifications = list(await self.db.get_order_notifications(order_id))
+        # Сообщение, на котором нажали кнопку, правим всегда — даже если заказ
+        # создан до появления order_notifications
+        if current_message and (current_message.chat.id, current_message.message_id) not in notifications:
+            notifications.append((current_message.chat.id, current_message.message_id))
+        results = await asyncio.gather(
+            *(
+                bot.edit_message_text(chat_id=chat_id, message_id=message_id, text=text, reply_markup=None)
+                for chat_id, message_id in notifications
+            ),
+            return_exceptions=True
+        )
+
+        edited = 0
+        for (chat_id, _), result in zip(notifications, results):
+            if isinstance(result, Exception):
+                logger.warning("Failed to update order %s message for admin %s: %s", order_id, chat_id, result)
+            else:
+                edited += 1
+        return edited
+
+    async def close(self):
+        for task in list(self._retry_tasks):
+            task.cancel()
+        if self._retry_tasks:
+            await asyncio.gather(*self._retry_tasks, return_exceptions=True)
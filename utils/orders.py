@@ -0,0 +1,97 @@
+import asyncio
+from typing import Iterable, Optional, Union
+
+from utils.database import Database
+
+CREATED = "created"
+AWAITING_PAYMENT = "awaiting_payment"
+PAID = "paid"
+FULFILLED = "fulfilled"
+REJECTED = "rejected"
+EXPIRED = "expired"
+
+# Допустимые переходы жизненного цикла заказа. Конечные состояния
+# (fulfilled, rejected, expired) дальше не меняются. Перевод на карту админ
+# подтверждает сразу в fulfilled. Оплаченный через Lava заказ отклонить
+# нельзя: деньги уже получены
+TRANSITIONS = {
+    CREATED: {AWAITING_PAYMENT, REJECTED, EXPIRED},
+    AWAITING_PAYMENT: {PAID, FULFILLED, REJECTED, EXPIRED},
+    PAID: {FULFILLED},
+    FULFILLED: set(),
+    REJECTED: set(),
+    EXPIRED: set(),
+}
+
+
+class InvalidTransition(ValueError):
+    pass
+
+
+def check_transition(from_status: str, to_status: str):
+    if to_status not in TRANSITIONS.get(from_status, ()):
+        raise InvalidTransition(f"Недопустимый переход заказа: {from_status} -> {to_status}")
+
+
+async def transition(
+    db: Database,
+    order_id: int,
+    from_status: Union[str, Iterable[str]],
+    to_status: str,
+    actor: Optional[str] = None,
+    release_discount: bool = False,
+) -> bool:
+    """Переводит заказ в to_status, если он сейчас в одном из from_status.
+
+    Переход — один условный UPDATE ... WHERE status IN (...), поэтому из
+    нескольких одновременных переходов срабатывает ровно один, а остальные
+    получают False. Успешный переход пишется в order_events той же транзакцией.
+    """
+    from_statuses = [from_status] if isinstance(from_status, str) else list(from_status)
+    for status in from_statuses:
+        check_transition(status, to_status)
+
+    return await db.transition_order(
+        order_id, from_statuses, to_status, actor,
+        set_paid_at=to_status in (PAID, FULFILLED), release_discount=release_discount
+    )
+
+
+async def attach_invoice(db: Database, order_id: int) -> bool:
+    # Заказ СБП создаётся в created до счёта в Lava, чтобы external_id был
+    # занят раньше, чем появится счёт. Созданный счёт переводит его в ожидание оплаты
+    return await transition(db, order_id, CREATED, AWAITING_PAYMENT, actor="lava")
+
+
+async def fail_invoice(db: Database, order_id: int) -> bool:
+    # Счёт не создался: закрываем заказ и возвращаем скидку по промокоду
+    return await transition(db, order_id, CREATED, REJECTED, actor="lava", release_discount=True)
+
+
+async def approve(db: Database, order_id: int, actor: Optional[str] = None) -> bool:
+    # Перевод на карту админ подтверждает вручную из awaiting_payment,
+    # заказ СБП к этому моменту уже paid после колбэка Lava
+    return await transition(db, order_id, (AWAITING_PAYMENT, PAID), FULFILLED, actor)
+
+
+async def reject(db: Database, order_id: int, actor: Optional[str] = None) -> bool:
+    return await transition(db, order_id, AWAITING_PAYMENT, REJECTED, actor)
+
+
+async def mark_paid(db: Database, order_id: int, actor: Optional[str] = None) -> bool:
+    return await transition(db, order_id, AWAITING_PAYMENT, PAID, actor)
+
+
+async def expire_stale(db: Database, max_age: int, batch_size: int = 500) -> int:
+    """Переводит в expired заказы, которые дольше max_age секунд ждут оплаты."""
+    expired = 0
+    for status in (CREATED, AWAITING_PAYMENT):
+        check_transition(status, EXPIRED)
+        while True:
+            order_ids = await db.transition_stale_orders(status, EXPIRED, max_age, batch_size, actor="scheduler")
+            expired += len(order_ids)
+            if len(order_ids) < batch_size:
+                break
+            # Между пачками отпускаем writer lock для записей из хендлеров
+            await asyncio.sleep(0)
+    return expired
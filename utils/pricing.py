@@ -0,0 +1,232 @@
+import asyncio
+import json
+import logging
+from abc import ABC, abstractmethod
+from array import array
+from typing import Dict, Iterable, List, Optional, Sequence, Tuple
+
+import aiohttp
+
+from utils.constants import STAR_TO_RUBLE
+from utils.database import Database
+
+logger = logging.getLogger(__name__)
+
+MIN_STARS = 50
+MAX_STARS = 100000
+BASE_CURRENCY = "RUB"
+
+# Знаков после запятой в цене: тенге округляем до целых
+DECIMALS = {"RUB": 2, "KZT": 0}
+
+DEFAULT_TIERS = ((MIN_STARS, STAR_TO_RUBLE),)
+
+TIERS_KEY = "pricing.tiers"
+RATES_KEY = "pricing.rates"
+PINNED_KEY = "pricing.pinned"
+
+Tiers = Sequence[Tuple[int, float]]
+
+
+def validate_tiers(tiers: Iterable[Tuple[int, float]]) -> List[Tuple[int, float]]:
+    """Ступени (от скольких звёзд, цена звезды в RUB) по возрастанию порога.
+
+    Первая ступень обязана начинаться с MIN_STARS, чтобы цена была у любого
+    допустимого количества.
+    """
+    tiers = sorted((int(min_stars), float(price)) for min_stars, price in tiers)
+    if not tiers or tiers[0][0] != MIN_STARS:
+        raise ValueError(f"Первая ступень должна начинаться с {MIN_STARS} звёзд")
+    for (min_stars, price), (next_min, _) in zip(tiers, tiers[1:] + [(MAX_STARS + 1, 0)]):
+        if price <= 0:
+            raise ValueError("Цена звезды должна быть больше нуля")
+        if min_stars >= next_min or min_stars > MAX_STARS:
+            raise ValueError(f"Пороги ступеней должны быть разными и не больше {MAX_STARS}")
+    return tiers
+
+
+def parse_tiers(value: str) -> List[Tuple[int, float]]:
+    """Разбирает строку вида "50:1.75 1000:1.7 5000:1.65"."""
+    tiers = []
+    for item in value.replace(",", " ").split():
+        min_stars, _, price = item.partition(":")
+        tiers.append((int(min_stars), float(price)))
+    return validate_tiers(tiers)
+
+
+def round_price(price: float, currency: str) -> float:
+    digits = DECIMALS.get(currency, 2)
+    return int(round(price)) if digits == 0 else round(price, digits)
+
+
+def apply_discount(price: float, percent: int, currency: str = BASE_CURRENCY) -> float:
+    return round_price(price * (100 - percent) / 100, currency)
+
+
+class PriceTable:
+    """Цены для каждого допустимого количества звёзд во всех валютах.
+
+    Таблица считается целиком при создании и дальше не меняется: котировка —
+    это индекс в массиве, а PricingEngine подменяет таблицу целиком.
+    """
+
+    def __init__(self, tiers: Tiers, rates: Dict[str, float]):
+        self.tiers = list(tiers)
+        self.rates = dict(rates)
+        self.prices: Dict[str, array] = {}
+
+        per_star = self._per_star_prices()
+        for currency, rate in [(BASE_CURRENCY, 1.0)] + sorted(self.rates.items()):
+            self.prices[currency] = array("d", (
+                round_price(stars * price * rate, currency)
+                for stars, price in zip(range(MIN_STARS, MAX_STARS + 1), per_star)
+            ))
+
+    def _per_star_prices(self) -> List[float]:
+        # Ступени отсортированы, поэтому проходим диапазон один раз
+        prices = []
+        index = 0
+        for stars in range(MIN_STARS, MAX_STARS + 1):
+            while index + 1 < len(self.tiers) and stars >= self.tiers[index + 1][0]:
+                index += 1
+            prices.append(self.tiers[index][1])
+        return prices
+
+    def quote(self, stars: int, currency: str = BASE_CURRENCY) -> float:
+        return round_price(self.prices[currency][stars - MIN_STARS], currency)
+
+
+class RateSource(ABC):
+    """Источник курсов: сколько единиц валюты стоит 1 RUB."""
+
+    @abstractmethod
+    async def fetch(self, currencies: Iterable[str]) -> Dict[str, float]:
+        ...
+
+
+class StaticRateSource(RateSource):
+    def __init__(self, rates: Dict[str, float]):
+        self.rates = rates
+
+    async def fetch(self, currencies: Iterable[str]) -> Dict[str, float]:
+        return {currency: self.rates[currency] for currency in currencies if currency in self.rates}
+
+
+class CbrRateSource(RateSource):
+    """Официальные курсы ЦБ РФ из ежедневного JSON cbr-xml-daily.ru."""
+
+    def __init__(self, url: str = "https://www.cbr-xml-daily.ru/daily_json.js", timeout: float = 10.0):
+        self.url = url
+        self.timeout = aiohttp.ClientTimeout(total=timeout)
+
+    async def fetch(self, currencies: Iterable[str]) -> Dict[str, float]:
+        async with aiohttp.ClientSession(timeout=self.timeout) as session:
+            async with session.get(self.url) as response:
+                response.raise_for_status()
+                data = await response.json(content_type=None)
+
+        rates = {}
+        for currency in currencies:
+            valute = data.get("Valute", {}).get(currency)
+            if valute:
+                # Value рублей стоят Nominal единиц валюты
+                rates[currency] = valute["Nominal"] / valute["Value"]
+        return rates
+
+
+class PricingEngine:
+    """Цены на звёзды: ступени по объёму и курсы валют.
+
+    Курсы из source обновляются фоновой задачей, админ может закрепить курс
+    вручную — закреплённый курс обновление не трогает. Ступени, полученные и
+    закреплённые курсы хранятся в таблице settings и переживают рестарт.
+    Любое изменение пересчитывает PriceTable в отдельном потоке и подменяет
+    её одной операцией присваивания, поэтому quote() никогда не видит
+    наполовину обновлённые цены.
+    """
+
+    def __init__(
+        self,
+        db: Database,
+        source: Optional[RateSource] = None,
+        currencies: Sequence[str] = ("KZT",),
+        tiers: Tiers = DEFAULT_TIERS,
+    ):
+        self.db = db
+        self.source = source
+        self.currencies = tuple(currencies)
+        self.tiers = validate_tiers(tiers)
+        self.fetched_rates: Dict[str, float] = {}
+        self.pinned_rates: Dict[str, float] = {}
+        self._table = PriceTable(self.tiers, {})
+        self._lock = asyncio.Lock()
+
+    @property
+    def table(self) -> PriceTable:
+        return self._table
+
+    def quote(self, stars: int, currency: str = BASE_CURRENCY) -> float:
+        if not MIN_STARS <= stars <= MAX_STARS:
+            raise ValueError(f"Количество звёзд должно быть от {MIN_STARS} до {MAX_STARS}")
+        return self._table.quote(stars, currency)
+
+    def quotes(self, stars: int) -> Dict[str, float]:
+        """Цена во всех валютах, для которых известен курс."""
+        table = self._table
+        if not MIN_STARS <= stars <= MAX_STARS:
+            raise ValueError(f"Количество звёзд должно быть от {MIN_STARS} до {MAX_STARS}")
+        return {currency: table.quote(stars, currency) for currency in table.prices}
+
+    async def _rebuild(self):
+        async with self._lock:
+            rates = {**self.fetched_rates, **self.pinned_rates}
+            self._table = await asyncio.to_thread(PriceTable, self.tiers, rates)
+
+    async def load(self):
+        settings = await self.db.get_settings("pricing.")
+        try:
+            if TIERS_KEY in settings:
+                self.tiers = validate_tiers(json.loads(settings[TIERS_KEY]))
+            self.fetched_rates = json.loads(settings.get(RATES_KEY, "{}"))
+            self.pinned_rates = json.loads(settings.get(PINNED_KEY, "{}"))
+        except ValueError as e:
+            logger.error("Invalid pricing settings, using defaults: %s", e)
+        await self._rebuild()
+
+    async def refresh_rates(self) -> Dict[str, float]:
+        if self.source is None:
+            return {}
+        pending = [currency for currency in self.currencies if currency not in self.pinned_rates]
+        if not pending:
+            return {}
+
+        rates = await self.source.fetch(pending)
+        rates = {currency: rate for currency, rate in rates.items() if currency in pending and rate > 0}
+        if rates:
+            fetched_rates = {**self.fetched_rates, **rates}
+            await self.db.set_setting(RATES_KEY, json.dumps(fetched_rates))
+            self.fetched_rates = fetched_rates
+            await self._rebuild()
+        return rates
+
+    async def set_tiers(self, tiers: Iterable[Tuple[int, float]]):
+        # Память меняем только после успешной записи в базу
+        tiers = validate_tiers(tiers)
+        await self.db.set_setting(TIERS_KEY, json.dumps(tiers))
+        self.tiers = tiers
+        await self._rebuild()
+
+    async def set_rate(self, currency: str, rate: Optional[float]):
+        """Закрепляет курс валюты; None возвращает курс из источника."""
+        if currency not in self.currencies:
+            raise ValueError(f"Валюта {currency} не поддерживается")
+        pinned_rates = dict(self.pinned_rates)
+        if rate is None:
+            pinned_rates.pop(currency, None)
+        elif rate > 0:
+            pinned_rates[currency] = rate
+        else:
+            raise ValueError("Курс должен быть больше нуля")
+        await self.db.set_setting(PINNED_KEY, json.dumps(pinned_rates))
+        self.pinned_rates = pinned_rates
+        await self._rebuild()
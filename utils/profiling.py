@@ -0,0 +1,95 @@
+import asyncio
+import cProfile
+import html
+import io
+import logging
+import os
+import pstats
+from datetime import datetime
+from typing import Optional, Tuple
+
+from aiogram import Bot
+
+logger = logging.getLogger(__name__)
+
+
+class Profiler:
+    """Профилирование event loop по команде админа.
+
+    cProfile включается на seconds секунд в потоке event loop, поэтому в отчёт
+    попадают все апдейты и фоновые задачи за это время. Запросы к SQLite
+    выполняются в потоках aiosqlite и видны только как ожидание. Одновременно
+    идёт не больше одного профилирования. Отчёт пишется в directory: .prof для
+    snakeviz/pstats и .txt с топом функций по cumulative time.
+    """
+
+    def __init__(self, directory: str = "data/profiles", max_seconds: int = 300, top: int = 40):
+        self.directory = directory
+        self.max_seconds = max_seconds
+        self.top = top
+        self._task: Optional[asyncio.Task] = None
+
+    @property
+    def running(self) -> bool:
+        return self._task is not None and not self._task.done()
+
+    def start(self, bot: Bot, seconds: int, chat_id: int) -> bool:
+        """Запускает профилирование в фоне и присылает отчёт в chat_id."""
+        if self.running:
+            return False
+        self._task = asyncio.create_task(self._run(bot, seconds, chat_id))
+        return True
+
+    async def _run(self, bot: Bot, seconds: int, chat_id: int):
+        try:
+            prof_path, summary = await self.profile(seconds)
+        except asyncio.CancelledError:
+            raise
+        except Exception as e:
+            logger.exception("Profiling failed")
+            await bot.send_message(chat_id=chat_id, text=f"❌ Профилирование не удалось: {e}")
+            return
+
+        await bot.send_message(
+            chat_id=chat_id,
+            text=f"📊 Профиль за {seconds} с сохранён:\n<code>{prof_path}</code>\n\n<pre>{summary}</pre>"
+        )
+
+    async def profile(self, seconds: int) -> Tuple[str, str]:
+        profile = cProfile.Profile()
+        profile.enable()
+        try:
+            await asyncio.sleep(seconds)
+        finally:
+            profile.disable()
+
+        # Запись на диск и форматирование — в отдельном потоке, не на event loop
+        return await asyncio.to_thread(self._save, profile)
+
+    def _save(self, profile: cProfile.Profile) -> Tuple[str, str]:
+        os.makedirs(self.directory, exist_ok=True)
+        base = os.path.join(self.directory, f"profile-{datetime.now():%Y%m%d-%H%M%S}")
+        profile.dump_stats(f"{base}.prof")
+
+        report = io.StringIO()
+        pstats.Stats(profile, stream=report).sort_stats("cumulative").print_stats(self.top)
+        with open(f"{base}.txt", "w", encoding="utf-8") as file:
+            file.write(report.getvalue())
+
+        logger.info("Profile saved to %s.prof", base)
+        return f"{base}.prof", self._summary(pstats.Stats(profile))
+
+    @staticmethod
+    def _summary(stats: pstats.Stats, limit: int = 10) -> str:
+        # Топ функций по собственному времени, коротко для сообщения в Telegram
+        rows = sorted(stats.stats.items(), key=lambda item: item[1][2], reverse=True)[:limit]
+        lines = [
+            f"{own * 1000:8.1f} ms {calls:>7} {os.path.basename(filename)}:{line}({function})"
+            for (filename, line, function), (_, calls, own, _, _) in rows
+        ]
+        return html.escape("\n".join(lines))
+
+    async def close(self):
+        if self._task is not None and not self._task.done():
+            self._task.cancel()
+            await asyncio.gather(self._task, return_exceptions=True)
@@ -0,0 +1,95 @@
+import asyncio
+from typing import Dict, Optional, Tuple
+
+import aiosqlite
+
+from utils.cache import TTLCache
+from utils.database import Database
+
+REDEEMED = "redeemed"
+NOT_FOUND = "not_found"
+SOLD_OUT = "sold_out"
+ALREADY_REDEEMED = "already_redeemed"
+
+# Отсутствие промокода тоже кэшируем, чтобы перебор кодов не ходил в базу
+_UNKNOWN = False
+
+
+def normalize_code(code: str) -> str:
+    return code.strip()
+
+
+def is_active(promocode: Dict) -> bool:
+    if promocode['is_used']:
+        return False
+    return promocode['max_uses'] is None or promocode['uses'] < promocode['max_uses']
+
+
+class PromocodeService:
+    """Активация промокодов с кэшем горячих кодов.
+
+    Промокоды читаются из базы не чаще раза в ttl секунд, поэтому всплеск
+    активаций популярного кода упирается только в саму запись активации.
+    Кэш может отставать от базы, но лимит и повторная активация проверяются
+    в транзакции Database.redeem_promocode.
+    """
+
+    def __init__(self, db: Database, cache_size: int = 1000, ttl: float = 60.0, unknown_ttl: float = 10.0):
+        self.db = db
+        self.unknown_ttl = unknown_ttl
+        self._cache = TTLCache(max_size=cache_size, ttl=ttl)
+        self._loading: Dict[str, asyncio.Future] = {}
+
+    async def get(self, code: str) -> Optional[Dict]:
+        code = normalize_code(code)
+        cached = self._cache.get(code)
+        if cached is not None:
+            return cached or None
+
+        # Одновременные промахи по одному коду ждут один общий запрос к базе
+        loading = self._loading.get(code)
+        if loading is not None:
+            return await asyncio.shield(loading)
+
+        loading = asyncio.get_running_loop().create_future()
+        self._loading[code] = loading
+        try:
+            promocode = await self.db.get_promocode(code)
+        except Exception as e:
+            loading.set_exception(e)
+            raise
+        finally:
+            del self._loading[code]
+
+        if promocode:
+            self._cache.set(code, promocode)
+        else:
+            self._cache.set(code, _UNKNOWN, ttl=self.unknown_ttl)
+        loading.set_result(promocode)
+        return promocode
+
+    async def redeem(self, code: str, user: Dict) -> Tuple[str, Optional[Dict]]:
+        promocode = await self.get(code)
+        if not promocode:
+            return NOT_FOUND, None
+        if not is_active(promocode):
+            return SOLD_OUT, promocode
+
+        try:
+            redeemed = await self.db.redeem_promocode(promocode, user)
+        except aiosqlite.IntegrityError:
+            return ALREADY_REDEEMED, promocode
+
+        if not redeemed:
+            # Активации закончились: больше не пускаем запросы к базе по этому коду
+            promocode['is_used'] = 1
+            return SOLD_OUT, promocode
+
+        promocode['uses'] += 1
+        return REDEEMED, promocode
+
+    async def create(self, code: str, discount: int, amount_money: int, max_uses: Optional[int]) -> Dict:
+        code = normalize_code(code)
+        promocode = await self.db.create_promocode(code, discount, amount_money, max_uses)
+        self._cache.pop(code)
+        return promocode
@@ -0,0 +1,93 @@
+import asyncio
+import logging
+import time
+from typing import Awaitable, Callable, Dict, Optional
+
+logger = logging.getLogger(__name__)
+
+
+class Job:
+    def __init__(self, name: str, func: Callable[[], Awaitable], interval: float, first_delay: float):
+        self.name = name
+        self.func = func
+        self.interval = interval
+        self.first_delay = first_delay
+        self.last_run: Optional[float] = None
+        self.last_duration: Optional[float] = None
+        self.last_result = None
+        self.failures = 0
+
+
+class Scheduler:
+    """Периодические фоновые задачи внутри процесса бота.
+
+    У каждой задачи свой цикл: следующий запуск отсчитывается после окончания
+    предыдущего, поэтому задача никогда не пересекается сама с собой. При
+    остановке ожидание прерывается сразу, а выполняющемуся запуску даётся
+    shutdown_timeout секунд на завершение.
+    """
+
+    def __init__(self, shutdown_timeout: float = 10.0):
+        self.shutdown_timeout = shutdown_timeout
+        self.jobs: Dict[str, Job] = {}
+        self._tasks: Dict[str, asyncio.Task] = {}
+        self._stopping: Optional[asyncio.Event] = None
+
+    def add_job(
+        self,
+        name: str,
+        func: Callable[[], Awaitable],
+        interval: float,
+        first_delay: Optional[float] = None
+    ):
+        if name in self.jobs:
+            raise ValueError(f"Задача {name} уже добавлена")
+        self.jobs[name] = Job(name, func, interval, interval if first_delay is None else first_delay)
+
+    def start(self):
+        if self._stopping is None or self._stopping.is_set():
+            self._stopping = asyncio.Event()
+        for name, job in self.jobs.items():
+            if name not in self._tasks:
+                self._tasks[name] = asyncio.create_task(self._loop(job, self._stopping), name=f"job:{name}")
+
+    async def _wait(self, stopping: asyncio.Event, delay: float) -> bool:
+        try:
+            await asyncio.wait_for(stopping.wait(), timeout=delay)
+            return True
+        except asyncio.TimeoutError:
+            return False
+
+    async def _loop(self, job: Job, stopping: asyncio.Event):
+        delay = job.first_delay
+        while not await self._wait(stopping, delay):
+            await self.run_job(job)
+            delay = job.interval
+
+    async def run_job(self, job: Job):
+        started = time.monotonic()
+        try:
+            job.last_result = await job.func()
+        except asyncio.CancelledError:
+            raise
+        except Exception:
+            job.failures += 1
+            logger.exception("Error in scheduled job %s", job.name)
+        finally:
+            job.last_run = time.time()
+            job.last_duration = time.monotonic() - started
+
+    async def close(self):
+        if self._stopping is not None:
+            self._stopping.set()
+        tasks = list(self._tasks.values())
+        self._tasks.clear()
+        if not tasks:
+            return
+
+        _, pending = await asyncio.wait(tasks, timeout=self.shutdown_timeout)
+        for task in pending:
+            logger.warning("Scheduled job %s did not finish in %ss, cancelling", task.get_name(), self.shutdown_timeout)
+            task.cancel()
+        if pending:
+            await asyncio.gather(*pending, return_exceptions=True)
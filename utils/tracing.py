@@ -0,0 +1,121 @@
+import time
+from contextlib import contextmanager
+from contextvars import ContextVar
+from typing import Dict, Iterator, List, Optional
+
+# Ограничение на число дочерних спанов: апдейт с тысячей запросов к базе
+# не должен раздувать память и строку в логе медленных апдейтов
+MAX_CHILDREN = 500
+
+_current_span: ContextVar[Optional["Span"]] = ContextVar("current_span", default=None)
+
+
+class Span:
+    def __init__(self, name: str, attrs: Optional[Dict] = None, started: Optional[float] = None):
+        self.name = name
+        self.attrs = attrs or {}
+        self.started = time.perf_counter() if started is None else started
+        self.duration: Optional[float] = None
+        self.error: Optional[str] = None
+        self.children: List["Span"] = []
+        self.dropped = 0
+
+    @property
+    def finished(self) -> bool:
+        return self.duration is not None
+
+    def finish(self, error: Optional[BaseException] = None):
+        if self.finished:
+            return
+        self.duration = time.perf_counter() - self.started
+        if error is not None:
+            self.error = type(error).__name__
+
+    def add_child(self, span: "Span") -> bool:
+        # Фоновые задачи, запущенные из хендлера (рассылка, повторы
+        # уведомлений), наследуют контекст и переживают апдейт — их не пишем
+        if self.finished:
+            return False
+        if len(self.children) >= MAX_CHILDREN:
+            self.dropped += 1
+            return False
+        self.children.append(span)
+        return True
+
+    def to_dict(self, origin: Optional[float] = None) -> Dict:
+        origin = self.started if origin is None else origin
+        data = {
+            "name": self.name,
+            "start_ms": round((self.started - origin) * 1000, 2),
+            "duration_ms": round((self.duration or 0.0) * 1000, 2),
+        }
+        if self.attrs:
+            data["attrs"] = self.attrs
+        if self.error:
+            data["error"] = self.error
+        if self.children:
+            data["children"] = [child.to_dict(origin) for child in self.children]
+        if self.dropped:
+            data["dropped"] = self.dropped
+        return data
+
+
+@contextmanager
+def start_trace(name: str, **attrs) -> Iterator[Span]:
+    """Корневой спан: всё, что выполняется внутри, пишется в его дерево."""
+    root = Span(name, attrs)
+    token = _current_span.set(root)
+    try:
+        yield root
+    except BaseException as e:
+        root.finish(e)
+        raise
+    else:
+        root.finish()
+    finally:
+        _current_span.reset(token)
+
+
+@contextmanager
+def span(name: str, **attrs) -> Iterator[Optional[Span]]:
+    """Дочерний спан текущего. Вне трассировки ничего не делает."""
+    parent = _current_span.get()
+    if parent is None:
+        yield None
+        return
+
+    child = Span(name, attrs)
+    if not parent.add_child(child):
+        yield None
+        return
+
+    token = _current_span.set(child)
+    try:
+        yield child
+    except BaseException as e:
+        child.finish(e)
+        raise
+    else:
+        child.finish()
+    finally:
+        _current_span.reset(token)
+
+
+def record_span(name: str, duration: float, error: Optional[BaseException] = None, **attrs):
+    """Добавляет уже завершившийся спан: для хуков, которые знают только длительность."""
+    parent = _current_span.get()
+    if parent is None:
+        return
+    child = Span(name, attrs, started=time.perf_counter() - duration)
+    child.duration = duration
+    if error is not None:
+        child.error = type(error).__name__
+    parent.add_child(child)
+
+
+def observe_db_query(name: str, duration: float, write: bool, error: Optional[Exception]):
+    record_span(f"db.{name}", duration, error, mode="write" if write else "read")
+
+
+def observe_lava_request(path: str, status: str, duration: float):
+    record_span(f"lava.{path}", duration, status=status)
@@ -0,0 +1,28 @@
+import asyncio
+import logging
+
+from aiogram.webhook.aiohttp_server import SimpleRequestHandler
+
+logger = logging.getLogger(__name__)
+
+
+class DrainingRequestHandler(SimpleRequestHandler):
+    """Обработчик вебхука Telegram с плавной остановкой.
+
+    Апдейты обрабатываются в фоне, поэтому при остановке сервера сначала
+    дожидаемся уже запущенных хендлеров (не дольше drain_timeout секунд)
+    и только потом закрываем сессию бота.
+    """
+
+    def __init__(self, *args, drain_timeout: float = 30.0, **kwargs):
+        super().__init__(*args, **kwargs)
+        self.drain_timeout = drain_timeout
+
+    async def close(self) -> None:
+        pending = set(self._background_feed_update_tasks)
+        if pending:
+            logger.info("Ожидаем завершения %d апдейтов перед остановкой...", len(pending))
+            _, still_running = await asyncio.wait(pending, timeout=self.drain_timeout)
+            for task in still_running:
+                task.cancel()
+        await super().close()